@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+from ..core.compile_cache import compile_cache_stats
+from ..core.cpp_accel import accel_stats
+from ..core.verdict_cache import verdict_cache_stats
+from ..core.security import *
+
+
+judge_router = APIRouter(prefix="/api/judge")
+
+
+@judge_router.get("/stats")
+async def get_judge_stats(
+    _ = Depends(check_admin_and_get_user)
+):
+    return {
+        "code": 200,
+        "msg": "success",
+        "data": {
+            "compile_cache": compile_cache_stats,
+            "cpp_accel": accel_stats,
+            "verdict_cache": verdict_cache_stats
+        }
+    }
@@ -4,18 +4,32 @@ from ..core.errors import HTTPException, RequestValidationError
 from ..db.database import ASession
 from sqlmodel import select
 from ..core.security import *
+from ..core.languages import language_registry
 
 languages_router = APIRouter(prefix="/api/languages")
 
 @languages_router.post("/")
 async def register_language(
-    language: LanguageItem, 
+    language_data: LanguageCreate, 
     session: ASession,
-    _ = Depends(check_login_and_get_user)
+    # Registered commands are run by the judge, and may replace built-in languages
+    _ = Depends(check_admin_and_get_user)
 ):
     try:
-        session.add(language)
+        language = LanguageItem(
+            name=language_data.name,
+            file_ext=language_data.file_ext,
+            complie_cmd=language_data.compile_cmd,
+            run_cmd=language_data.run_cmd,
+            time_limit=language_data.time_limit,
+            memory_limit=language_data.memory_limit,
+            time_factor=language_data.time_factor,
+            memory_factor=language_data.memory_factor
+        )
+        # Registering a name again replaces its definition
+        await session.merge(language)
         await session.commit()
+        language_registry.invalidate()
         return {
             "code": 200,
             "msg": "language registered",
@@ -23,7 +23,13 @@ async def get_access_logs(
             detail=f"Params error."
         )  
         
-    if params.page is None and params.page_size is not None:
+    # A cursor pages by key, not by offset
+    if params.cursor is not None and params.page is not None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Params error."
+        )
+    if params.cursor is None and params.page is None and params.page_size is not None:
         params.page = 1
     elif params.page is not None and params.page_size is None:
         raise HTTPException(
@@ -31,7 +37,17 @@ async def get_access_logs(
             detail=f"Params error."
         )   
     
-    access_list = await crud.get_log_access_list(params, session)
+    access_list, next_cursor = await crud.get_log_access_list(params, session)
+    # Without a cursor, data stays the plain list it has always been
+    if params.cursor is not None:
+        return {
+            "code": 200,
+            "msg": "success",
+            "data": {
+                "logs": access_list,
+                "next_cursor": next_cursor
+            }
+        }
     return {
         "code": 200,
         "msg": "success",
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Body
-from ..db.schemas import ProblemItem, LogVisibility, LogVisibilityUpdate
+from ..db.schemas import ProblemItem, ProblemCreate, LogVisibility, LogVisibilityUpdate, JudgeConfigUpdate, ProblemTestcasesUpdate
 from ..core.errors import HTTPException
 from ..db import crud
+from ..core.evaluation import checker_compile_error
 from ..db.database import ASession
 from ..core.security import *
 
@@ -27,10 +28,11 @@ async def get_problem_list(
 
 @problems_router.post("/")
 async def add_problem(
-    problemitem: ProblemItem, 
+    problem_data: ProblemCreate, 
     session: ASession,
     _ = Depends(check_login_and_get_user)
 ):   
+    problemitem = ProblemItem(**problem_data.model_dump())
     if await crud.problem_exists(problemitem.id, session=session):
         raise HTTPException(
             status_code=409,
@@ -140,4 +142,86 @@ async def set_log_visibility(
         raise HTTPException(
             status_code=404,
             detail="Problem does not exist."
-        )
\ No newline at end of file
+        )
+        
+        
+@problems_router.put("/{problem_id}/testcases")
+async def set_testcases(
+    problem_id: str,
+    session: ASession,
+    testcases_data: ProblemTestcasesUpdate,
+    _ = Depends(check_admin_and_get_user)
+):
+    if not await crud.problem_exists(problem_id, session=session):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Problem with ID {problem_id} not found"
+        )
+    try:
+        testcases = await crud.update_testcases(problem_id, testcases_data.testcases, session)
+        return {
+            "code": 200,
+            "msg": "testcases updated",
+            "data": {
+                "id": problem_id,
+                "testcases": len(testcases)
+            }
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Server Error: {e}"  
+        )
+        
+        
+@problems_router.get("/{problem_id}/judge_config")
+async def get_judge_config(
+    problem_id: str,
+    session: ASession,
+    _ = Depends(check_admin_and_get_user)
+):
+    if not await crud.problem_exists(problem_id, session=session):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Problem with ID {problem_id} not found"
+        )
+    judge_config = await crud.get_judge_config(problem_id, session)
+    return {
+        "code": 200,
+        "msg": "success",
+        "data": judge_config.model_dump()
+    }
+
+
+@problems_router.put("/{problem_id}/judge_config")
+async def set_judge_config(
+    problem_id: str,
+    session: ASession,
+    judge_config_data: JudgeConfigUpdate,
+    _ = Depends(check_admin_and_get_user)
+):
+    if not await crud.problem_exists(problem_id, session=session):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Problem with ID {problem_id} not found"
+        )
+    # Reject a checker that does not compile
+    if judge_config_data.checker:
+        checker_error = await checker_compile_error(judge_config_data.checker)
+        if checker_error is not None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Checker compile error: {checker_error}"
+            )
+    try:
+        judge_config = await crud.update_judge_config(problem_id, judge_config_data, session)
+        return {
+            "code": 200,
+            "msg": "judge config updated",
+            "data": judge_config.model_dump()
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Server Error: {e}"  
+        )
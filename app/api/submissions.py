@@ -94,7 +94,13 @@ async def get_result_list(
             status_code=400,
             detail="Params error."
         )
-    if params.page is None and params.page_size is not None:
+    # A cursor pages by key, not by offset
+    if params.cursor is not None and params.page is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Params error."
+        )
+    if params.cursor is None and params.page is None and params.page_size is not None:
         params.page = 1
     elif params.page is not None and params.page_size is None:
         raise HTTPException(
@@ -105,16 +111,19 @@ async def get_result_list(
     # Admin can view all submissions
     if user.role == "admin":
         try:
-            submissionlist = await crud.get_submission_list(params, session)
+            submissionlist, next_cursor = await crud.get_submission_list(params, session)
             total = await crud.get_submission_counts(params, session)
             return {
                 "code": 200,
                 "msg": "success",
                 "data": {
                     "total": total,
-                    "submissions": submissionlist
+                    "submissions": submissionlist,
+                    "next_cursor": next_cursor
                 }
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -132,16 +141,19 @@ async def get_result_list(
             )
         
         try:
-            submissionlist = await crud.get_submission_list(params, session)
+            submissionlist, next_cursor = await crud.get_submission_list(params, session)
             total = await crud.get_submission_counts(params, session)
             return {
                 "code": 200,
                 "msg": "success",
                 "data": {
                     "total": total,
-                    "submissions": submissionlist
+                    "submissions": submissionlist,
+                    "next_cursor": next_cursor
                 }
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -153,6 +165,7 @@ async def get_result_list(
 async def rejudge(
     submission_id: str, 
     session: ASession, 
+    full: bool = False,
     _ = Depends(check_admin_and_get_user)
 ): 
     if not await crud.submission_exists(submission_id, session):
@@ -162,7 +175,7 @@ async def rejudge(
         )
     
     try:
-        await crud.submission_rejudge(submission_id, session)
+        await crud.submission_rejudge(submission_id, session, full)
         return{
             "code": 200,
             "msg": "rejudge started",
@@ -179,6 +192,46 @@ async def rejudge(
         )
 
 
+@submissions_router.post("/rejudge")
+async def bulk_rejudge(
+    params: BulkRejudgeRequest,
+    session: ASession,
+    _ = Depends(check_admin_and_get_user)
+):
+    try:
+        job = await crud.bulk_rejudge(params, session)
+        return {
+            "code": 200,
+            "msg": "rejudge started",
+            "data": job
+        }
+    except Exception as e:
+        print(f"Server Error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Server Error: {e}"
+        )
+        
+        
+@submissions_router.get("/rejudge/{job_id}")
+async def get_rejudge_progress(
+    job_id: str,
+    session: ASession,
+    _ = Depends(check_admin_and_get_user)
+):
+    progress = await crud.get_rejudge_progress(job_id, session)
+    if progress is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Rejudge job not found"
+        )
+    return {
+        "code": 200,
+        "msg": "success",
+        "data": progress
+    }
+
+
 # ========== Submission logs ========== #
 
 @submissions_router.get("/{submission_id}/log")
@@ -144,7 +144,13 @@ async def get_user_list(
     params: UserListQuery = Depends(),
     _ = Depends(check_admin_and_get_user)
 ):
-    if params.page is None and params.page_size is not None:
+    # A cursor pages by key, not by offset
+    if params.cursor is not None and params.page is not None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Params error."
+        )
+    if params.cursor is None and params.page is None and params.page_size is not None:
         params.page = 1
     elif params.page is not None and params.page_size is None:
         raise HTTPException(
@@ -153,17 +159,20 @@ async def get_user_list(
         )  
     
     try:
-        user_list = await crud.get_user_list_page(params, session)
+        user_list, next_cursor = await crud.get_user_list_page(params, session)
         total = await crud.get_user_counts(session)
         return {
             "code": 200,
             "msg": "success",
             "data": {
                 "total": total,
-                "users": user_list
+                "users": user_list,
+                "next_cursor": next_cursor
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Fail to get user list: {e}")
         raise HTTPException(
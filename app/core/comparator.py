@@ -0,0 +1,82 @@
+from typing import Optional
+import mmap
+import os
+
+
+# Ignored at both ends of output when comparing (like bytes.strip)
+OUTPUT_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class OutputComparator:
+    """
+    Compare output fed in chunks with an expected output file, ignoring whitespace
+    at both ends. Same result as `actual.strip() == expected.strip()`, but the
+    output is never kept in memory and the expected output is memory-mapped.
+
+    Whatever is left of the output after its leading whitespace must be the
+    expected output byte by byte, followed by whitespace only, so a mismatch is
+    known as soon as the chunk containing it is fed.
+    """
+    def __init__(self, expected_path: str):
+        self._file = open(expected_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # Empty files can't be mapped
+        self._mmap: Optional[mmap.mmap] = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        )
+        self._view = memoryview(self._mmap if self._mmap is not None else b"")
+
+        start, end = 0, size
+        while start < end and self._view[start] in OUTPUT_WHITESPACE:
+            start += 1
+        while end > start and self._view[end - 1] in OUTPUT_WHITESPACE:
+            end -= 1
+        self._expected = self._view[start:end]
+        # Bytes of expected output matched so far
+        self._matched = 0
+        self._started = False
+        self.mismatch = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Compare next chunk of output. Return False once output can no longer match.
+        """
+        if self.mismatch:
+            return False
+        if not self._started:
+            chunk = chunk.lstrip(OUTPUT_WHITESPACE)
+            if not chunk:
+                return True
+            self._started = True
+
+        remaining = len(self._expected) - self._matched
+        head = chunk[:remaining]
+        if self._expected[self._matched:self._matched + len(head)] != head:
+            self.mismatch = True
+            return False
+        self._matched += len(head)
+
+        # Past the end of expected output only whitespace is allowed
+        if len(chunk) > remaining and chunk[remaining:].strip(OUTPUT_WHITESPACE):
+            self.mismatch = True
+            return False
+        return True
+
+    def finish(self) -> bool:
+        """
+        Whether all output fed matches the expected output.
+        """
+        return not self.mismatch and self._matched == len(self._expected)
+
+    def close(self):
+        self._expected.release()
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
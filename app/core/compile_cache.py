@@ -0,0 +1,223 @@
+import asyncio
+from subprocess import PIPE
+from typing import List, Dict, Tuple, Optional
+import hashlib
+import errno
+import json
+import os
+import shutil
+import signal
+import time
+import uuid
+from . import cpp_accel
+from config.settings import COMPILE_CACHE_PATH, COMPILE_CACHE_MAX_BYTES, COMPILE_TIMEOUT
+
+
+# Binaries and compile errors keyed by hash of (compile command, source):
+#   {COMPILE_CACHE_PATH}/{key}.exe   compiled binary
+#   {COMPILE_CACHE_PATH}/{key}.err   compiler output of a failed compile
+# File mtime is the last use time, used for LRU eviction.
+# Only errors of the source itself are cached: a compiler that exits with an
+# error and says why. Compilers killed (by a signal or COMPILE_TIMEOUT), failing
+# silently or out of disk or memory are not, the next compile tries again.
+
+# In compiler output: failed for lack of resources, not because of the source
+RESOURCE_ERROR_MARKS = tuple(os.strerror(code).encode() for code in (errno.ENOSPC, errno.ENOMEM))
+
+compile_cache_stats: Dict[str, float] = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    # Time spent compiling on misses
+    "compile_seconds": 0.0,
+    # Estimated: hits * average compile time of a miss
+    "saved_seconds": 0.0,
+}
+
+
+def _record_hit():
+    compile_cache_stats["hits"] += 1
+    if compile_cache_stats["misses"]:
+        compile_cache_stats["saved_seconds"] += (
+            compile_cache_stats["compile_seconds"] / compile_cache_stats["misses"]
+        )
+
+# One lock per key, so identical sources submitted together are compiled once.
+# Value is (lock, number of users), dropped when the last user leaves.
+_key_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+
+def cache_key(code: str, command: List[str]) -> str:
+    """
+    Hash of source and compile command template (compiler and flags).
+    """
+    payload = json.dumps([command, code], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_paths(key: str) -> Tuple[str, str]:
+    return (
+        os.path.join(COMPILE_CACHE_PATH, f"{key}.exe"),
+        os.path.join(COMPILE_CACHE_PATH, f"{key}.err"),
+    )
+
+
+def _link_binary(cached_exe: str, dest: str):
+    """
+    Hard link cached binary to dest (copy across file systems), so eviction
+    can not remove a binary that is still being run.
+    """
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(cached_exe, dest)
+    except OSError:
+        shutil.copy2(cached_exe, dest)
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _evict():
+    """
+    Remove least recently used entries until cache fits in COMPILE_CACHE_MAX_BYTES.
+    """
+    entries = []
+    total = 0
+    with os.scandir(COMPILE_CACHE_PATH) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.endswith((".exe", ".err")):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    if total <= COMPILE_CACHE_MAX_BYTES:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= COMPILE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            compile_cache_stats["evictions"] += 1
+        except OSError:
+            pass
+
+
+async def get_or_compile(
+    code: str,
+    command: List[str],
+    src_name: str,
+    dest: str,
+) -> Optional[str]:
+    """
+    Make the binary of code available at dest, compiling it only on cache miss.
+    command is a template with "{src}", "{exe}" and "{dir}" placeholders, run in
+    the build directory where source is src_name and binary must be "main".
+    Return None on success, or the compiler output if compiling failed.
+    Raise RuntimeError if the compiler failed for reasons other than the source.
+    """
+    key = cache_key(code, command)
+    cached_exe, cached_err = _entry_paths(key)
+
+    lock, users = _key_locks.get(key, (asyncio.Lock(), 0))
+    _key_locks[key] = (lock, users + 1)
+    try:
+        async with lock:
+            if os.path.exists(cached_exe):
+                _record_hit()
+                _touch(cached_exe)
+                _link_binary(cached_exe, dest)
+                return None
+            if os.path.exists(cached_err):
+                _record_hit()
+                _touch(cached_err)
+                with open(cached_err, "r", encoding="utf-8", errors="replace") as f:
+                    return f.read()
+
+            compile_cache_stats["misses"] += 1
+            start = time.monotonic()
+            error = await _compile_into_cache(code, command, src_name, cached_exe, cached_err)
+            compile_cache_stats["compile_seconds"] += time.monotonic() - start
+            if error is None:
+                _link_binary(cached_exe, dest)
+            _evict()
+            return error
+    finally:
+        lock, users = _key_locks[key]
+        if users <= 1:
+            del _key_locks[key]
+        else:
+            _key_locks[key] = (lock, users - 1)
+
+
+async def _compile_into_cache(
+    code: str,
+    command: List[str],
+    src_name: str,
+    cached_exe: str,
+    cached_err: str,
+) -> Optional[str]:
+    # Compile in a private directory, then move results in atomically,
+    # so other processes sharing the cache never see a partial binary.
+    build_dir = os.path.abspath(os.path.join(COMPILE_CACHE_PATH, f"tmp-{uuid.uuid4().hex}"))
+    os.makedirs(build_dir, exist_ok=True)
+    try:
+        src = os.path.join(build_dir, src_name)
+        exe = os.path.join(build_dir, "main")
+        with open(src, "w") as f:
+            f.write(code)
+
+        # Precompiled headers / ccache for C++, same binary either way
+        command, env, pch_key = cpp_accel.accelerate(command, code, src_name)
+
+        # Run in build dir, so commands may also use plain file names.
+        # Own process group, so a timeout also kills what the compiler started (cc1plus, ld).
+        compile_proc = await asyncio.create_subprocess_exec(
+            *[part.format(src=src, exe=exe, dir=build_dir) for part in command],
+            stdout=PIPE, stderr=PIPE, cwd=build_dir, env=env, start_new_session=True
+        )
+        try:
+            compile_stdout, compile_stderr = await asyncio.wait_for(
+                compile_proc.communicate(), timeout=COMPILE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            return f"Compilation took longer than {COMPILE_TIMEOUT:g}s"
+        finally:
+            if compile_proc.returncode is None:
+                try:
+                    os.killpg(compile_proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                await compile_proc.wait()
+        cpp_accel.record_pch_use(pch_key)
+
+        output = compile_stdout + compile_stderr
+        if compile_proc.returncode < 0:
+            raise RuntimeError(f"compiler killed by signal {-compile_proc.returncode}")
+        if compile_proc.returncode > 0 and (
+            not output.strip() or any(mark in output for mark in RESOURCE_ERROR_MARKS)
+        ):
+            raise RuntimeError(
+                f"compiler failed ({compile_proc.returncode}): {output.decode(errors='replace')[-500:]}"
+            )
+        if compile_proc.returncode == 0 and not os.path.exists(exe):
+            return output.decode(errors="replace") + "compile command did not produce the binary 'main'"
+        if compile_proc.returncode > 0:
+            error = output.decode(errors="replace")
+            with open(os.path.join(build_dir, "main.err"), "w", encoding="utf-8") as f:
+                f.write(error)
+            os.replace(os.path.join(build_dir, "main.err"), cached_err)
+            return error
+
+        os.replace(exe, cached_exe)
+        return None
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
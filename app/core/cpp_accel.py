@@ -0,0 +1,227 @@
+import asyncio
+from subprocess import PIPE, DEVNULL
+from typing import List, Dict, Tuple, Optional
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from config.settings import COMPILE_CACHE_PATH, CPP_PCH_HEADERS, CPP_CCACHE
+
+
+# Speeds up C++ compiles that miss the compile cache:
+#
+# Precompiled headers: when the first #include of a source is one of CPP_PCH_HEADERS,
+# the header is precompiled once per compiler and flags (a .gch is only valid for
+# the flags it was built with), under
+#   {COMPILE_CACHE_PATH}/pch/{key}/{header}       wrapper: #include_next <header>
+#   {COMPILE_CACHE_PATH}/pch/{key}/{header}.gch
+# and compiles get `-I {COMPILE_CACHE_PATH}/pch/{key}`. GCC picks the .gch if it
+# is valid and falls back to the wrapper (so to the real header) if not.
+# The .gch is built in the background, the compile that asked for it goes on without.
+#
+# ccache: with CPP_CCACHE and ccache installed, compiles run through it, with
+# its cache in {COMPILE_CACHE_PATH}/ccache.
+
+# Only GCC precompiled headers are supported
+PCH_COMPILERS = ("g++", "c++")
+CPP_COMPILERS = PCH_COMPILERS + ("clang++",)
+
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*<([^>]+)>', re.MULTILINE)
+PROBE_SOURCE = "#include <{header}>\nint main() {{}}\n"
+
+accel_stats: Dict[str, float] = {
+    "pch_builds": 0,
+    "pch_compiles": 0,
+    # Estimated: compiles with a precompiled header * time it saves per compile
+    "pch_saved_seconds": 0.0,
+    "ccache_compiles": 0,
+}
+
+# pch key -> seconds a compile saves by using it, measured after building it
+_pch_savings: Dict[str, float] = {}
+# pch keys being built (or measured), and those that failed to build
+_pch_tasks: Dict[str, asyncio.Task] = {}
+_pch_failed: set[str] = set()
+
+
+def _compiler_name(command: List[str]) -> str:
+    name = os.path.basename(command[0])
+    # Versioned compilers, e.g. g++-12
+    return re.sub(r"-\d+(\.\d+)*$", "", name)
+
+
+def is_cpp_command(command: List[str]) -> bool:
+    return bool(command) and _compiler_name(command) in CPP_COMPILERS
+
+
+def _compile_flags(command: List[str], src_name: str) -> List[str]:
+    """
+    Options of a compile command template, without its source and output.
+    """
+    flags = []
+    skip_next = False
+    for part in command[1:]:
+        if skip_next:
+            skip_next = False
+        elif part == "-o":
+            skip_next = True
+        elif part.startswith("-"):
+            flags.append(part)
+        elif part not in ("{src}", src_name):
+            # Other input files, e.g. libraries
+            flags.append(part)
+    return flags
+
+
+def _pch_key(compiler: str, flags: List[str], header: str) -> str:
+    payload = json.dumps([compiler, flags, header])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _pch_dir(key: str) -> str:
+    return os.path.abspath(os.path.join(COMPILE_CACHE_PATH, "pch", key))
+
+
+def pch_header(code: str) -> Optional[str]:
+    """
+    Header a source may take precompiled: GCC only uses one if it is the first include.
+    """
+    match = INCLUDE_PATTERN.search(code)
+    if match and match.group(1) in CPP_PCH_HEADERS:
+        return match.group(1)
+    return None
+
+
+async def _run(argv: List[str]) -> Tuple[int, bytes, float]:
+    start = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(*argv, stdout=DEVNULL, stderr=PIPE)
+    try:
+        _, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stderr, time.monotonic() - start
+
+
+async def _build_pch(key: str, compiler: str, flags: List[str], header: str):
+    """
+    Build the .gch of header if missing, then measure what it saves per compile.
+    """
+    pch_dir = _pch_dir(key)
+    wrapper = os.path.join(pch_dir, header)
+    gch = wrapper + ".gch"
+    try:
+        if not os.path.exists(gch):
+            os.makedirs(os.path.dirname(wrapper), exist_ok=True)
+            with open(wrapper, "w") as f:
+                f.write(f"#include_next <{header}>\n")
+            # Built aside and moved in, other processes may be building it too.
+            temp_gch = f"{gch}.tmp-{uuid.uuid4().hex}"
+            try:
+                returncode, stderr, _ = await _run(
+                    [compiler, *flags, "-w", "-x", "c++-header", wrapper, "-o", temp_gch]
+                )
+            except BaseException:
+                if os.path.exists(temp_gch):
+                    os.remove(temp_gch)
+                raise
+            if returncode != 0:
+                if os.path.exists(temp_gch):
+                    os.remove(temp_gch)
+                _pch_failed.add(key)
+                print(f"Warning: fail to precompile header <{header}>: {stderr.decode(errors='replace')[-500:]}")
+                return
+            os.replace(temp_gch, gch)
+            accel_stats["pch_builds"] += 1
+
+        # Probe: same source with and without the precompiled header
+        with tempfile.TemporaryDirectory() as probe_dir:
+            src = os.path.join(probe_dir, "probe.cpp")
+            with open(src, "w") as f:
+                f.write(PROBE_SOURCE.format(header=header))
+            exe = os.path.join(probe_dir, "probe")
+            _, _, without_pch = await _run([compiler, *flags, src, "-o", exe])
+            _, _, with_pch = await _run([compiler, "-I", pch_dir, *flags, src, "-o", exe])
+        _pch_savings[key] = max(0.0, without_pch - with_pch)
+    except Exception as e:
+        _pch_failed.add(key)
+        print(f"Warning: fail to precompile header <{header}>: {e}")
+    finally:
+        if _pch_tasks.get(key) is asyncio.current_task():
+            del _pch_tasks[key]
+
+
+def _pch_building(key: str) -> bool:
+    task = _pch_tasks.get(key)
+    # A task of an event loop that is gone (e.g. app restarted in-process) never finishes
+    return task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop()
+
+
+def accelerate(command: List[str], code: str, src_name: str) -> Tuple[List[str], Optional[Dict[str, str]], Optional[str]]:
+    """
+    Rewrite a C++ compile command template to use a precompiled header and ccache
+    where available. Output of the compile is the same.
+    Return (command, env for the compile or None, pch key used or None).
+    """
+    if not is_cpp_command(command):
+        return command, None, None
+
+    accelerated = list(command)
+    env = None
+    used_pch = None
+
+    header = pch_header(code)
+    if header is not None and _compiler_name(command) in PCH_COMPILERS:
+        key = _pch_key(command[0], _compile_flags(command, src_name), header)
+        gch = os.path.join(_pch_dir(key), header + ".gch")
+        if os.path.exists(gch):
+            accelerated[1:1] = ["-I", _pch_dir(key)]
+            used_pch = key
+        if key not in _pch_failed and not _pch_building(key) and (
+            key not in _pch_savings or not os.path.exists(gch)
+        ):
+            _pch_tasks[key] = asyncio.create_task(
+                _build_pch(key, command[0], _compile_flags(command, src_name), header)
+            )
+
+    if CPP_CCACHE and shutil.which("ccache"):
+        env = {
+            **os.environ,
+            "CCACHE_DIR": os.path.abspath(os.path.join(COMPILE_CACHE_PATH, "ccache")),
+            # Needed for ccache to cache compiles with precompiled headers
+            "CCACHE_SLOPPINESS": "pch_defines,time_macros,include_file_mtime,include_file_ctime",
+        }
+        accelerated = ["ccache"] + accelerated
+        if used_pch is not None:
+            accelerated.insert(2, "-fpch-preprocess")
+        accel_stats["ccache_compiles"] += 1
+
+    return accelerated, env, used_pch
+
+
+async def cancel_pch_builds():
+    """
+    Stop background header builds of the running event loop, e.g. on shutdown.
+    """
+    tasks = [
+        task for task in _pch_tasks.values()
+        if task.get_loop() is asyncio.get_running_loop()
+    ]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def record_pch_use(key: Optional[str]):
+    """
+    Count a finished compile that used precompiled header key.
+    """
+    if key is None:
+        return
+    accel_stats["pch_compiles"] += 1
+    accel_stats["pch_saved_seconds"] += _pch_savings.get(key, 0.0)
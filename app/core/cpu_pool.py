@@ -0,0 +1,81 @@
+from typing import List, Dict, Optional
+import fcntl
+import os
+import threading
+from config.settings import JUDGE_CPU_AFFINITY, JUDGE_RESERVED_CORES, JUDGE_WORKSPACE_PATH
+
+
+# Judged processes are pinned each to a core of their own, so a case never
+# shares a core with another case, and timings don't depend on what else runs.
+# The first JUDGE_RESERVED_CORES cores of the process are left out of the pool,
+# for the API, compilers and the rest of the system.
+# Every judging process (API, each judge worker process) has a pool over the
+# same cores, so a core is also locked for other processes while held, by an
+# flock on {CORE_LOCK_PATH}/{core}.lock. Locks go away with a crashed process.
+
+CORE_LOCK_PATH = os.path.join(JUDGE_WORKSPACE_PATH, ".cores")
+# Seconds between looks at cores held by other processes
+CORE_LOCK_RETRY_INTERVAL = 0.01
+
+
+class CorePool:
+    """
+    Cores handed out one per running case. Thread safe: case threads wait for a
+    free core. With no cores, nothing is pinned and acquire() returns None.
+    With a lock_dir, cores are shared with pools of other processes using it.
+    """
+    def __init__(self, cores: List[int], lock_dir: Optional[str] = None):
+        self.cores = list(cores)
+        self.lock_dir = lock_dir
+        self._free = list(cores)
+        self._condition = threading.Condition()
+        self._lock_fds: Dict[int, int] = {}
+
+    def _try_lock(self, core: int) -> bool:
+        if self.lock_dir is None:
+            return True
+        fd = self._lock_fds.get(core)
+        if fd is None:
+            os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+            fd = os.open(os.path.join(self.lock_dir, f"{core}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            self._lock_fds[core] = fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def acquire(self) -> Optional[int]:
+        if not self.cores:
+            return None
+        with self._condition:
+            while True:
+                for core in self._free:
+                    if self._try_lock(core):
+                        self._free.remove(core)
+                        return core
+                # Free here but held by other processes: look again shortly
+                self._condition.wait(CORE_LOCK_RETRY_INTERVAL if self._free else None)
+
+    def release(self, core: Optional[int]):
+        if core is None:
+            return
+        with self._condition:
+            if self.lock_dir is not None:
+                fcntl.flock(self._lock_fds[core], fcntl.LOCK_UN)
+            self._free.append(core)
+            self._condition.notify()
+
+
+def judge_cores() -> List[int]:
+    """
+    Cores for judged processes: those this process may run on, but the reserved
+    ones. None at all if that leaves nothing (e.g. a single core machine).
+    """
+    if not JUDGE_CPU_AFFINITY or not hasattr(os, "sched_getaffinity"):
+        return []
+    cores = sorted(os.sched_getaffinity(0))
+    return cores[JUDGE_RESERVED_CORES:]
+
+
+core_pool = CorePool(judge_cores(), CORE_LOCK_PATH)
@@ -1,74 +1,214 @@
 import asyncio
-from subprocess import PIPE, TimeoutExpired
+from subprocess import PIPE
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
+from collections import OrderedDict, deque
+import hashlib
+import json
 import os
+import math
+import selectors
+import signal
 from ..db.schemas import *
-from ..db.database import ASession
+from ..db.database import ASession, get_async_session
+from ..db.solved import update_solved
 from ..core.errors import HTTPException
-import psutil
-from pathlib import Path
-from sqlmodel import select
+from sqlmodel import select, delete, func, update, insert
+from sqlalchemy import literal_column
+from sqlalchemy.exc import SQLAlchemyError
+from . import compile_cache, cpp_accel, testcase_store, verdict_cache
+from .comparator import OutputComparator
+from .sandbox import sandbox, RUN_USER
+from .workspace import Workspace, cleanup_stale_workspaces
+from .languages import language_registry
+from .result_writer import result_writer
+from .cpu_pool import core_pool
+from config.settings import (
+    JUDGE_WORKERS, JUDGE_QUEUE_SIZE, JUDGE_POLL_INTERVAL, JUDGE_CLAIM_TIMEOUT,
+    JUDGE_CASE_PARALLELISM, JUDGE_MAX_CASE_PARALLELISM, JUDGE_WALL_TIME_FACTOR,
+    JUDGE_ADDRESS_SPACE_FACTOR, JUDGE_PYTHON_ZYGOTE, JUDGE_OUTPUT_LIMIT,
+    JUDGE_CHECKER_TIME_LIMIT, JUDGE_CHECKER_MEMORY_LIMIT,
+)
+import socket
 import time
 
 
+# Special judge: checker is run as `checker <input> <expected output> <actual output>`.
+# Exit code 0 accepts the output, 1 (wrong answer) or 2 (presentation error, as
+# in testlib) rejects it, anything else is a checker failure.
+CHECKER_COMPILE_COMMAND = ["g++", "-O2", "{src}", "-o", "{exe}"]
+CHECKER_REJECT_CODES = (1, 2)
+
+PIPE_CHUNK_SIZE = 64 * 1024
+
+# Tail of stderr kept per case: enough for a traceback's last lines.
+STDERR_KEEP_BYTES = 64 * 1024
+
+# stderr of a program whose allocation was refused by RLIMIT_AS
+MEMORY_ERROR_MARKS = (b"MemoryError", b"std::bad_alloc")
+
+# Case results an incremental rejudge keeps: SKIP and UNK depend on other cases
+# or on the checker working, not on the test case alone.
+KEPT_RESULTS = ("AC", "WA", "TLE", "MLE", "OLE", "RE")
+
+# Threads that run (and wait for) test case processes.
+case_executor = ThreadPoolExecutor(
+    max_workers=JUDGE_WORKERS * JUDGE_MAX_CASE_PARALLELISM,
+    thread_name_prefix="judge-case"
+)
+
+
+def _judge_hash(code: str, executor, time_limit: float, memory_limit: int, checker: str | None) -> str:
+    """
+    Hash of everything a case result depends on, besides the test case itself.
+    """
+    payload = json.dumps([
+        code, executor.compile_command, executor.run_command, time_limit, memory_limit, checker
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def save_result(
+    submission_id: str,
+    status: str,
+    score: int,
+    counts: int,
+    case_items: List[Dict],
+    judge_hash: str | None,
+    memo: Dict | None = None,
+    generation: int | None = None,
+):
+    """
+    Write the result of a judged submission to db, batched with other results
+    (see result_writer.py). memo is a verdict cache entry to write with it.
+    With a generation, the result is dropped if the submission was rejudged since
+    (its judge_generation changed).
+    """
+    try:
+        await result_writer.write({
+            "submission_id": submission_id,
+            "status": status,
+            "score": score,
+            "counts": counts,
+            "details": case_items,
+            "judge_hash": judge_hash,
+            "memo": memo,
+            "generation": generation,
+        })
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Server Error: failed to update submission status in db.{e}"
+        )
+
+
 async def test_code(
     session: ASession, 
     submission_id: int,
     code: str,
-    testcases: List[SampleItem],
+    testcases: List[Dict],
     language: str,
     time_limit: float = 3.0,
     memory_limit: int = 128,   
-    
+    case_parallelism: int | None = None,
+    stop_on_failure: bool = False,
+    checker: str | None = None,
+    incremental: bool = False,
+    use_verdict_cache: bool = False,
+    generation: int | None = None,
 ):
+    """
+    Judge code on testcases and write the result to db.
+    testcases are {"input_path", "output_path", "hash"} dicts, see testcase_store.case_paths.
+    If checker (C++ source) is given, it decides on each output instead of comparing.
+    If incremental, cases with a result in the submission's log for the same test
+    case content (and same code, language, limits and checker) keep it, only
+    new or changed cases are run.
+    If use_verdict_cache, code judged before on the same test cases with the same
+    settings gets that result without being run (see verdict_cache.py).
+    generation is the submission's judge_generation when judging started, see save_result.
+    """
+    workspace = None
     try:
         case_items: List[Dict] = []
         
-        temp_file = None
-        temp_exe_file = None
+        checker_exe = None
         exec_command = None
         is_successful = True
         pass_count = 0 
         
-        # If python, just create py file
-        if language == "python":
-            temp_file = f"temp_{submission_id}.py"
-            exec_command = ["python", temp_file]
-            try:
-                with open(temp_file, "w") as f:
-                    f.write(code)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Server Error: Failed to write python code file.{e}"
+        # Build and run commands of the language, from the language registry
+        executor = await language_registry.get(language, session)
+        if executor is None:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Server Error: Unsupported programming language '{language}'"
+            )
+        time_limit, memory_limit = executor.limits(time_limit, memory_limit)
+        judge_hash = _judge_hash(code, executor, time_limit, memory_limit, checker)
+        existing_log = await session.get(SubmissionLog, submission_id) if incremental else None
+        
+        # Same code judged before: take its result
+        memo_key = None
+        if use_verdict_cache:
+            memo_key = verdict_cache.cache_key(
+                _judge_hash(verdict_cache.normalize_source(code), executor, time_limit, memory_limit, checker),
+                language,
+                [case["hash"] for case in testcases],
+                stop_on_failure
+            )
+            memo = await verdict_cache.lookup(memo_key, session)
+            if memo is not None:
+                # Written back to mark it used
+                await save_result(
+                    submission_id, memo.status, memo.score, len(testcases) * 10,
+                    memo.details, judge_hash,
+                    verdict_cache.memo_row(memo_key, memo.status, memo.score, memo.details),
+                    generation
                 )
+                return
+        
+        # Source, binaries and outputs of this run all go to one directory on tmpfs.
+        try:
+            workspace = Workspace(submission_id)
+        except OSError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Server Error: Failed to create judge workspace.{e}"
+            )
+        exec_command = executor.exec_command(workspace.path)
+        
+        # Results that an incremental rejudge can keep, by test case hash
+        kept_results: Dict[str, Dict] = {}
+        if incremental and existing_log is not None and existing_log.judge_hash == judge_hash:
+            kept_results = {
+                case_item["testcase_hash"]: case_item for case_item in existing_log.details
+                if case_item.get("testcase_hash") and case_item["result"] in KEPT_RESULTS
+            }
+        cases_to_run = [
+            (i, case) for i, case in enumerate(testcases) if case["hash"] not in kept_results
+        ]
+        
+        # Source file, also for interpreted languages
+        try:
+            with open(workspace.file(executor.src_name), "w") as f:
+                f.write(code)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Server Error: Failed to write code file.{e}"
+            )
 
-        # If C++, create cpp file and compile it to exe file.
-        elif language == "C++":
-            temp_file = f"temp_{submission_id}.cpp"
-            temp_exe_file = f"temp_{submission_id}.exe"
-            exec_command = [temp_exe_file]
-            
-            try:
-                # Write code into file
-                with open(temp_file, "w") as f:
-                    f.write(code)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Server Error: Failed to write C++ code file.{e}"
-                )
-            
+        # If compiled, get binary (compiled only if not in compile cache).
+        if executor.compile_command is not None and cases_to_run:
             try:
-                compile_proc = await asyncio.create_subprocess_exec(
-                    "g++", temp_file, "-o", temp_exe_file,
-                    stderr=PIPE
+                compile_error = await compile_cache.get_or_compile(
+                    code, executor.compile_command, executor.src_name,
+                    workspace.file(executor.exe_name)
                 )
-                # Get error in compiling
-                complie_stdout, compile_stderr = await compile_proc.communicate()
                 
                 # Error in compiling
-                if compile_proc.returncode != 0:
+                if compile_error is not None:
                     is_successful = False
                     # 测例信息记录（编译错误）
                     case_items.append({
@@ -78,173 +218,73 @@ async def test_code(
                         "memory": 0
                     })
                     
-                    submission_log = SubmissionLog(
-                        submission_id=submission_id,
-                        details=case_items,
-                        score=0,
-                        counts=len(testcases) * 10
+                    await save_result(
+                        submission_id, "error", 0, len(testcases) * 10, case_items, None,
+                        generation=generation
                     )
-                    
-                    submission = await session.get(SubmissionItem, submission_id)
-                    submission.status = "error"
-                    submission.score = 0
-                    
-                    session.add(submission_log)
-                    session.add(submission)
-                    await session.commit()
                     return 
                 
             except Exception as e:
                 raise HTTPException(
                     status_code=500,
-                    detail=f"Server Error: C++ compiling failed.{e}"
+                    detail=f"Server Error: {language} compiling failed.{e}"
                 )    
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Server Error: Unsupported programming language '{language}'"
-            )        
         
-                
-        # Examine test cases, if python or compiled C++
-        for i, case in enumerate(testcases):
-            proc = None
-            mem_monitor_task = None
-            start_time = time.monotonic()
-            time_usage = 0.0
-            memory_usage = 0
-            current_case_result = "UNK"
-            try:
-                proc = await asyncio.create_subprocess_exec(
-                    *exec_command,
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE
-                )
-
-                # Memory monitor
-                if memory_limit > 0:
-                    mem_monitor_task = asyncio.create_task(
-                        monitor_memory_usage(proc.pid, memory_limit)
-                    )
-            except Exception as e:
-                if proc and proc.returncode is None:
-                    proc.kill()
-                if mem_monitor_task and not mem_monitor_task.done():
-                    mem_monitor_task.cancel()
-                    try: await mem_monitor_task
-                    except asyncio.CancelledError: pass
+        # Special judge: checker binary (compiled only if not in compile cache),
+        # actual outputs are saved for the checker to read. Both in the private
+        # directory, which the program (run as RUN_USER) can't reach.
+        if checker and cases_to_run:
+            checker_exe = workspace.private_file("checker.exe")
+            checker_error = await compile_checker(checker, checker_exe)
+            if checker_error is not None:
                 raise HTTPException(
                     status_code=500,
-                    detail=f"Server Error: Failed to start code execution / memory monitor.{e}"
-                )     
-
-            # Start to capture error in submission code running
-            try:
-                # Get output and error
-                stdout, stderr = await asyncio.wait_for(
-                    proc.communicate(input=case["input"].encode()),
-                    timeout=time_limit
+                    detail=f"Server Error: Checker failed to compile.{checker_error}"
                 )
-                # record time usage
-                end_time = time.monotonic()
-                time_usage = end_time - start_time
+        workspace.hand_over(RUN_USER)
                 
-                # If started a mem monitor, cancel it.
-                if mem_monitor_task:
-                    mem_monitor_task.cancel()
-                    try:
-                        # Get memort usage
-                        memory_usage = await mem_monitor_task
-                    except asyncio.CancelledError:
-                        pass
-                    except MemoryError:
-                        # MLE
-                        current_case_result = "MLE"
-                        
-                
-                # Judge if output is correct
-                output = stdout.decode().strip()
-                is_correct = output == case["output"].strip()
-                error = stderr.decode().strip() if stderr else None
-                
-                if error:
-                    is_successful = False
-                    ### 测例信息记录（运行错误）
-                    current_case_result = "RE"
-                if not error and is_correct:
-                    pass_count += 1
-                    ### 测例信息记录(答案是否正确)
-                    current_case_result = "AC"
-                else:
-                    current_case_result = "WA"
-            
-            except TimeoutExpired:
-                proc.kill()
-                is_successful = False
-                ### 测例信息记录(超时) 
-                current_case_result = "TLE"
-                time_usage = time_limit
-            except MemoryError:
-                proc.kill()
+        # Examine test cases.
+        # Up to `parallelism` cases run at once; each is timed by its own CPU time.
+        parallelism = max(1, min(case_parallelism or JUDGE_CASE_PARALLELISM, JUDGE_MAX_CASE_PARALLELISM))
+        semaphore = asyncio.Semaphore(parallelism)
+        stop_event = asyncio.Event() if stop_on_failure else None
+        if stop_event is not None and any(
+            case_item["result"] != "AC" for case_item in kept_results.values()
+        ):
+            stop_event.set()
+        run_items = await asyncio.gather(*(
+            judge_case(
+                i + 1, case, exec_command, time_limit, memory_limit, semaphore,
+                python_zygote=(executor.python_zygote and JUDGE_PYTHON_ZYGOTE),
+                stop_event=stop_event,
+                checker_exe=checker_exe,
+                work_dir=workspace.path,
+                output_dir=workspace.private_path
+            )
+            for i, case in cases_to_run
+        ))
+        run_items = {case_item["id"]: case_item for case_item in run_items}
+        for i, case in enumerate(testcases):
+            case_item = run_items.get(i + 1) or {**kept_results[case["hash"]], "id": i + 1}
+            case_item["testcase_hash"] = case["hash"]
+            case_items.append(case_item)
+        
+        for case_item in case_items:
+            if case_item["result"] == "AC":
+                pass_count += 1
+            elif case_item["result"] not in ("WA", "SKIP"):
                 is_successful = False
-                ### 测例信息记录（内存超限）
-                current_case_result = "MLE"
-            except Exception as e:
-                is_successful = False 
-                current_case_result = "UNK"
-                # UNK  
-            finally:
-                if proc and proc.returncode is None:
-                    proc.kill()
-                if proc:
-                    await proc.wait()
-                if mem_monitor_task and not mem_monitor_task.done():
-                    mem_monitor_task.cancel()
-                    try: 
-                        memory_usage = await mem_monitor_task
-                    except asyncio.CancelledError: 
-                        pass
-                    
-            # Record result of current case
-            case_items.append({
-                "id": i + 1,
-                "result": current_case_result,
-                "time": time_usage,
-                "memory": memory_usage
-            })
 
         # Judge test result, and update db
-        try:
-            submission = await session.get(SubmissionItem, submission_id)
-            submission.status = "success" if is_successful else "error"
-            submission.score = pass_count * 10
-            session.add(submission)
-            
-            # If submission_log already exists (rejudge), update it; or add new one.
-            result = await session.execute(
-                select(SubmissionLog).where(SubmissionLog.submission_id == submission_id)
-            )
-            existing_log = result.scalar_one_or_none()
-            
-            if existing_log:
-                existing_log.details=case_items
-                existing_log.score=pass_count * 10
-                session.add(existing_log)
-            else:
-                submission_log = SubmissionLog(
-                submission_id=submission_id,
-                details=case_items,
-                score=pass_count * 10,
-                counts=len(testcases) * 10
-            )            
-                session.add(submission_log)
-            
-            await session.commit()
-            
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Server Error: failed to update submission status in db.{e}"
-            )
+        status = "success" if is_successful else "error"
+        # Checker failures (UNK) are not the code's result, judge it again next time
+        memo = None
+        if memo_key is not None and all(case_item["result"] != "UNK" for case_item in case_items):
+            memo = verdict_cache.memo_row(memo_key, status, pass_count * 10, case_items)
+        await save_result(
+            submission_id, status, pass_count * 10, len(testcases) * 10,
+            case_items, judge_hash, memo, generation
+        )
 
     except HTTPException:
         raise
@@ -254,46 +294,786 @@ async def test_code(
             detail=f"Server Error: An unexpected issue occurred during code evaluation.{e}"
         )
     
-    # Clean temporary files
+    # Clean temporary files, all at once
+    finally:
+        if workspace is not None:
+            workspace.cleanup()
+        
+
+
+        
+async def judge_case(
+    case_id: int,
+    case: Dict,
+    exec_command: List[str],
+    time_limit: float,
+    memory_limit: int,
+    semaphore: asyncio.Semaphore,
+    python_zygote: bool = False,
+    stop_event: asyncio.Event | None = None,
+    checker_exe: str | None = None,
+    work_dir: str | None = None,
+    output_dir: str | None = None,
+) -> Dict:
+    """
+    Run one test case in work_dir and return its case item.
+    If stop_event is given, a failed case sets it and cases not started yet are skipped.
+    If checker_exe is given, output is saved in output_dir (out of the program's
+    reach) and judged by the checker, which runs in the same slot (semaphore and
+    case_executor) as the case.
+    """
+    async with semaphore:
+        # An earlier case failed: stop on first failure
+        if stop_event is not None and stop_event.is_set():
+            return {"id": case_id, "result": "SKIP", "time": 0.0, "memory": 0}
+        
+        actual_path = os.path.join(output_dir, f"{case_id}.out") if checker_exe else None
+        try:
+            run_result = await asyncio.get_running_loop().run_in_executor(
+                case_executor,
+                run_process, exec_command, case["input_path"], case["output_path"],
+                time_limit, memory_limit, python_zygote, JUDGE_OUTPUT_LIMIT, actual_path, work_dir
+            )
+            # Output is judged by the checker
+            if checker_exe and run_result["verdict"] is None and run_result["returncode"] == 0:
+                run_result["output_matches"] = await asyncio.get_running_loop().run_in_executor(
+                    case_executor, run_checker, checker_exe, case, actual_path
+                )
+        except OSError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Server Error: Failed to start code execution.{e}"
+            )
+        except Exception as e:
+            print(f"Warning: error in running case {case_id}: {e}")
+            run_result = None
+        
+        if run_result is None:
+            current_case_result = "UNK"
+        elif run_result["verdict"] is not None:
+            ### 测例信息记录(超时 / 内存超限 / 输出超限 / 提前判定的答案错误)
+            current_case_result = run_result["verdict"]
+        elif run_result["returncode"] != 0 or run_result["stderr"].strip():
+            ### 测例信息记录（运行错误）
+            current_case_result = "RE"
+        elif run_result["output_matches"] is None:
+            # Checker failed
+            current_case_result = "UNK"
+        elif run_result["output_matches"]:
+            ### 测例信息记录(答案正确)
+            current_case_result = "AC"
+        else:
+            current_case_result = "WA"
+            
+        # Set before releasing the semaphore, so the next case sees it
+        if stop_event is not None and current_case_result != "AC":
+            stop_event.set()
+        if actual_path and os.path.exists(actual_path):
+            os.remove(actual_path)
+        
+    return {
+        "id": case_id,
+        "result": current_case_result,
+        "time": run_result["time"] if run_result else 0.0,
+        "wall_time": run_result["wall_time"] if run_result else 0.0,
+        "memory": run_result["memory"] if run_result else 0
+    }
+        
+    
+def run_process(
+    command: List[str],
+    input_path: str,
+    output_path: str,
+    time_limit: float,
+    memory_limit: int,
+    python_zygote: bool = False,
+    output_limit: int = JUDGE_OUTPUT_LIMIT,
+    actual_path: str | None = None,
+    cwd: str | None = None,
+    judged: bool = True,
+) -> Dict:
+    """
+    Run command to completion with the file input_path as stdin, comparing its
+    stdout with the file output_path. Blocking, run it in case_executor.
+    If actual_path is given, stdout is written there instead of compared (for a checker),
+    if output_path is None it is only counted.
+    The child runs in cwd (default: current directory), as RUN_USER if judged
+    (a checker is not: it reads files kept from the judged program).
+    
+    The child is started by the sandbox fork server under RLIMIT_CPU and RLIMIT_AS,
+    so the kernel stops it at the limits and nothing is polled while it runs.
+    It runs pinned to a core of core_pool (see cpu_pool.py) when there is one.
+    Time is its CPU time (user + sys) and memory its peak RSS, both from wait4,
+    so cases running in parallel don't inflate each other's time. Wall time is
+    only a backstop for children that sleep, at JUDGE_WALL_TIME_FACTOR * time_limit.
+    With python_zygote, command is ["python", script] and the script runs in a
+    fork of the server's warm interpreter.
+    stdout is compared while it is read and never kept: the child is killed as
+    soon as its output can no longer match ("WA", unless over the time or memory
+    limit by then) or exceeds output_limit bytes ("OLE").
+    Return dict with stderr (its tail), returncode, time (CPU, s), wall_time (s), memory (MB),
+    output_matches and verdict ("TLE", "MLE", "OLE", "WA" or None).
+    """
+    limits = {
+        # Kernel sends SIGXCPU once CPU time reaches the limit (whole seconds).
+        "cpu": math.ceil(time_limit),
+        "as": int(memory_limit * JUDGE_ADDRESS_SPACE_FACTOR * 1024 * 1024) if memory_limit > 0 else None,
+    }
+    
+    # Input file is the child's stdin itself, nothing is copied through a pipe.
+    stdin_fd = os.open(input_path, os.O_RDONLY)
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    # A core of its own, if any; waiting for it does not count as wall time.
+    core = core_pool.acquire()
+    if core is not None:
+        limits["cores"] = [core]
+    start = time.monotonic()
+    deadline = start + time_limit * JUDGE_WALL_TIME_FACTOR
+    try:
+        run = sandbox.spawn(
+            command, [stdin_fd, stdout_w, stderr_w], limits,
+            cwd=cwd or os.getcwd(), python=python_zygote,
+            user=RUN_USER if judged else None
+        )
+    except BaseException:
+        core_pool.release(core)
+        for fd in (stdout_r, stderr_r):
+            os.close(fd)
+        raise
+    finally:
+        # Child ends belong to the child now
+        for fd in (stdin_fd, stdout_w, stderr_w):
+            os.close(fd)
+        
+    comparator = None
+    actual_file = None
+    output_matches = False
+    # Output can no longer match, child was stopped early
+    mismatch = False
+    output_size = 0
+    stderr = bytearray()
+    verdict = None
+    
+    selector = selectors.DefaultSelector()
+    selector.register(stdout_r, selectors.EVENT_READ)
+    selector.register(stderr_r, selectors.EVENT_READ)
+        
+    try:
+        if actual_path is not None:
+            actual_file = open(actual_path, "wb")
+        elif output_path is not None:
+            comparator = OutputComparator(output_path)
+        while verdict is None and not mismatch and (selector.get_map() or not run.done):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                verdict = "TLE"
+                break
+            
+            # Output closed but child still running: just wait for it.
+            if not selector.get_map():
+                run.wait(timeout)
+                continue
+            
+            # Compare stdout as it comes, keep the tail of stderr
+            for key, _ in selector.select(timeout=timeout):
+                data = os.read(key.fd, PIPE_CHUNK_SIZE)
+                if not data:
+                    selector.unregister(key.fd)
+                elif key.fd == stdout_r:
+                    output_size += len(data)
+                    if output_size > output_limit:
+                        verdict = "OLE"
+                        break
+                    if actual_file is not None:
+                        actual_file.write(data)
+                    elif comparator is not None and not comparator.feed(data):
+                        mismatch = True
+                        break
+                else:
+                    stderr += data
+                    del stderr[:-STDERR_KEEP_BYTES]
+        output_matches = verdict is None and not mismatch and comparator is not None and comparator.finish()
     finally:
-        if temp_file and os.path.exists(temp_file):
+        if comparator is not None:
+            comparator.close()
+        if actual_file is not None:
+            actual_file.close()
+        selector.close()
+        for fd in (stdout_r, stderr_r):
+            os.close(fd)
+        if not run.done:
+            run.kill()
+            run.wait()
+        wall_time = time.monotonic() - start
+        core_pool.release(core)
+            
+    if run.result is None:
+        raise RuntimeError(run.error)
+    
+    returncode = os.waitstatus_to_exitcode(run.result["status"])
+    cpu_time = run.result["utime"] + run.result["stime"]
+    # ru_maxrss is in KB on Linux
+    memory_mb = run.result["maxrss"] / 1024
+    stderr = bytes(stderr)
+    
+    if verdict is None:
+        # Over the limit, or an allocation refused by RLIMIT_AS
+        if memory_limit > 0 and (
+            memory_mb > memory_limit or
+            (returncode != 0 and any(error in stderr for error in MEMORY_ERROR_MARKS))
+        ):
+            verdict = "MLE"
+        elif cpu_time > time_limit or returncode == -signal.SIGXCPU:
+            verdict = "TLE"
+        elif mismatch:
+            # Killed on purpose, so its exit status means nothing
+            verdict = "WA"
+    
+    return {
+        "stderr": stderr,
+        "returncode": returncode,
+        "time": cpu_time,
+        "wall_time": wall_time,
+        "memory": int(round(memory_mb)),
+        "verdict": verdict,
+        "output_matches": verdict is None and output_matches,
+    }
+
+
+async def compile_checker(checker: str, dest: str) -> Optional[str]:
+    """
+    Make checker binary available at dest, compiled once per checker source
+    (compile cache). Return None on success, or the compiler output.
+    """
+    return await compile_cache.get_or_compile(checker, CHECKER_COMPILE_COMMAND, "checker.cpp", dest)
+
+
+async def checker_compile_error(checker: str) -> Optional[str]:
+    """
+    Compile checker to check it, leaving it in compile cache for judging.
+    Return None if it compiles, or the compiler output.
+    """
+    try:
+        with Workspace("checker") as workspace:
+            return await compile_checker(checker, workspace.file("checker.exe"))
+    except (OSError, RuntimeError) as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Server Error: Failed to compile checker.{e}"
+        )
+
+
+def run_checker(checker_exe: str, case: Dict, actual_path: str) -> Optional[bool]:
+    """
+    Run checker on one case output. Blocking, run it in case_executor.
+    Return whether the output is accepted, None if the checker itself failed.
+    """
+    checker_result = run_process(
+        [checker_exe] + [os.path.abspath(path) for path in (case["input_path"], case["output_path"], actual_path)],
+        os.devnull, None, JUDGE_CHECKER_TIME_LIMIT, JUDGE_CHECKER_MEMORY_LIMIT,
+        cwd=os.path.dirname(checker_exe), judged=False
+    )
+    if checker_result["verdict"] is None:
+        if checker_result["returncode"] == 0:
+            return True
+        if checker_result["returncode"] in CHECKER_REJECT_CODES:
+            return False
+    print(
+        f"Warning: checker failed ({checker_result['verdict'] or checker_result['returncode']}): "
+        f"{checker_result['stderr'].decode(errors='replace')[-500:]}"
+    )
+    return None
+
+
+# ============================= Judge scheduler ============================= #
+
+class FairQueue:
+    """
+    Bounded queue of submission ids in priority classes (JudgePriority).
+    get() takes from the most urgent non-empty class, and inside a class goes
+    round robin over users, so one user's many submissions can't hold up others.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        # priority -> user id -> submission ids of the user, in arrival order
+        self._classes: Dict[int, OrderedDict[str, deque]] = {
+            priority: OrderedDict() for priority in JudgePriority
+        }
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        
+    def qsize(self) -> int:
+        return self._size
+    
+    def empty(self) -> bool:
+        return self._size == 0
+    
+    def full(self) -> bool:
+        return self._size >= self.maxsize
+    
+    def put_nowait(self, submission_id: str, user_id: str, priority: int) -> Optional[str]:
+        """
+        Add submission. When full, the newest submission of a less urgent class
+        makes room and is returned; raise asyncio.QueueFull if there is none.
+        """
+        evicted = None
+        if self.full():
+            evicted = self._pop_newest(below=priority)
+            if evicted is None:
+                raise asyncio.QueueFull
+        self._classes[priority].setdefault(user_id, deque()).append(submission_id)
+        self._size += 1
+        self._not_empty.set()
+        return evicted
+    
+    def _pop_newest(self, below: int) -> Optional[str]:
+        for priority in sorted(self._classes, reverse=True):
+            if priority <= below:
+                break
+            users = self._classes[priority]
+            if users:
+                # Last user in round robin order
+                user_id = next(reversed(users))
+                submission_id = users[user_id].pop()
+                if not users[user_id]:
+                    del users[user_id]
+                self._size -= 1
+                return submission_id
+        return None
+    
+    async def get(self) -> str:
+        while self._size == 0:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        for priority in sorted(self._classes):
+            users = self._classes[priority]
+            if users:
+                user_id, submission_ids = next(iter(users.items()))
+                submission_id = submission_ids.popleft()
+                # User goes to the back of the round
+                if submission_ids:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                self._size -= 1
+                return submission_id
+        
+        
+class JudgeScheduler:
+    """
+    Bounded pool of judge workers fed by pending submissions.
+    
+    The db is the real queue: every submission is committed as "pending" before
+    it is enqueued here, so the in-memory queue is only a buffer. When the buffer
+    is full (or after a restart) submissions simply stay pending in db and are
+    picked up by the next refill. Enqueueing never blocks, so HTTP handlers are
+    isolated from judge load.
+    
+    Fresh submissions go before rejudges and imports (see FairQueue); their class
+    is kept in JudgeRequest, so refills from db keep the same order.
+    """
+    def __init__(
+        self,
+        workers: int = JUDGE_WORKERS,
+        queue_size: int = JUDGE_QUEUE_SIZE,
+        poll_interval: float = JUDGE_POLL_INTERVAL,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._queue: Optional[FairQueue] = None
+        self._refill_event: Optional[asyncio.Event] = None
+        # Ids that are queued or being judged, to avoid judging one submission twice.
+        self._scheduled: set[str] = set()
+        # Ids being judged, and those rejudged meanwhile: queued again once done
+        self._judging: set[str] = set()
+        self._requeue: Dict[str, tuple] = {}
+        # Set when a submission was left in db because the queue was full.
+        self._overflowed = False
+        self._tasks: List[asyncio.Task] = []
+        
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+        
+    async def start(self):
+        if self.running:
+            return
+        cleanup_stale_workspaces()
+        # Files left by test case updates made while judging
+        try:
+            async with get_async_session() as session:
+                await prune_testcase_files(session)
+        except SQLAlchemyError as e:
+            print(f"Warning: fail to prune test case files: {e}")
+        await result_writer.start()
+        self._queue = FairQueue(maxsize=self.queue_size)
+        self._refill_event = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._feeder()))
+        # Recover submissions left pending by a previous run.
+        self._refill_event.set()
+        
+    async def stop(self):
+        """
+        Stop workers. Unfinished submissions stay pending in db and are resumed on next start.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await cpp_accel.cancel_pch_builds()
+        await result_writer.stop()
+        self._tasks = []
+        self._scheduled.clear()
+        self._judging.clear()
+        self._requeue.clear()
+        self._overflowed = False
+        self._queue = None
+        self._refill_event = None
+        
+    def enqueue(
+        self,
+        submission_id: str,
+        user_id: str = "",
+        priority: int = JudgePriority.SUBMIT,
+    ) -> bool:
+        """
+        Schedule a pending submission without waiting.
+        Return False if it was left in db for a later refill.
+        """
+        if not self.running:
+            return False
+        if submission_id in self._scheduled:
+            if submission_id in self._judging:
+                # Rejudged while judged: that result is dropped (see save_result),
+                # judge it again after.
+                self._requeue[submission_id] = (user_id, priority)
+            return True
+        try:
+            evicted = self._queue.put_nowait(submission_id, user_id, priority)
+        except asyncio.QueueFull:
+            self._overflowed = True
+            return False
+        self._scheduled.add(submission_id)
+        if evicted is not None:
+            # Still pending in db, back with the next refill
+            self._scheduled.discard(evicted)
+            self._overflowed = True
+        return True
+    
+    async def _feeder(self):
+        """
+        Refill the queue from pending submissions in db, on demand or every poll_interval.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_event.clear()
+            
+            free_slots = self.queue_size - self._queue.qsize()
+            if free_slots <= 0:
+                continue
             try:
-                os.remove(temp_file)
+                async with get_async_session() as session:
+                    # Skip submissions being judged by other workers.
+                    claimed = select(JudgeClaim.submission_id).where(
+                        JudgeClaim.claimed_at >= time.time() - JUDGE_CLAIM_TIMEOUT
+                    )
+                    # Representatives of duplicates that will still give them their result
+                    resolving = select(SubmissionItem.id).where(
+                        SubmissionItem.status == SubmissionStatus.PENDING
+                    ).union(claimed)
+                    priority = func.coalesce(JudgeRequest.priority, JudgePriority.SUBMIT)
+                    # Most urgent class first; rowid keeps submissions in arrival order.
+                    result = await session.execute(
+                        select(SubmissionItem.id, SubmissionItem.user_id, priority)
+                        .outerjoin(JudgeRequest, JudgeRequest.submission_id == SubmissionItem.id)
+                        .where(SubmissionItem.status == SubmissionStatus.PENDING)
+                        .where(SubmissionItem.id.not_in(claimed))
+                        # Duplicates take the result of the submission they duplicate,
+                        # unless it is done without (e.g. its resolve_duplicates failed)
+                        .where(
+                            JudgeRequest.duplicate_of.is_(None) |
+                            JudgeRequest.duplicate_of.not_in(resolving)
+                        )
+                        .order_by(priority, literal_column("submissionitem.rowid"))
+                        .limit(free_slots + len(self._scheduled))
+                    )
+                    pending = result.all()
             except Exception as e:
-                print(f"Warning: fail to clean temporary file '{temp_file}':{e}")
+                print(f"Warning: judge scheduler failed to load pending submissions: {e}")
+                continue
             
-        if temp_exe_file and os.path.exists(temp_exe_file):
+            for submission_id, user_id, submission_priority in pending:
+                if submission_id not in self._scheduled and not self.enqueue(
+                    submission_id, user_id, submission_priority
+                ):
+                    break
+                
+    async def _worker(self):
+        while True:
+            submission_id = await self._queue.get()
+            self._judging.add(submission_id)
             try:
-                os.remove(temp_exe_file)
+                await judge_submission(submission_id)
             except Exception as e:
-                print(f"Warning: fail to clean temporary file '{temp_exe_file}':{e}")
-        
+                print(f"Warning: failed to judge submission '{submission_id}': {e}")
+            finally:
+                self._judging.discard(submission_id)
+                self._scheduled.discard(submission_id)
+                requeue = self._requeue.pop(submission_id, None)
+                if requeue is not None:
+                    self.enqueue(submission_id, *requeue)
+                # Queue drained: pull in submissions that did not fit before.
+                if self._overflowed and self._queue.empty():
+                    self._overflowed = False
+                    self._refill_event.set()
+                    
+                    
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Seconds between refreshes of a claim while judging, well within JUDGE_CLAIM_TIMEOUT
+CLAIM_HEARTBEAT_INTERVAL = JUDGE_CLAIM_TIMEOUT / 4
 
 
+async def claim_submission(submission_id: str, session: ASession) -> bool:
+    """
+    Try to claim a submission for this worker. Return False if another worker owns it.
+    A claim not refreshed (see keep_claim) for JUDGE_CLAIM_TIMEOUT belongs to a
+    crashed worker and is taken over.
+    """
+    now = time.time()
+    try:
+        await session.execute(
+            delete(JudgeClaim).where(
+                (JudgeClaim.submission_id == submission_id) &
+                (JudgeClaim.claimed_at < now - JUDGE_CLAIM_TIMEOUT)
+            )
+        )
+        session.add(JudgeClaim(submission_id=submission_id, worker_id=WORKER_ID, claimed_at=now))
+        await session.commit()
+        return True
+    except SQLAlchemyError:
+        # Claimed by someone else, or db locked by another worker: leave it for a later scan.
+        await session.rollback()
+        return False
+    
+    
+async def keep_claim(submission_id: str):
+    """
+    Refresh this worker's claim of submission_id every CLAIM_HEARTBEAT_INTERVAL,
+    until cancelled, so a long judge run is not taken over as crashed.
+    Runs beside the judge, in sessions of its own.
+    """
+    while True:
+        await asyncio.sleep(CLAIM_HEARTBEAT_INTERVAL)
+        try:
+            async with get_async_session() as session:
+                await session.execute(
+                    update(JudgeClaim)
+                    .where(JudgeClaim.submission_id == submission_id)
+                    .where(JudgeClaim.worker_id == WORKER_ID)
+                    .values(claimed_at=time.time())
+                )
+                await session.commit()
+        except SQLAlchemyError as e:
+            print(f"Warning: fail to refresh claim of submission '{submission_id}': {e}")
+    
+    
+async def release_submission(submission_id: str, session: ASession):
+    try:
+        await session.execute(
+            delete(JudgeClaim).where(
+                (JudgeClaim.submission_id == submission_id) &
+                (JudgeClaim.worker_id == WORKER_ID)
+            )
+        )
+        await session.commit()
+    except SQLAlchemyError as e:
+        await session.rollback()
+        print(f"Warning: fail to release claim of submission '{submission_id}': {e}")
+        
         
-async def monitor_memory_usage(pid: int, memory_limit: int):
+# problem id -> (test case metadata, their paths), so a run of submissions of one
+# problem (e.g. a bulk rejudge) checks its files once.
+_case_paths_cache: Dict[str, tuple] = {}
+CASE_PATHS_CACHE_SIZE = 64
+
+
+async def load_case_paths(problem: ProblemItem, session: ASession) -> List[Dict]:
     """
-    Monitor Memory usage, raise MemoryError if exceed limit
+    Paths of the test case files of problem, moving legacy inline test cases to files first.
     """
-    process = psutil.Process(pid)
-    peak_memory_mb = 0.0  # Record peak memory
+    cached = _case_paths_cache.get(problem.id)
+    if cached is not None and cached[0] == problem.testcases:
+        return cached[1]
     try:
-        while True:
-            mem_info = process.memory_info()
-            current_memory_mb = mem_info.rss / (1024 * 1024)
-            if current_memory_mb > peak_memory_mb:
-                peak_memory_mb = current_memory_mb
-                
-            if  current_memory_mb > memory_limit:  # Convert to MB
-                raise MemoryError(f"Memory limit exceeded ({memory_limit}MB)")
-            await asyncio.sleep(0.05)  # Check every 100ms
-    except psutil.NoSuchProcess:
-        pass
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        print(f"Error in memory monitor for PID {pid}: {e}")
-    finally:
-        return int(round(peak_memory_mb))
+        migrated = await asyncio.to_thread(
+            testcase_store.migrate_testcases, problem.id, problem.testcases
+        )
+        if migrated is not None:
+            problem.testcases = migrated
+            session.add(problem)
+            await session.commit()
+        paths = [testcase_store.case_paths(problem.id, case) for case in problem.testcases]
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Server Error: Test case data of problem '{problem.id}' unavailable. {e}"
+        )
+    if len(_case_paths_cache) >= CASE_PATHS_CACHE_SIZE:
+        _case_paths_cache.pop(next(iter(_case_paths_cache)))
+    _case_paths_cache[problem.id] = (problem.testcases, paths)
+    return paths
+
+
+async def prune_testcase_files(session: ASession, problem_ids: Optional[List[str]] = None):
+    """
+    Remove test case files problems (problem_ids, or all) no longer use. Problems
+    with a submission being judged are left alone, as that run may still read
+    old files; they are pruned after a later update or on next scheduler start.
+    """
+    statement = select(ProblemItem.id, ProblemItem.testcases)
+    if problem_ids is not None:
+        statement = statement.where(ProblemItem.id.in_(problem_ids))
+    judged = (
+        select(SubmissionItem.problem_id)
+        .join(JudgeClaim, JudgeClaim.submission_id == SubmissionItem.id)
+        .where(JudgeClaim.claimed_at >= time.time() - JUDGE_CLAIM_TIMEOUT)
+    )
+    result = await session.execute(statement.where(ProblemItem.id.not_in(judged)))
+    for problem_id, testcases in result.all():
+        _case_paths_cache.pop(problem_id, None)
+        try:
+            await asyncio.to_thread(testcase_store.prune_testcases, problem_id, testcases)
+        except (OSError, ValueError) as e:
+            print(f"Warning: fail to prune test case files of problem '{problem_id}': {e}")
+
 
+# Rows per statement when copying a result to duplicates
+DUPLICATE_BATCH_SIZE = 500
 
+
+async def resolve_duplicates(submission_id: str, session: ASession):
+    """
+    Give submissions queued as duplicates of submission_id its result, in batched writes.
+    If it was not judged (e.g. deleted), they are queued to be judged themselves.
+    """
+    result = await session.execute(
+        select(JudgeRequest.submission_id).where(JudgeRequest.duplicate_of == submission_id)
+    )
+    duplicate_ids = result.scalars().all()
+    if not duplicate_ids:
+        return
+    
+    # Result was written by the result writer, not this session
+    submission = await session.get(SubmissionItem, submission_id, populate_existing=True)
+    judged = submission is not None and submission.status != SubmissionStatus.PENDING
+    log = await session.get(SubmissionLog, submission_id, populate_existing=True) if judged else None
+    
+    for start in range(0, len(duplicate_ids), DUPLICATE_BATCH_SIZE):
+        batch = duplicate_ids[start:start + DUPLICATE_BATCH_SIZE]
+        if judged:
+            # Only those still waiting: any other was rejudged or judged meanwhile.
+            await session.execute(
+                update(SubmissionItem)
+                .where(SubmissionItem.id.in_(batch))
+                .where(SubmissionItem.status == SubmissionStatus.PENDING)
+                # Not those rejudged on their own meanwhile
+                .where(SubmissionItem.id.in_(
+                    select(JudgeRequest.submission_id).where(JudgeRequest.duplicate_of == submission_id)
+                ))
+                .values(status=submission.status, score=submission.score, counts=submission.counts)
+            )
+            if log is not None:
+                await session.execute(
+                    delete(SubmissionLog).where(SubmissionLog.submission_id.in_(batch))
+                )
+                await session.execute(insert(SubmissionLog), [
+                    {"submission_id": duplicate_id, "details": log.details,
+                     "score": log.score, "counts": log.counts, "judge_hash": log.judge_hash}
+                    for duplicate_id in batch
+                ])
+        await session.execute(
+            update(JudgeRequest)
+            .where(JudgeRequest.submission_id.in_(batch))
+            .values(duplicate_of=None)
+        )
+        if judged:
+            await update_solved(session, batch)
+        await session.commit()
+        
+        
+async def judge_submission(submission_id: str):
+    """
+    Claim and judge one pending submission in its own db session.
+    Submissions that can not be judged are marked as error, so they leave the queue.
+    """
+    async with get_async_session() as session:
+        if not await claim_submission(submission_id, session):
+            return
+        heartbeat = asyncio.create_task(keep_claim(submission_id))
+        try:
+            submission = await session.get(SubmissionItem, submission_id)
+            # Already judged (e.g. by another worker) or deleted.
+            if submission is None or submission.status != SubmissionStatus.PENDING:
+                return
+            # A rejudge while judging bumps it: the result of this run is then dropped
+            generation = submission.judge_generation
+            problem = await session.get(ProblemItem, submission.problem_id)
+            judge_config = await session.get(JudgeConfig, submission.problem_id)
+            judge_request = await session.get(JudgeRequest, submission_id)
+            
+            try:
+                if problem is None:
+                    raise HTTPException(
+                        status_code=404,
+                        detail=f"Problem with ID {submission.problem_id} not found"
+                    )
+                testcases = await load_case_paths(problem, session)
+                await test_code(
+                    session=session,
+                    submission_id=submission.id,
+                    code=submission.code,
+                    testcases=testcases,
+                    language=submission.language,
+                    time_limit=problem.time_limit,
+                    memory_limit=problem.memory_limit,
+                    case_parallelism=judge_config.case_parallelism if judge_config else None,
+                    stop_on_failure=judge_config.stop_on_failure if judge_config else False,
+                    checker=judge_config.checker if judge_config else None,
+                    # Only rejudges have results to keep
+                    incremental=judge_request is not None and not judge_request.full_rejudge,
+                    # A full rejudge is asked for to run the code again
+                    use_verdict_cache=(
+                        (judge_config is None or judge_config.verdict_cache) and
+                        not (judge_request and judge_request.full_rejudge)
+                    ),
+                    generation=generation
+                )
+            except HTTPException as e:
+                print(f"Judge Error ({submission_id}): {e.detail}")
+                await session.rollback()
+                result = await session.execute(
+                    update(SubmissionItem)
+                    .where(SubmissionItem.id == submission_id)
+                    .where(SubmissionItem.judge_generation == generation)
+                    .values(status=SubmissionStatus.ERROR, score=0)
+                    .returning(SubmissionItem.id)
+                )
+                if result.first() is not None:
+                    await update_solved(session, [submission_id])
+                await session.commit()
+        finally:
+            try:
+                await resolve_duplicates(submission_id, session)
+            except SQLAlchemyError as e:
+                await session.rollback()
+                print(f"Warning: fail to resolve duplicates of submission '{submission_id}': {e}")
+            heartbeat.cancel()
+            await release_submission(submission_id, session)
+            
+            
+judge_scheduler = JudgeScheduler()
@@ -0,0 +1,103 @@
+from typing import List, Dict, Optional
+import sys
+import time
+from ..db.schemas import LanguageItem, parse_command, check_file_ext
+from ..db.database import ASession
+from sqlmodel import select
+from config.settings import JUDGE_LANGUAGE_RELOAD_INTERVAL
+
+
+# Commands are templates, run in the judge workspace with these placeholders:
+#   {src}  source file, "main" + file_ext
+#   {exe}  compiled binary, "main"
+#   {dir}  workspace directory
+# Plain names work as well ("g++ main.cpp -o main", "./main"), since the
+# workspace is the working directory. Other placeholders are rejected (see
+# schemas.parse_command), literal braces are written "{{" and "}}".
+# time_factor / memory_factor of a language multiply the problem's limits.
+
+BUILTIN_LANGUAGES: Dict[str, LanguageItem] = {
+    "python": LanguageItem(name="python", file_ext=".py", run_cmd="python {src}"),
+    "C++": LanguageItem(name="C++", file_ext=".cpp", complie_cmd="g++ {src} -o {exe}", run_cmd="{exe}"),
+}
+
+# Interpreters that may be replaced by a fork of the sandbox server's warm interpreter.
+ZYGOTE_INTERPRETERS = ("python", "python3", sys.executable)
+
+
+class Executor:
+    """
+    How to build and run one language, with its commands parsed once.
+    """
+    def __init__(self, language: LanguageItem):
+        self.name = language.name
+        check_file_ext(language.file_ext)
+        self.src_name = "main" + language.file_ext
+        self.exe_name = "main"
+        self.compile_command: Optional[List[str]] = (
+            parse_command(language.complie_cmd) if language.complie_cmd else None
+        )
+        self.run_command: List[str] = parse_command(language.run_cmd)
+        self.time_factor = language.time_factor or 1.0
+        self.memory_factor = language.memory_factor or 1.0
+        # `python {src}`: run in the zygote instead of a new interpreter
+        self.python_zygote = (
+            len(self.run_command) == 2 and
+            self.run_command[0] in ZYGOTE_INTERPRETERS and
+            self.run_command[1] == "{src}"
+        )
+
+    def exec_command(self, work_dir: str) -> List[str]:
+        """
+        Run command with placeholders filled in for a workspace.
+        """
+        paths = {
+            "src": f"{work_dir}/{self.src_name}",
+            "exe": f"{work_dir}/{self.exe_name}",
+            "dir": work_dir,
+        }
+        return [part.format(**paths) for part in self.run_command]
+
+    def limits(self, time_limit: float, memory_limit: int) -> tuple[float, int]:
+        """
+        Problem limits scaled for this language.
+        """
+        return time_limit * self.time_factor, int(memory_limit * self.memory_factor)
+
+
+class LanguageRegistry:
+    """
+    In-memory table of executors: built-in languages, overridden or extended by
+    LanguageItem rows. Rows are loaded again after invalidate(), when an unknown
+    language is asked for, and every JUDGE_LANGUAGE_RELOAD_INTERVAL seconds, since
+    another process (API or judge worker) may have registered or reset them.
+    """
+    def __init__(self, reload_interval: float = JUDGE_LANGUAGE_RELOAD_INTERVAL):
+        self._executors: Dict[str, Executor] = {}
+        self._loaded_at: Optional[float] = None
+        self.reload_interval = reload_interval
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    async def load(self, session: ASession):
+        executors = {name: Executor(language) for name, language in BUILTIN_LANGUAGES.items()}
+        result = await session.execute(select(LanguageItem))
+        for language in result.scalars().all():
+            try:
+                executors[language.name] = Executor(language)
+            except ValueError as e:
+                print(f"Warning: ignore language '{language.name}' with bad command: {e}")
+        self._executors = executors
+        self._loaded_at = time.monotonic()
+
+    async def get(self, name: str, session: ASession) -> Optional[Executor]:
+        if (
+            self._loaded_at is None or name not in self._executors or
+            time.monotonic() - self._loaded_at > self.reload_interval
+        ):
+            await self.load(session)
+        return self._executors.get(name)
+
+
+language_registry = LanguageRegistry()
@@ -0,0 +1,181 @@
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import time
+from sqlmodel import update
+from sqlalchemy.dialects.sqlite import insert
+from ..db.schemas import SubmissionItem, SubmissionLog, SubmissionStatus, VerdictMemo
+from ..db.database import get_async_session
+from ..db.solved import update_solved
+from . import verdict_cache
+from config.settings import JUDGE_RESULT_WRITE_WINDOW, JUDGE_RESULT_BATCH_SIZE
+
+
+# Judge results are not committed one by one: each commit takes SQLite's write
+# lock, so many small ones from busy judge workers queue up behind each other.
+# The writer collects results finished within JUDGE_RESULT_WRITE_WINDOW and
+# writes them (submission, log, verdict cache entry) in one transaction of
+# multi-row upserts, in a session of its own.
+
+
+class ResultWriter:
+    """
+    Batches judge results into one transaction per write window.
+    write() returns once its result is committed, so a judged submission is
+    never reported done before it is in db.
+    """
+    def __init__(
+        self,
+        window: float = JUDGE_RESULT_WRITE_WINDOW,
+        batch_size: int = JUDGE_RESULT_BATCH_SIZE,
+    ):
+        self.window = window
+        self.batch_size = max(1, batch_size)
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        # Batch being written, written again by stop() if interrupted
+        self._writing: List[Tuple[Dict, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+        
+    async def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        
+    async def stop(self):
+        """
+        Stop batching, writing whatever is left first.
+        """
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._wakeup = None
+        left, self._writing, self._pending = self._writing + self._pending, [], []
+        await self._write_batch(left)
+        
+    async def write(self, result: Dict):
+        """
+        Write one result: {"submission_id", "status", "score", "counts", "details",
+        "judge_hash"}, "memo" (verdict_cache.memo_row) to cache it, and "generation"
+        (judge_generation it was judged at) to drop it if rejudged since.
+        """
+        if not self.running:
+            await self._persist([result])
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((result, future))
+        self._wakeup.set()
+        # Cancelling the judge task does not drop its result, stop() writes it
+        await asyncio.shield(future)
+        
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let results finishing about now join the batch
+            if len(self._pending) < self.batch_size:
+                await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            self._writing = self._pending[:self.batch_size]
+            self._pending = self._pending[self.batch_size:]
+            if self._pending:
+                self._wakeup.set()
+            await self._write_batch(self._writing)
+            self._writing = []
+            
+    async def _write_batch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        batch = [(result, future) for result, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            await self._persist([result for result, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Don't fail every result of the batch for one bad result
+                print(f"Warning: fail to write {len(batch)} judge results at once, writing them one by one: {e}")
+                for item in batch:
+                    await self._write_batch([item])
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+                
+    async def _persist(self, results: List[Dict]):
+        async with get_async_session() as session:
+            # One statement per result, all in one transaction: results of
+            # submissions deleted (problem deleted, reset) or rejudged while judged
+            # match no row and are dropped.
+            written = []
+            for result in results:
+                statement = update(SubmissionItem).where(SubmissionItem.id == result["submission_id"])
+                if result.get("generation") is not None:
+                    # Rejudged while judged: this result is outdated
+                    statement = statement.where(SubmissionItem.judge_generation == result["generation"])
+                updated = await session.execute(
+                    statement
+                    .values(
+                        status=SubmissionStatus(result["status"]),
+                        score=result["score"],
+                        # Test cases may have changed since submitted
+                        counts=result["counts"],
+                    )
+                    .returning(SubmissionItem.id)
+                )
+                if updated.first() is not None:
+                    written.append(result)
+            
+            if written:
+                # If submission_log already exists (rejudge), update it; or add new one.
+                statement = insert(SubmissionLog).values([
+                    {
+                        "submission_id": result["submission_id"],
+                        "details": result["details"],
+                        "score": result["score"],
+                        "counts": result["counts"],
+                        "judge_hash": result["judge_hash"],
+                    }
+                    for result in written
+                ])
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=["submission_id"],
+                    set_={
+                        "details": statement.excluded.details,
+                        "score": statement.excluded.score,
+                        "counts": statement.excluded.counts,
+                        "judge_hash": statement.excluded.judge_hash,
+                    }
+                ))
+            
+            # Still right for their key, even if the submission is gone
+            memo_rows = {
+                result["memo"]["key"]: {**result["memo"], "last_used": time.time()}
+                for result in results if result.get("memo") is not None
+            }
+            if memo_rows:
+                statement = insert(VerdictMemo).values(list(memo_rows.values()))
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={
+                        "status": statement.excluded.status,
+                        "score": statement.excluded.score,
+                        "details": statement.excluded.details,
+                        "last_used": statement.excluded.last_used,
+                    }
+                ))
+            await update_solved(session, [result["submission_id"] for result in written])
+            await session.commit()
+            
+            if memo_rows:
+                await verdict_cache.evict_if_due(session, len(memo_rows))
+                
+                
+result_writer = ResultWriter()
@@ -0,0 +1,170 @@
+from typing import List, Dict, Optional
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+from config.settings import JUDGE_RUN_UID, JUDGE_RUN_GID
+
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_server.py")
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+# (uid, gid) judged programs run as, None if the judge can't switch user
+RUN_USER = (JUDGE_RUN_UID, JUDGE_RUN_GID) if JUDGE_RUN_UID is not None and os.geteuid() == 0 else None
+
+
+def _searchable_by_others(path: str) -> bool:
+    """
+    Whether every directory up to path may be entered by any user.
+    """
+    path = os.path.realpath(path)
+    while True:
+        if not os.stat(path).st_mode & 0o001:
+            return False
+        parent = os.path.dirname(path)
+        if parent == path:
+            return True
+        path = parent
+
+
+class SandboxRun:
+    """
+    A process started by the fork server.
+    """
+    def __init__(self, sandbox: "Sandbox", run_id: int):
+        self.sandbox = sandbox
+        self.id = run_id
+        self.pid: Optional[int] = None
+        # Wait status and rusage, set when reaped by the server
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self._started = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def kill(self):
+        self.sandbox._send({"kill": self.id})
+
+
+class Sandbox:
+    """
+    Client of the fork server in sandbox_server.py. Thread safe, shared by all case threads.
+    The server is started on first use and restarted if it dies.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._server: Optional[subprocess.Popen] = None
+        self._sock: Optional[socket.socket] = None
+        self._runs: Dict[int, SandboxRun] = {}
+        self._next_id = 0
+
+    def _ensure_started(self):
+        if self._server is not None and self._server.poll() is None:
+            return
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self._server = subprocess.Popen(
+                [sys.executable, SERVER_PATH, str(child_sock.fileno())],
+                pass_fds=[child_sock.fileno()],
+                stdin=subprocess.DEVNULL,
+            )
+        finally:
+            child_sock.close()
+        self._sock = parent_sock
+        if RUN_USER is None:
+            print("Warning: judged programs run as the judge's own user, they can reach checkers and outputs")
+        elif not _searchable_by_others(sys.prefix):
+            print(
+                f"Warning: {sys.prefix} is out of reach of user {RUN_USER[0]}, "
+                "judged Python programs can only import preloaded modules"
+            )
+        threading.Thread(
+            target=self._read_replies, args=(parent_sock,),
+            name="sandbox-reader", daemon=True
+        ).start()
+
+    def _send(self, message: Dict, fds: List[int] = ()):
+        with self._lock:
+            socket.send_fds(self._sock, [json.dumps(message).encode()], list(fds))
+
+    def spawn(
+        self,
+        argv: List[str],
+        fds: List[int],
+        limits: Dict,
+        cwd: Optional[str] = None,
+        python: bool = False,
+        user: Optional[tuple] = None,
+    ) -> SandboxRun:
+        """
+        Start argv with fds as its stdin, stdout and stderr, under kernel limits
+        {"cpu": seconds, "as": bytes} and pinned to limits["cores"] if given.
+        Return once the child is forked.
+        If python, argv is ["python", script] and script runs in a fork of the
+        server's interpreter instead of a new one.
+        If user ((uid, gid), e.g. RUN_USER) is given, the child runs as that user.
+        """
+        with self._lock:
+            self._ensure_started()
+            self._next_id += 1
+            run = SandboxRun(self, self._next_id)
+            self._runs[run.id] = run
+            socket.send_fds(self._sock, [json.dumps({
+                "id": run.id,
+                "argv": argv,
+                "cwd": cwd,
+                "limits": limits,
+                "user": user,
+                "python": python,
+            }).encode()], fds)
+
+        run._started.wait()
+        if run.error is not None:
+            raise OSError(run.error)
+        return run
+
+    def _read_replies(self, sock: socket.socket):
+        while True:
+            try:
+                message = sock.recv(MAX_MESSAGE_SIZE)
+            except OSError:
+                message = b""
+            if not message:
+                break
+            reply = json.loads(message)
+            with self._lock:
+                run = self._runs.get(reply["id"])
+                if run is not None and "status" in reply:
+                    del self._runs[reply["id"]]
+            if run is None:
+                continue
+            if "pid" in reply:
+                run.pid = reply["pid"]
+                run._started.set()
+            else:
+                run.result = reply
+                run._done.set()
+
+        # Server died: fail everything still waiting on it.
+        runs = []
+        with self._lock:
+            if self._sock is sock:
+                runs = list(self._runs.values())
+                self._runs.clear()
+                self._server = None
+        for run in runs:
+            run.error = "sandbox server exited"
+            run._started.set()
+            run._done.set()
+        sock.close()
+
+
+sandbox = Sandbox()
@@ -0,0 +1,217 @@
+"""
+Fork server that starts judged processes, run by app.core.sandbox.
+
+Children are forked from this small process instead of the judge process, so
+their peak RSS from wait4 starts from a few MB rather than from the size of the
+API process. Kernel limits (RLIMIT_CPU, RLIMIT_AS) are applied in the child
+before exec, so no polling is needed while it runs. Given a "user", the child
+drops to that uid and gid last, after chdir and limits.
+
+It is also a zygote for Python submissions: with "python": true the child does
+not exec an interpreter but runs argv[1] in the already initialized one, so a
+case costs a fork instead of a full interpreter startup.
+
+Protocol, over a SOCK_SEQPACKET socket given as argv[1], one JSON object per message:
+    -> {"id": n, "argv": [...], "cwd": str, "limits": {"cpu": s, "as": bytes, "cores": [...]},
+        "user": [uid, gid] or null, "python": bool}
+       with stdin, stdout and stderr of the child attached as fds
+    <- {"id": n, "pid": pid}                    once forked
+    <- {"id": n, "status": wait status, "utime": s, "stime": s, "maxrss": KB}
+    -> {"kill": n}                              kill process group of run n
+The process group of a run is also killed once its main process is reaped, so
+nothing it started outlives it (e.g. to meddle with the next case or the checker).
+
+This file is run as a script: import nothing from app here.
+"""
+import gc
+import importlib
+import json
+import os
+import resource
+import runpy
+import select
+import signal
+import socket
+import sys
+import traceback
+
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+# Imported once here, so Python submissions get them for free.
+PRELOAD_MODULES = (
+    "math", "collections", "itertools", "functools", "heapq", "bisect", "re",
+    "string", "random", "fractions", "decimal", "io", "typing", "dataclasses",
+    # Used by runpy, children may not be able to read the standard library (see RUN_USER)
+    "pkgutil",
+)
+
+
+def apply_limits(limits: dict):
+    # Soft limit sends SIGXCPU, hard limit SIGKILL one second later.
+    if limits.get("cpu"):
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu"], limits["cpu"] + 1))
+    if limits.get("as"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["as"], limits["as"]))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    # CPU affinity
+    if limits.get("cores"):
+        os.sched_setaffinity(0, limits["cores"])
+
+
+def drop_privileges(user: list):
+    uid, gid = user
+    os.setgroups([])
+    os.setgid(gid)
+    os.setuid(uid)
+
+
+def run_python(script: str) -> int:
+    """
+    Run script as __main__ in this interpreter, like `python script`. Return exit code.
+    """
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    # Fresh std streams on the redirected fds
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", closefd=False, buffering=1, errors="backslashreplace")
+    # Don't let all children share the zygote's random state
+    if "random" in sys.modules:
+        sys.modules["random"].seed()
+
+    exit_code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            exit_code = exit_code or 1
+    return exit_code
+
+
+def start_child(request: dict, fds: list) -> int:
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    # In child: never return to the server loop.
+    try:
+        # Own process group, so kill also reaches its children.
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+        os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        apply_limits(request.get("limits", {}))
+        if request.get("user"):
+            drop_privileges(request["user"])
+        if request.get("python"):
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            os._exit(run_python(request["argv"][1]))
+        os.execvp(request["argv"][0], request["argv"])
+    except BaseException as e:
+        try:
+            os.write(2, f"sandbox: failed to start {request['argv'][0]}: {e}\n".encode())
+        except OSError:
+            pass
+    finally:
+        os._exit(127)
+
+
+def send(sock: socket.socket, message: dict):
+    sock.send(json.dumps(message).encode())
+
+
+def main(sock_fd: int):
+    sock = socket.socket(fileno=sock_fd)
+
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    # Keep preloaded objects out of gc, so children don't copy their pages on collection.
+    gc.freeze()
+
+    # SIGCHLD only wakes select up, children are reaped in the loop.
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    running = {}  # pid -> request id
+    try:
+        while True:
+            readable, _, _ = select.select([sock, wakeup_r], [], [])
+            if wakeup_r in readable:
+                os.read(wakeup_r, 4096)
+
+            if sock in readable:
+                message, fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE_SIZE, 3)
+                # Judge process has gone away
+                if not message:
+                    break
+                request = json.loads(message)
+
+                if "kill" in request:
+                    for pid, request_id in running.items():
+                        if request_id == request["kill"]:
+                            try:
+                                os.killpg(pid, signal.SIGKILL)
+                            except OSError:
+                                pass
+                else:
+                    try:
+                        pid = start_child(request, fds)
+                    finally:
+                        for fd in fds:
+                            os.close(fd)
+                    running[pid] = request["id"]
+                    send(sock, {"id": request["id"], "pid": pid})
+
+            # Reap exited children and report their usage
+            while running:
+                try:
+                    pid, status, usage = os.wait4(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                request_id = running.pop(pid, None)
+                if request_id is None:
+                    continue
+                # Whatever it left running (same group, id is not reused while it exists)
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                send(sock, {
+                    "id": request_id,
+                    "status": status,
+                    "utime": usage.ru_utime,
+                    "stime": usage.ru_stime,
+                    "maxrss": usage.ru_maxrss,
+                })
+    finally:
+        for pid in running:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
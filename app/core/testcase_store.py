@@ -0,0 +1,163 @@
+from typing import List, Dict, Optional
+import hashlib
+import os
+import shutil
+import uuid
+from pydantic import BaseModel
+from config.settings import PROBLEM_DATA_PATH
+
+
+# Test case data lives in files, the db only keeps metadata:
+#   {PROBLEM_DATA_PATH}/{problem_id}/{sha256}   input or output content
+# ProblemItem.testcases holds one entry per case:
+#   {"input_sha256": str, "input_size": int, "output_sha256": str, "output_size": int}
+# Files are named by content hash, so identical inputs/outputs are stored once
+# and updating a problem never changes a file a running case has open.
+# Files no longer used are not removed on update: judge runs started before may
+# still read them. prune_testcases() removes them once no run can (see
+# evaluation.prune_testcase_files).
+# Entries of old dbs still hold {"input": str, "output": str} inline; they are
+# moved to files the first time the problem is judged (see migrate_testcases).
+
+
+def problem_dir(problem_id: str) -> str:
+    """
+    Directory of problem_id, always right under PROBLEM_DATA_PATH.
+    Raise ValueError for ids that would lead elsewhere (e.g. "../x", "/x").
+    """
+    root = os.path.abspath(PROBLEM_DATA_PATH)
+    path = os.path.abspath(os.path.join(root, problem_id))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"Invalid problem id '{problem_id}'")
+    return path
+
+
+def data_path(problem_id: str, sha256: str) -> str:
+    return os.path.join(problem_dir(problem_id), sha256)
+
+
+def is_stored(case: Dict) -> bool:
+    """
+    Whether case is a metadata entry (and not a legacy inline one).
+    """
+    return "input_sha256" in case
+
+
+def _write_data(problem_id: str, content: bytes) -> Dict:
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = data_path(problem_id, sha256)
+    if not (os.path.exists(path) and os.path.getsize(path) == len(content)):
+        # Write aside, then move in, so a half written file is never used.
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    return {"sha256": sha256, "size": len(content)}
+
+
+def store_testcases(problem_id: str, testcases: List) -> List[Dict]:
+    """
+    Write inputs and outputs of testcases ({"input", "output"} dicts or SampleItem)
+    to files, and return their metadata entries to keep in db.
+    Blocking, run it in a thread for large data.
+    """
+    os.makedirs(problem_dir(problem_id), exist_ok=True)
+    entries = []
+    for case in testcases:
+        if isinstance(case, BaseModel):
+            case = case.model_dump()
+        if is_stored(case):
+            entries.append(case)
+            continue
+        input_data = _write_data(problem_id, case["input"].encode("utf-8"))
+        output_data = _write_data(problem_id, case["output"].encode("utf-8"))
+        entries.append({
+            "input_sha256": input_data["sha256"],
+            "input_size": input_data["size"],
+            "output_sha256": output_data["sha256"],
+            "output_size": output_data["size"],
+        })
+    return entries
+
+
+def prune_testcases(problem_id: str, entries: List[Dict]):
+    """
+    Remove files of problem_id not used by entries.
+    """
+    used = set()
+    for case in entries:
+        if is_stored(case):
+            used.add(case["input_sha256"])
+            used.add(case["output_sha256"])
+    try:
+        names = os.listdir(problem_dir(problem_id))
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name not in used and ".tmp-" not in name:
+            try:
+                os.remove(os.path.join(problem_dir(problem_id), name))
+            except OSError:
+                pass
+
+
+def delete_testcases(problem_id: Optional[str] = None):
+    """
+    Remove files of problem_id, or of all problems if None.
+    """
+    path = problem_dir(problem_id) if problem_id is not None else PROBLEM_DATA_PATH
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def case_hash(case: Dict) -> str:
+    """
+    Content hash of a stored case: changes whenever its input or output does.
+    """
+    return hashlib.sha256(f"{case['input_sha256']}:{case['output_sha256']}".encode()).hexdigest()
+
+
+def case_paths(problem_id: str, case: Dict) -> Dict:
+    """
+    Paths of input and output file of a stored case, checked against the sizes in db.
+    Return {"input_path": str, "output_path": str, "hash": case_hash}.
+    Raise ValueError if a file is missing or has been changed.
+    """
+    paths = {"hash": case_hash(case)}
+    for kind in ("input", "output"):
+        path = data_path(problem_id, case[f"{kind}_sha256"])
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            raise ValueError(f"{kind} file {case[f'{kind}_sha256']} of problem '{problem_id}' is missing")
+        if size != case[f"{kind}_size"]:
+            raise ValueError(f"{kind} file {case[f'{kind}_sha256']} of problem '{problem_id}' is corrupted")
+        paths[f"{kind}_path"] = path
+    return paths
+
+
+def load_testcases(problem_id: str, testcases: List[Dict]) -> List[Dict]:
+    """
+    Read test cases back as {"input", "output"} dicts, e.g. for problem details and export.
+    """
+    loaded = []
+    for case in testcases:
+        if not is_stored(case):
+            loaded.append({"input": case["input"], "output": case["output"]})
+            continue
+        paths = case_paths(problem_id, case)
+        with open(paths["input_path"], "r", encoding="utf-8", newline="") as f:
+            input_text = f.read()
+        with open(paths["output_path"], "r", encoding="utf-8", newline="") as f:
+            output_text = f.read()
+        loaded.append({"input": input_text, "output": output_text})
+    return loaded
+
+
+def migrate_testcases(problem_id: str, testcases: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Move legacy inline test cases to files.
+    Return new metadata entries, or None if all cases are stored already.
+    """
+    if all(is_stored(case) for case in testcases):
+        return None
+    return store_testcases(problem_id, testcases)
@@ -0,0 +1,89 @@
+from typing import List, Dict, Optional
+import hashlib
+import json
+from sqlmodel import select, delete, func
+from sqlalchemy.exc import SQLAlchemyError
+from ..db.schemas import VerdictMemo
+from ..db.database import ASession
+from config.settings import VERDICT_CACHE_MAX_ENTRIES
+
+
+# Results of judged code, in the VerdictMemo table (so shared by all judge workers),
+# keyed by hash of (normalized source + judge settings, language, test case hashes).
+# Code resubmitted unchanged gets the result at once instead of being run again.
+# Problems whose results vary between runs turn it off with JudgeConfig.verdict_cache.
+
+verdict_cache_stats: Dict[str, float] = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    # Estimated: CPU time of the cases of each hit
+    "saved_seconds": 0.0,
+}
+
+# Evict once every this many stores, not on each one
+EVICT_INTERVAL = 100
+_stores_since_evict = 0
+
+
+def normalize_source(code: str) -> str:
+    """
+    Source with line endings and trailing whitespace at its end normalized, which
+    don't change what it does. Whitespace elsewhere may (e.g. inside a string).
+    """
+    return code.replace("\r\n", "\n").rstrip() + "\n"
+
+
+def cache_key(settings_hash: str, language: str, testcase_hashes: List[str], stop_on_failure: bool) -> str:
+    """
+    settings_hash covers the normalized source and everything else a result
+    depends on (commands, limits, checker), testcase_hashes the cases in order.
+    With stop_on_failure, cases after a failure are SKIP instead of run.
+    """
+    payload = json.dumps([settings_hash, language, testcase_hashes, stop_on_failure])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def lookup(key: str, session: ASession) -> Optional[VerdictMemo]:
+    """
+    Cached result, if any. Write it back (memo_row) on use to keep it from eviction.
+    """
+    memo = await session.get(VerdictMemo, key)
+    if memo is None:
+        verdict_cache_stats["misses"] += 1
+        return None
+    verdict_cache_stats["hits"] += 1
+    verdict_cache_stats["saved_seconds"] += sum(case.get("time", 0.0) for case in memo.details)
+    return memo
+
+
+def memo_row(key: str, status: str, score: int, details: List[Dict]) -> Dict:
+    """
+    Entry to write with a result (see result_writer.py); last_used is set when written.
+    """
+    return {"key": key, "status": status, "score": score, "details": details}
+
+
+async def evict_if_due(session: ASession, stored: int):
+    """
+    Count stored entries, remove least recently used ones above
+    VERDICT_CACHE_MAX_ENTRIES once every EVICT_INTERVAL stores.
+    """
+    global _stores_since_evict
+    _stores_since_evict += stored
+    if _stores_since_evict < EVICT_INTERVAL:
+        return
+    _stores_since_evict = 0
+    try:
+        result = await session.execute(select(func.count(VerdictMemo.key)))
+        excess = result.scalar_one() - VERDICT_CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+        oldest = select(VerdictMemo.key).order_by(VerdictMemo.last_used).limit(excess)
+        await session.execute(delete(VerdictMemo).where(VerdictMemo.key.in_(oldest)))
+        await session.commit()
+        verdict_cache_stats["evictions"] += excess
+    except SQLAlchemyError as e:
+        # Only costs space, try again next time
+        await session.rollback()
+        print(f"Warning: fail to evict verdict cache entries: {e}")
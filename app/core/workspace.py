@@ -0,0 +1,108 @@
+import os
+import shutil
+import uuid
+from typing import Optional
+from config.settings import JUDGE_WORKSPACE_PATH
+
+
+# Every judge run gets its own directory under JUDGE_WORKSPACE_PATH (tmpfs by default):
+#   {JUDGE_WORKSPACE_PATH}/{pid}-{submission_id}-{random}/
+# holding source and binaries. It is also the working directory of the judged
+# program, so whatever the judge relies on (checker, case outputs given to it)
+# is kept apart, in a private directory:
+#   {JUDGE_WORKSPACE_PATH}/.private/{pid}-{random}/
+# The judged program runs as another user (sandbox.RUN_USER), who is given its
+# workspace once source and binaries are in place (see hand_over), but can't
+# list other workspaces or enter .private at all. The pid prefix tells which process owns a
+# directory, so leftovers of a crashed process can be removed.
+
+PRIVATE_ROOT = os.path.join(JUDGE_WORKSPACE_PATH, ".private")
+# Workspaces are entered by name, never listed, by judged programs
+WORKSPACE_ROOT_MODE = 0o711
+PRIVATE_ROOT_MODE = 0o700
+
+
+def _make_root(path: str, mode: int):
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+    # Fixed up also when left by an older version or another user
+    if os.stat(path).st_mode & 0o777 != mode:
+        os.chmod(path, mode)
+
+
+class Workspace:
+    """
+    Directory of one judge run, removed as a whole by cleanup().
+    """
+    def __init__(self, submission_id: str):
+        _make_root(JUDGE_WORKSPACE_PATH, WORKSPACE_ROOT_MODE)
+        _make_root(PRIVATE_ROOT, PRIVATE_ROOT_MODE)
+        self.path = os.path.abspath(os.path.join(
+            JUDGE_WORKSPACE_PATH, f"{os.getpid()}-{submission_id}-{uuid.uuid4().hex[:8]}"
+        ))
+        os.mkdir(self.path, 0o755)
+        self.private_path = os.path.abspath(os.path.join(
+            PRIVATE_ROOT, f"{os.getpid()}-{uuid.uuid4().hex}"
+        ))
+        os.mkdir(self.private_path, 0o700)
+
+    def file(self, name: str) -> str:
+        """
+        Absolute path of file name in workspace.
+        """
+        return os.path.join(self.path, name)
+
+    def private_file(self, name: str) -> str:
+        """
+        Absolute path of file name in the private directory, out of the program's reach.
+        """
+        return os.path.join(self.private_path, name)
+
+    def hand_over(self, user: Optional[tuple]):
+        """
+        Make the workspace owned by user ((uid, gid)), so the judged program can
+        write scratch files in its working directory. Nothing if user is None.
+        """
+        if user is not None:
+            os.chown(self.path, *user)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        shutil.rmtree(self.private_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def cleanup_stale_workspaces():
+    """
+    Remove workspaces left by processes that are gone (e.g. killed while judging).
+    """
+    try:
+        names = os.listdir(JUDGE_WORKSPACE_PATH)
+    except FileNotFoundError:
+        return
+    _remove_stale(JUDGE_WORKSPACE_PATH, names)
+    if os.path.isdir(PRIVATE_ROOT):
+        _remove_stale(PRIVATE_ROOT, os.listdir(PRIVATE_ROOT))
+
+
+def _remove_stale(root: str, names: list):
+    for name in names:
+        pid = name.split("-", 1)[0]
+        if not pid.isdigit() or _pid_alive(int(pid)):
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
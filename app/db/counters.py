@@ -0,0 +1,82 @@
+from sqlalchemy.engine import Connection
+
+
+# List totals are read from counters instead of COUNT(*) over the listed table:
+#   submissioncount  submissions per (user_id, problem_id, status)
+#   rowcount         rows of a table, by table name (useritem)
+# SQLite triggers keep them in the same transaction as every insert, delete and
+# status change, whichever code (or bulk statement) makes it. install() adds
+# missing triggers on startup and then recounts, as rows may have changed
+# while they were missing.
+
+TRIGGERS = {
+    "submissioncount_insert": """
+        CREATE TRIGGER submissioncount_insert AFTER INSERT ON submissionitem
+        BEGIN
+            INSERT INTO submissioncount (user_id, problem_id, status, count)
+            VALUES (NEW.user_id, NEW.problem_id, NEW.status, 1)
+            ON CONFLICT (user_id, problem_id, status) DO UPDATE SET count = count + 1;
+        END
+    """,
+    "submissioncount_delete": """
+        CREATE TRIGGER submissioncount_delete AFTER DELETE ON submissionitem
+        BEGIN
+            UPDATE submissioncount SET count = count - 1
+            WHERE user_id = OLD.user_id AND problem_id = OLD.problem_id AND status = OLD.status;
+        END
+    """,
+    "submissioncount_update": """
+        CREATE TRIGGER submissioncount_update AFTER UPDATE OF user_id, problem_id, status ON submissionitem
+        WHEN OLD.user_id IS NOT NEW.user_id OR OLD.problem_id IS NOT NEW.problem_id OR OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE submissioncount SET count = count - 1
+            WHERE user_id = OLD.user_id AND problem_id = OLD.problem_id AND status = OLD.status;
+            INSERT INTO submissioncount (user_id, problem_id, status, count)
+            VALUES (NEW.user_id, NEW.problem_id, NEW.status, 1)
+            ON CONFLICT (user_id, problem_id, status) DO UPDATE SET count = count + 1;
+        END
+    """,
+    "rowcount_useritem_insert": """
+        CREATE TRIGGER rowcount_useritem_insert AFTER INSERT ON useritem
+        BEGIN
+            INSERT INTO rowcount (name, count) VALUES ('useritem', 1)
+            ON CONFLICT (name) DO UPDATE SET count = count + 1;
+        END
+    """,
+    "rowcount_useritem_delete": """
+        CREATE TRIGGER rowcount_useritem_delete AFTER DELETE ON useritem
+        BEGIN
+            UPDATE rowcount SET count = count - 1 WHERE name = 'useritem';
+        END
+    """,
+}
+
+RECOUNT = [
+    "DELETE FROM submissioncount",
+    """
+    INSERT INTO submissioncount (user_id, problem_id, status, count)
+    SELECT user_id, problem_id, status, COUNT(*) FROM submissionitem
+    GROUP BY user_id, problem_id, status
+    """,
+    "DELETE FROM rowcount WHERE name = 'useritem'",
+    "INSERT INTO rowcount (name, count) SELECT 'useritem', COUNT(*) FROM useritem",
+]
+
+
+def install(connection: Connection) -> list[str]:
+    """
+    Create missing counter triggers and recount if any was missing. Return what was done.
+    Run with AsyncConnection.run_sync, after create_all, in the same transaction.
+    """
+    result = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    existing = set(result.scalars().all())
+    done = []
+    for name, ddl in TRIGGERS.items():
+        if name not in existing:
+            connection.exec_driver_sql(ddl)
+            done.append(f"add trigger {name}")
+    if done:
+        for statement in RECOUNT:
+            connection.exec_driver_sql(statement)
+        done.append("recount submissions and users")
+    return done
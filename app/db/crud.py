@@ -1,14 +1,70 @@
 from ..db.schemas import *
 from typing import List, Tuple, Any
 from ..db.database import ASession
-from sqlmodel import select, func, delete
-from ..core.evaluation import test_code
+from ..db.solved import rebuild_solved
+from sqlmodel import select, func, delete, update, insert
+from sqlalchemy import literal_column
+from ..core.evaluation import judge_scheduler, prune_testcase_files
+from ..core import testcase_store
+from ..core.languages import language_registry
 from ..core.errors import HTTPException
 import asyncio
+import base64
+import binascii
+import time
 import uuid
 from sqlalchemy.orm import selectinload
 
-PROBLEM_DATA_PATH = "data/problems"
+
+# ============================= Paging ============================= #
+
+# Lists are ordered by an increasing key (rowid, the arrival order, or an
+# autoincrement id). With a cursor a page starts right after the last key of the
+# previous page, an index seek however deep the page; page / page_size still
+# work as offsets. A cursor is the key, base64 encoded to keep it opaque.
+
+def encode_cursor(key: int) -> str:
+    return base64.urlsafe_b64encode(str(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[int]:
+    """
+    Key a cursor starts after, None for the first page ("").
+    """
+    if cursor == "":
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor."
+        )
+
+
+def page_statement(statement, key, page: Optional[int], page_size: Optional[int], cursor: Optional[str]):
+    """
+    Order statement by key and select the page asked for.
+    """
+    statement = statement.order_by(key)
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after is not None:
+            statement = statement.where(key > after)
+        if page_size is not None:
+            statement = statement.limit(page_size)
+    elif page is not None and page_size is not None:
+        statement = statement.offset((page - 1) * page_size).limit(page_size)
+    return statement
+
+
+def next_cursor(keys: List[int], page_size: Optional[int]) -> Optional[str]:
+    """
+    Cursor of the page after the one with keys, None if it was the last page.
+    """
+    if page_size is None or not keys or len(keys) < page_size:
+        return None
+    return encode_cursor(keys[-1])
 
 
 # ============================= Problems ============================= #
@@ -71,8 +127,11 @@ async def get_all_problems_meta(session: ASession):
 # Write problem into db
 async def write_problem(data: ProblemItem, session: ASession) -> None:
     """
-    Write data to db.
+    Write data to db. Test cases are written to files, db keeps their metadata.
     """
+    data.testcases = await asyncio.to_thread(
+        testcase_store.store_testcases, data.id, data.testcases
+    )
     logvisibility = LogVisibility(
         problem_id=data.id
     )
@@ -81,6 +140,22 @@ async def write_problem(data: ProblemItem, session: ASession) -> None:
     await session.commit()
 
 
+async def update_testcases(problem_id: str, testcases: List[SampleItem], session: ASession) -> List[Dict]:
+    """
+    Replace test cases of problem, return their metadata entries.
+    Submissions keep their results until rejudged.
+    """
+    problem = await get_problem_by_id(problem_id, session)
+    problem.testcases = await asyncio.to_thread(
+        testcase_store.store_testcases, problem_id, testcases
+    )
+    session.add(problem)
+    await session.commit()
+    # Files of old test cases, unless a submission is being judged on them
+    await prune_testcase_files(session, [problem_id])
+    return problem.testcases
+
+
 # delete problem from db
 async def delete_problem_db(problem_id: str, session: ASession) -> None:
     """
@@ -95,12 +170,28 @@ async def delete_problem_db(problem_id: str, session: ASession) -> None:
         await session.execute(
             delete(SubmissionLog).where(SubmissionLog.submission_id.in_(submission_delete_ids))
         )
+        await session.execute(
+            delete(JudgeClaim).where(JudgeClaim.submission_id.in_(submission_delete_ids))
+        )
+        await session.execute(
+            delete(JudgeRequest).where(JudgeRequest.submission_id.in_(submission_delete_ids))
+        )
+    result = await session.execute(
+        select(SolvedProblem.user_id).where(SolvedProblem.problem_id == problem_id)
+    )
+    solved_user_ids = result.scalars().all()
     await session.execute(
         delete(SubmissionItem).where(SubmissionItem.problem_id == problem_id)
     )
+    if solved_user_ids:
+        # Users who solved it lose the solve
+        await rebuild_solved(session, solved_user_ids)
     await session.execute(
         delete(LogVisibility).where(LogVisibility.problem_id == problem_id)
     )
+    await session.execute(
+        delete(JudgeConfig).where(JudgeConfig.problem_id == problem_id)
+    )
     await session.execute(
         delete(LogAccess).where(LogAccess.problem_id == problem_id)
     )
@@ -109,6 +200,7 @@ async def delete_problem_db(problem_id: str, session: ASession) -> None:
     )
 
     await session.commit()
+    testcase_store.delete_testcases(problem_id)
         
 
 # Check if problem exist in db.
@@ -125,11 +217,21 @@ async def problem_exists(problem_id: str, session: ASession) -> bool:
 
 # Get whole info of specific problem
 async def get_problem_details(problem_id: str, session: ASession):
+    """
+    Return problem as dict, with test cases read back from their files.
+    """
     result = await session.execute(
         select(ProblemItem).where(ProblemItem.id == problem_id)
     )
     problem = result.scalar_one_or_none()
-    return problem
+    if problem is None:
+        return None
+    
+    problem_dict = problem.model_dump()
+    problem_dict["testcases"] = await asyncio.to_thread(
+        testcase_store.load_testcases, problem.id, problem.testcases
+    )
+    return problem_dict
 
 
 async def get_logvis_by_problem_id(problem_id: str, session: ASession) -> Optional[LogVisibility]:
@@ -144,6 +246,32 @@ async def get_logvis_by_problem_id(problem_id: str, session: ASession) -> Option
             status_code=500,
             detail=f"Server Error."
         )   
+
+
+async def get_judge_config(problem_id: str, session: ASession) -> JudgeConfig:
+    """
+    Return judge options of problem, defaults if never set.
+    """
+    judge_config = await session.get(JudgeConfig, problem_id)
+    if judge_config is None:
+        judge_config = JudgeConfig(problem_id=problem_id)
+    return judge_config
+
+
+async def update_judge_config(
+    problem_id: str, 
+    update: JudgeConfigUpdate, 
+    session: ASession
+) -> JudgeConfig:
+    """
+    Update fields given in request, keep the others.
+    """
+    judge_config = await get_judge_config(problem_id, session)
+    for field, value in update.model_dump(exclude_unset=True).items():
+        setattr(judge_config, field, value)
+    session.add(judge_config)
+    await session.commit()
+    return judge_config
      
      
     
@@ -175,18 +303,21 @@ async def get_user_by_id(user_id: str, session: ASession) -> Optional[UserItem]:
 async def get_user_list_page(
     params: UserListQuery,
     session: ASession
-):
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Return users of the page selected by params, and the cursor of the next page.
+    """
+    rowid = literal_column("useritem.rowid")
     statement = select(
         UserItem.id,
         UserItem.username,
         UserItem.role,
         UserItem.join_time,
         UserItem.submit_count,
-        UserItem.resolve_count
+        UserItem.resolve_count,
+        rowid
     )
-    if params.page is not None and params.page_size is not None:
-        offset = (params.page - 1) * params.page_size
-        statement = statement.offset(offset).limit(params.page_size)
+    statement = page_statement(statement, rowid, params.page, params.page_size, params.cursor)
     result = await session.execute(statement)
     
     rows: List[Tuple[Any, ...]] = result.all()
@@ -199,34 +330,30 @@ async def get_user_list_page(
             "role": row[2],
             "join_time": row[3],
             "submit_count": row[4],
-            "resolve_count": await get_resolve_count(row[1], session)
+            "resolve_count": row[5]
         })
     
-    return user_list
+    return user_list, next_cursor([row[6] for row in rows], params.page_size)
 
 
 async def get_user_counts(session: ASession):
     """
-    Return total number of users
+    Return total number of users, kept in RowCount (see db/counters.py)
     """
-    statement = select(func.count(UserItem.id))
+    statement = select(RowCount.count).where(RowCount.name == "useritem")
     result = await session.execute(statement)
-    total_count = result.scalar_one()
+    total_count = result.scalar_one_or_none() or 0
     
     return total_count
 
 
 async def get_resolve_count(user_id: str, session: ASession):
-    resolved_subquery = (
-        select(SubmissionItem.problem_id).where(
-            (SubmissionItem.user_id == user_id) &
-            (SubmissionItem.status == SubmissionStatus.SUCCESS) &
-            (SubmissionItem.score == SubmissionItem.counts)
-        ).distinct()
-    ).subquery()
-    result = await session.execute(select(func.count()).select_from(resolved_subquery))
+    # Kept up to date by the judge, see db/solved.py
+    result = await session.execute(
+        select(UserItem.resolve_count).where(UserItem.id == user_id)
+    )
     
-    return result.scalar_one()
+    return result.scalar_one_or_none() or 0
 
 
 # ============================= Submissions ============================= #
@@ -248,7 +375,7 @@ async def submit_test_get_id(submit: SubmissionCreate, user_id: str, session: AS
     problem_dict = await get_problem_fields(
         submit.problem_id, 
         session, 
-        ["testcases", "time_limit", "memory_limit"]
+        ["testcases"]
     )
     testcases = problem_dict["testcases"]
     counts = len(testcases)*10
@@ -267,16 +394,8 @@ async def submit_test_get_id(submit: SubmissionCreate, user_id: str, session: AS
     session.add(submission)
     await session.commit()
     
-    # Start async evaluation
-    asyncio.create_task(test_code(
-        session=session,
-        submission_id=submission.id,
-        code=submit.code,
-        testcases=testcases,
-        language=submit.language,
-        time_limit=problem_dict["time_limit"],
-        memory_limit=problem_dict["memory_limit"]
-    ))
+    # Queue for evaluation; if judge is busy it stays pending in db until a worker is free.
+    judge_scheduler.enqueue(submission.id, user_id, JudgePriority.SUBMIT)
     
     return submission.id
 
@@ -319,15 +438,17 @@ async def get_submission_fields(
         return submission_data[0].model_dump()
     
 
-async def get_submission_list(params: SubmissionListQuery, session: ASession):
+async def get_submission_list(params: SubmissionListQuery, session: ASession) -> Tuple[List[Dict], Optional[str]]:
     """
-    Return specific list page of submissions selected by params
+    Return specific list page of submissions selected by params, and the cursor of the next page
     """
+    rowid = literal_column("submissionitem.rowid")
     statement = select(
         SubmissionItem.id,
         SubmissionItem.status,
         SubmissionItem.score,
-        SubmissionItem.counts
+        SubmissionItem.counts,
+        rowid
     )
     if params.user_id is not None:
         statement = statement.where(SubmissionItem.user_id == params.user_id)
@@ -336,10 +457,8 @@ async def get_submission_list(params: SubmissionListQuery, session: ASession):
     if params.status is not None:
         statement = statement.where(SubmissionItem.status == params.status)
     
-    # Control demonstration range by 'page' and 'page_size'
-    if params.page is not None and params.page_size is not None:
-        offset = (params.page - 1)*params.page_size
-        statement = statement.offset(offset).limit(params.page_size)
+    # Control demonstration range by 'page' and 'page_size', or 'cursor'
+    statement = page_statement(statement, rowid, params.page, params.page_size, params.cursor)
         
     result = await session.execute(statement)
     
@@ -360,19 +479,20 @@ async def get_submission_list(params: SubmissionListQuery, session: ASession):
                 "counts": row[3]                
             })
     
-    return result_list
+    return result_list, next_cursor([row[4] for row in rows], params.page_size)
 
 async def get_submission_counts(params: SubmissionListQuery, session: ASession):
     """
-    Return total number of submissions selected by params
+    Return total number of submissions selected by params, summed from the
+    per (user, problem, status) counters of SubmissionCount (see db/counters.py)
     """
-    statement = select(func.count(SubmissionItem.id))
+    statement = select(func.coalesce(func.sum(SubmissionCount.count), 0))
     if params.user_id is not None:
-        statement = statement.where(SubmissionItem.user_id == params.user_id)
+        statement = statement.where(SubmissionCount.user_id == params.user_id)
     if params.problem_id is not None:
-        statement = statement.where(SubmissionItem.problem_id == params.problem_id)
+        statement = statement.where(SubmissionCount.problem_id == params.problem_id)
     if params.status is not None:
-        statement = statement.where(SubmissionItem.status == params.status)
+        statement = statement.where(SubmissionCount.status == params.status)
     
     result = await session.execute(statement)
     
@@ -380,29 +500,124 @@ async def get_submission_counts(params: SubmissionListQuery, session: ASession):
     
     return total_count
 
-async def submission_rejudge(submission_id: str, session: ASession):
-    # Get necessary info of submission
-    submission_dict = await get_submission_fields(
-        submission_id, session,
-        ["code", "language", "problem_id"]
-    )
+async def submission_rejudge(submission_id: str, session: ASession, full: bool = False):
+    # Put submission back to pending, so it survives a restart before being judged.
+    # Unless full, only cases changed since it was last judged are run.
+    submission = await get_submission_by_id(submission_id, session)
+    submission.status = SubmissionStatus.PENDING
+    submission.score = None
+    # A run in progress is outdated: its result is dropped
+    submission.judge_generation += 1
+    session.add(submission)
+    # Rejudges wait behind fresh submissions
+    await session.merge(JudgeRequest(
+        submission_id=submission_id, priority=JudgePriority.REJUDGE, full_rejudge=full
+    ))
+    await session.commit()
     
-    # Get necessary info of problem
-    problem_dict = await get_problem_fields(
-    problem_id=submission_dict["problem_id"], 
-    session=session, 
-    fields=["testcases", "time_limit", "memory_limit"]
+    judge_scheduler.enqueue(submission_id, submission.user_id, JudgePriority.REJUDGE)
+    
+    
+# Rows per statement in bulk rejudge writes (below SQLite's bound parameter limit)
+REJUDGE_BATCH_SIZE = 500
+
+
+async def bulk_rejudge(params: BulkRejudgeRequest, session: ASession) -> Dict:
+    """
+    Put all submissions selected by params back to pending, as one rejudge job.
+    Submissions with the same problem, language and code are judged once: the
+    first of them is queued, the others take its result when it is judged.
+    Unless params.full, only cases changed since a submission was last judged are run.
+    """
+    statement = select(
+        SubmissionItem.id, SubmissionItem.user_id, SubmissionItem.problem_id,
+        SubmissionItem.language, SubmissionItem.code
+    )
+    if params.problem_id is not None:
+        statement = statement.where(SubmissionItem.problem_id == params.problem_id)
+    if params.user_id is not None:
+        statement = statement.where(SubmissionItem.user_id == params.user_id)
+    if params.status is not None:
+        statement = statement.where(SubmissionItem.status == params.status)
+    if params.submission_ids is not None:
+        statement = statement.where(SubmissionItem.id.in_(params.submission_ids))
+    result = await session.execute(statement.order_by(literal_column("submissionitem.rowid")))
+    rows = result.all()
+    
+    job = RejudgeJob(
+        created_at=time.time(),
+        filters=params.model_dump(exclude_none=True, mode="json"),
+        total=len(rows)
     )
+    # (problem, language, code) -> first submission with it
+    representatives: Dict[Tuple[str, str, str], str] = {}
+    requests = []
+    queued = []
+    for submission_id, user_id, problem_id, language, code in rows:
+        key = (problem_id, language, code)
+        duplicate_of = representatives.get(key)
+        if duplicate_of is None:
+            representatives[key] = submission_id
+            queued.append((submission_id, user_id))
+        requests.append({
+            "submission_id": submission_id,
+            "priority": JudgePriority.REJUDGE,
+            "job_id": job.id,
+            "duplicate_of": duplicate_of,
+            "full_rejudge": params.full,
+        })
+    job.judged = len(queued)
+    session.add(job)
     
-    asyncio.create_task(test_code(
-        session=session,
-        submission_id=submission_id,
-        code=submission_dict["code"],
-        testcases=problem_dict["testcases"],
-        language=submission_dict["language"],
-        time_limit=problem_dict["time_limit"],
-        memory_limit=problem_dict["memory_limit"],
-    ))
+    for start in range(0, len(requests), REJUDGE_BATCH_SIZE):
+        batch = requests[start:start + REJUDGE_BATCH_SIZE]
+        batch_ids = [request["submission_id"] for request in batch]
+        await session.execute(
+            update(SubmissionItem)
+            .where(SubmissionItem.id.in_(batch_ids))
+            .values(
+                status=SubmissionStatus.PENDING, score=None,
+                judge_generation=SubmissionItem.judge_generation + 1
+            )
+        )
+        await session.execute(delete(JudgeRequest).where(JudgeRequest.submission_id.in_(batch_ids)))
+        await session.execute(insert(JudgeRequest), batch)
+    await session.commit()
+    
+    for submission_id, user_id in queued:
+        judge_scheduler.enqueue(submission_id, user_id, JudgePriority.REJUDGE)
+        
+    return {
+        "job_id": job.id,
+        "total": job.total,
+        "judged": job.judged,
+        "duplicates": job.total - job.judged,
+    }
+    
+    
+async def get_rejudge_progress(job_id: str, session: ASession) -> Optional[Dict]:
+    """
+    Progress of a rejudge job, None if there is no such job.
+    """
+    job = await session.get(RejudgeJob, job_id)
+    if job is None:
+        return None
+    result = await session.execute(
+        select(func.count(SubmissionItem.id))
+        .join(JudgeRequest, JudgeRequest.submission_id == SubmissionItem.id)
+        .where(JudgeRequest.job_id == job_id)
+        .where(SubmissionItem.status == SubmissionStatus.PENDING)
+    )
+    pending = result.scalar_one()
+    return {
+        "job_id": job.id,
+        "filters": job.filters,
+        "total": job.total,
+        "duplicates": job.total - job.judged,
+        "pending": pending,
+        "finished": job.total - pending,
+        "done": pending == 0,
+    }
     
   
 async def get_submission_log_by_id(submission_id: str, session: ASession) -> Optional[SubmissionLog]:
@@ -458,7 +673,7 @@ async def get_user_by_submission_id(submission_id: str, session: ASession) -> Op
         
         
 # ============================= Submission Logs ============================= #
-async def get_log_access_list(params: LogAccessQuery, session: ASession):
+async def get_log_access_list(params: LogAccessQuery, session: ASession) -> Tuple[List[Dict], Optional[str]]:
     try:
         statement = select(LogAccess)
         if params.user_id is not None:
@@ -466,10 +681,8 @@ async def get_log_access_list(params: LogAccessQuery, session: ASession):
         if params.problem_id is not None:
             statement = statement.where(LogAccess.problem_id == params.problem_id)
         
-        # Control demonstration range by 'page' and 'page_size'
-        if params.page is not None and params.page_size is not None:
-            offset = (params.page - 1)*params.page_size
-            statement = statement.offset(offset).limit(params.page_size)
+        # Control demonstration range by 'page' and 'page_size', or 'cursor'
+        statement = page_statement(statement, LogAccess.id, params.page, params.page_size, params.cursor)
             
         result = await session.execute(statement)
         
@@ -485,7 +698,9 @@ async def get_log_access_list(params: LogAccessQuery, session: ASession):
                 "status": row.status
             })
 
-        return result_list
+        return result_list, next_cursor([row.id for row in rows], params.page_size)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Server Error: {e}")
         raise HTTPException(
@@ -499,10 +714,20 @@ async def get_log_access_list(params: LogAccessQuery, session: ASession):
 async def delete_all_data(session: ASession):
     await session.execute(delete(SubmissionLog))
     
+    await session.execute(delete(JudgeClaim))
+    
+    await session.execute(delete(JudgeRequest))
+    await session.execute(delete(RejudgeJob))
+    await session.execute(delete(VerdictMemo))
+    await session.execute(delete(SolvedProblem))
+    
     await session.execute(delete(SubmissionItem))
+    await session.execute(delete(SubmissionCount))
     
     await session.execute(delete(LogVisibility))
     
+    await session.execute(delete(JudgeConfig))
+    
     await session.execute(delete(ProblemItem))
     
     await session.execute(delete(UserItem))
@@ -511,6 +736,9 @@ async def delete_all_data(session: ASession):
     
     await session.commit()
     
+    testcase_store.delete_testcases()
+    language_registry.invalidate()
+    
 
 # ============================= Export ============================= #
 
@@ -527,7 +755,7 @@ async def export_users_data(session: ASession):
             "role": user.role,
             "join_time": user.join_time.isoformat(),
             "submit_count": user.submit_count,
-            "resolve_count": await get_resolve_count(user.id, session)
+            "resolve_count": user.resolve_count
         })
         
     return exported_users
@@ -549,7 +777,9 @@ async def export_problems_data(session: ASession):
             "output_description": problem.output_description,
             "samples": problem.samples,
             "constraints": problem.constraints,
-            "testcases": problem.testcases,
+            "testcases": await asyncio.to_thread(
+                testcase_store.load_testcases, problem.id, problem.testcases
+            ),
             "hint": problem.hint,
             "source": problem.source,
             "tags": problem.tags,
@@ -646,7 +876,9 @@ async def validate_and_import(
             problem.output_description = problem_data.output_description
             problem.samples = [s.model_dump() for s in problem_data.samples]
             problem.constraints = problem_data.constraints
-            problem.testcases = [t.model_dump() for t in problem_data.testcases]
+            problem.testcases = await asyncio.to_thread(
+                testcase_store.store_testcases, problem.id, problem_data.testcases
+            )
             problem.hint = problem_data.hint
             problem.source = problem_data.source
             problem.tags = problem_data.tags
@@ -669,7 +901,9 @@ async def validate_and_import(
                 output_description=problem_data.output_description,
                 samples=problem_data.samples,
                 constraints=problem_data.constraints,
-                testcases=problem_data.testcases,
+                testcases=await asyncio.to_thread(
+                    testcase_store.store_testcases, problem_data.id, problem_data.testcases
+                ),
                 hint=problem_data.hint,
                 source=problem_data.source,
                 tags=problem_data.tags,
@@ -687,6 +921,7 @@ async def validate_and_import(
             
     await session.commit() 
             
+    imported_pending = []
     for submission_data in data.submissions:
         # user = await get_user_by_id(submission_data.user_id, session)
         # problem = await get_problem_by_id(submission_data.problem_id, session)
@@ -701,6 +936,7 @@ async def validate_and_import(
                 submission.status = SubmissionStatus(submission_data.status)
                 submission.score = submission_data.score
                 submission.counts = submission_data.counts
+                submission.judge_generation += 1
                 session.add(submission)
             else:
                 new_submission = SubmissionItem(
@@ -728,8 +964,23 @@ async def validate_and_import(
                     counts=submission_data.counts
                 )
                 session.add(new_submission_log)  
+                
+            # Pending imported submissions are judged, after fresh submissions and rejudges
+            if submission_data.status == SubmissionStatus.PENDING:
+                await session.merge(JudgeRequest(
+                    submission_id=submission_data.submission_id,
+                    priority=JudgePriority.IMPORT
+                ))
+                imported_pending.append((submission_data.submission_id, submission_data.user_id))
                                     
+    # Imported resolve counts may not match imported submissions
+    await rebuild_solved(session)
     await session.commit()           
+    
+    await prune_testcase_files(session, [problem_data.id for problem_data in data.problems])
+    
+    for submission_id, user_id in imported_pending:
+        judge_scheduler.enqueue(submission_id, user_id, JudgePriority.IMPORT)
 
     
                  
\ No newline at end of file
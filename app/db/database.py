@@ -1,14 +1,63 @@
 from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from typing import Annotated 
+from typing import Annotated, Dict, Optional
 from fastapi import Depends
 import contextlib 
+import random
+import time
+from . import migrations, counters
+from config.settings import (
+    DATABASE_URL, DB_SQLITE_PRAGMAS, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_SQL_LOG_SAMPLE_RATE,
+)
+
+
+def _set_pragmas(engine: AsyncEngine, pragmas: Dict):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _sample_sql_log(engine: AsyncEngine, rate: float):
+    """
+    Print about `rate` of all statements, with their duration.
+    """
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if random.random() < rate:
+            conn.info["sql_log_start"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def log_statement(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("sql_log_start", None)
+        if start is not None:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"SQL ({elapsed_ms:.2f} ms): {' '.join(statement.split())} {str(parameters)[:200]}")
+
 
+def make_engine(
+    url: str = DATABASE_URL,
+    pragmas: Optional[Dict] = None,
+    sql_log_sample_rate: float = DB_SQL_LOG_SAMPLE_RATE,
+) -> AsyncEngine:
+    """
+    Engine with the pool, SQLite pragmas (DB_SQLITE_PRAGMAS if None) and SQL
+    logging of config/settings.py.
+    """
+    engine = create_async_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    pragmas = DB_SQLITE_PRAGMAS if pragmas is None else pragmas
+    if engine.dialect.name == "sqlite" and pragmas:
+        _set_pragmas(engine, pragmas)
+    if sql_log_sample_rate > 0:
+        _sample_sql_log(engine, sql_log_sample_rate)
+    return engine
 
-DATABASE_URL = "sqlite+aiosqlite:///./app.db"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = make_engine()
 
 # Generate instance of AsyncSession
 AsyncSessionLocal = sessionmaker(
@@ -19,8 +68,16 @@ AsyncSessionLocal = sessionmaker(
 
 
 async def create_db_and_tables():
+    """
+    Create missing tables, then migrate existing ones (see migrations.py) and
+    install counters (see counters.py).
+    """
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        for change in await conn.run_sync(migrations.migrate):
+            print(f"Database migration: {change}")
+        for change in await conn.run_sync(counters.install):
+            print(f"Database counters: {change}")
 
 
 @contextlib.asynccontextmanager
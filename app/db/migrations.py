@@ -0,0 +1,53 @@
+from sqlmodel import SQLModel
+from sqlalchemy import inspect, literal
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import Column, CreateIndex
+
+
+# create_all only creates missing tables: tables of an existing db keep the
+# columns and indexes they were created with. On startup, migrate() brings them
+# up to the models in schemas.py, adding what is missing:
+#   - columns, with their scalar default so existing rows get it
+#   - indexes
+# Nothing is ever dropped or altered, so older code keeps working on a migrated db.
+
+
+def _column_ddl(connection: Connection, column: Column) -> str:
+    dialect = connection.dialect
+    ddl = f"{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}"
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = literal(default.arg, type_=column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        ddl += f" DEFAULT {value}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    # No default to fill existing rows with: the column has to allow NULL
+    return ddl
+
+
+def migrate(connection: Connection) -> list[str]:
+    """
+    Add missing columns and indexes to existing tables. Return what was done.
+    Run with AsyncConnection.run_sync, after create_all.
+    """
+    inspector = inspect(connection)
+    done = []
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {connection.dialect.identifier_preparer.quote(table.name)} "
+                    f"ADD COLUMN {_column_ddl(connection, column)}"
+                )
+                done.append(f"add column {table.name}.{column.name}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                connection.execute(CreateIndex(index))
+                done.append(f"add index {index.name}")
+    return done
@@ -1,10 +1,13 @@
-from pydantic import BaseModel, Field as PydanticField, field_validator, model_validator
+from pydantic import BaseModel, Field as PydanticField, AliasChoices, field_validator, model_validator
 from typing import List, Optional, Dict
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Index
 from sqlalchemy.types import JSON
 from datetime import datetime, timezone
-from enum import Enum
+from enum import Enum, IntEnum
 import bcrypt
+import shlex
+import string
 import uuid
 
 
@@ -14,15 +17,56 @@ class SampleItem(BaseModel):
     input: str
     output: str
 
+# Problem ids name their test case directory (see core/testcase_store.py)
+PROBLEM_ID_PATTERN = r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$"
+
+# Placeholders of language commands (see core/languages.py)
+COMMAND_FIELDS = ("src", "exe", "dir")
+
+
+def parse_command(command: str) -> List[str]:
+    """
+    Split a language command template into arguments.
+    Raise ValueError if it is empty, can't be split, or has placeholders other
+    than COMMAND_FIELDS (literal braces are written "{{" and "}}").
+    """
+    parts = shlex.split(command)
+    if not parts:
+        raise ValueError("empty command")
+    for part in parts:
+        for _, field, _, _ in string.Formatter().parse(part):
+            if field is not None and field not in COMMAND_FIELDS:
+                raise ValueError(
+                    f"unknown placeholder '{{{field}}}', use one of "
+                    + ", ".join(f"{{{name}}}" for name in COMMAND_FIELDS)
+                )
+        # Also what parse() lets through, e.g. "{src!x}" or "{src:{x}}"
+        try:
+            part.format(**{name: "" for name in COMMAND_FIELDS})
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"bad placeholder in '{part}': {e}")
+    return parts
+
+
+def check_file_ext(file_ext: str):
+    """
+    Raise ValueError if file_ext can't end a file name ("main" + file_ext) in the build directory.
+    """
+    if any(bad in file_ext for bad in ("/", "\\", "..", "\0")):
+        raise ValueError("file_ext must not contain '/', '\\', '..' or NUL")
+
+
 class ProblemItem(SQLModel, table=True):
     id: str = Field(primary_key=True)
     title: str
     description: str
     input_description: str
     output_description: str
-    samples: List[SampleItem] = Field(sa_type=JSON)
+    # {"input", "output"} dicts, posted as SampleItem (see ProblemCreate)
+    samples: List[Dict] = Field(sa_type=JSON)
     constraints: str
-    testcases: List[SampleItem] = Field(sa_type=JSON)
+    # Posted as input/output pairs, kept in db as file metadata (see core/testcase_store.py)
+    testcases: List[Dict] = Field(sa_type=JSON)
     # optional
     hint: str = ""
     source: str = ""
@@ -36,11 +80,61 @@ class ProblemItem(SQLModel, table=True):
     log_visibility: Optional["LogVisibility"] = Relationship(back_populates="problem")
     
     
+class ProblemCreate(BaseModel):
+    """
+    A new problem as posted, validated (unlike a table model parsed from a body).
+    """
+    id: str = PydanticField(pattern=PROBLEM_ID_PATTERN)
+    title: str
+    description: str
+    input_description: str
+    output_description: str
+    samples: List[SampleItem]
+    constraints: str
+    testcases: List[SampleItem]
+    hint: str = ""
+    source: str = ""
+    tags: List[str] = PydanticField(default_factory=list)
+    time_limit: float = 3.0
+    memory_limit: int = 128
+    author: str = ""
+    difficulty: str = ""
+
+
+class ProblemTestcasesUpdate(BaseModel):
+    """
+    New test cases of a problem, replacing the old ones.
+    """
+    testcases: List[SampleItem]
+    
+
 class ProblemListItem(BaseModel):
     id: str
     title: str
     
 
+class JudgeConfig(SQLModel, table=True):
+    """
+    Per-problem judge options. None (or no row) means default in config/settings.py.
+    """
+    problem_id: str = Field(primary_key=True, foreign_key="problemitem.id")
+    # Number of test cases run at once
+    case_parallelism: int | None = None
+    # Skip remaining test cases after the first failed one (ICPC style)
+    stop_on_failure: bool = False
+    # C++ source of a special judge checker, None compares output with expected output
+    checker: str | None = None
+    # Reuse results of identical code judged before; off for nondeterministic problems
+    verdict_cache: bool = True
+    
+    
+class JudgeConfigUpdate(BaseModel):
+    case_parallelism: int | None = PydanticField(default=None, ge=1)
+    stop_on_failure: bool = False
+    checker: str | None = None
+    verdict_cache: bool = True
+    
+
 # =============== User =============== #
 
 class UserRole(str, Enum):
@@ -81,12 +175,23 @@ class UserItem(SQLModel, table=True):
 class UserListQuery(BaseModel):
     """
     schema for user list query.
+    Either page / page_size, or cursor / page_size: cursor is the next_cursor of
+    the previous page, "" for the first page.
     """
     page: int | None = None
     page_size: int | None = None
+    cursor: str | None = None
     
     
     
+class RowCount(SQLModel, table=True):
+    """
+    Number of rows of a table (name), kept by triggers (see db/counters.py).
+    """
+    name: str = Field(primary_key=True)
+    count: int = 0
+    
+    
 # =============== Submission =============== #  
 
 class SubmissionCreate(BaseModel):
@@ -102,6 +207,20 @@ class SubmissionStatus(str, Enum):
 
 
 class SubmissionItem(SQLModel, table=True):
+    # One per combination of the submission list filters (user / problem / status),
+    # also used by the judge's scan for pending submissions. Exactly the filtered
+    # columns: the implicit rowid after them keeps a page (ORDER BY rowid, after a
+    # cursor) a seek, not a sort of everything matching.
+    __table_args__ = (
+        Index("ix_submission_user_problem_status", "user_id", "problem_id", "status"),
+        Index("ix_submission_user_problem", "user_id", "problem_id"),
+        Index("ix_submission_user_status", "user_id", "status"),
+        Index("ix_submission_user", "user_id"),
+        Index("ix_submission_problem_status", "problem_id", "status"),
+        Index("ix_submission_problem", "problem_id"),
+        Index("ix_submission_status", "status"),
+    )
+    
     id: Optional[str] = Field(default=None, primary_key=True)
     user_id: str = Field(foreign_key="useritem.id")
     problem_id: str = Field(foreign_key="problemitem.id")
@@ -110,6 +229,8 @@ class SubmissionItem(SQLModel, table=True):
     status: SubmissionStatus = SubmissionStatus.PENDING
     score: int | None = None
     counts: int 
+    # Bumped by every rejudge, so the result of a run started before is not written
+    judge_generation: int = 0
     
     user: Optional[UserItem] = Relationship(back_populates="submissions") 
     problem: Optional[ProblemItem] = Relationship(back_populates="submissions") 
@@ -117,15 +238,42 @@ class SubmissionItem(SQLModel, table=True):
     
 class SubmissionListQuery(BaseModel):
     """
-    schema for submission list query.
+    schema for submission list query, paged like UserListQuery.
     """
     user_id: str | None = None
     problem_id: str | None = None
     status: SubmissionStatus | None = None
     page: int | None = None
     page_size: int | None = None
+    cursor: str | None = None
     
         
+class SubmissionCount(SQLModel, table=True):
+    """
+    Number of submissions per (user, problem, status), kept by triggers on
+    submissionitem (see db/counters.py), so list totals never count submissions.
+    """
+    __table_args__ = (
+        Index("ix_submissioncount_problem_status", "problem_id", "status"),
+    )
+    
+    user_id: str = Field(primary_key=True)
+    problem_id: str = Field(primary_key=True)
+    status: SubmissionStatus = Field(primary_key=True)
+    count: int = 0
+    
+    
+class SolvedProblem(SQLModel, table=True):
+    """
+    Problems a user has solved (a submission with full score), kept up to date by
+    the judge (see db/solved.py). UserItem.resolve_count is the number of rows of a user.
+    """
+    user_id: str = Field(primary_key=True, foreign_key="useritem.id")
+    problem_id: str = Field(primary_key=True, foreign_key="problemitem.id", index=True)
+    # A full score submission; if it is rejudged and fails, another one takes its place
+    submission_id: str = Field(index=True)
+    
+    
 # =============== Submission Log =============== #
 
 class CaseResult(str, Enum):
@@ -133,16 +281,35 @@ class CaseResult(str, Enum):
     WA = "WA"
     TLE = "TLE"
     MLE = "MLE"
+    OLE = "OLE"  # output limit exceeded
     RE = "RE"
     CE = "CE"
     UNK = "UNK"
+    SKIP = "SKIP"  # not run, an earlier case failed in stop-on-failure mode
     
     
 class CaseItem(BaseModel):
     id: int
     result: CaseResult
+    # CPU time (user + sys), which limits are checked against
     time: float
+    # Elapsed time, also counting time spent waiting (e.g. on input or sleep)
+    wall_time: float | None = None
     memory: int
+    # Content hash of the test case judged (testcase_store.case_hash)
+    testcase_hash: str | None = None
+    
+
+class VerdictMemo(SQLModel, table=True):
+    """
+    Result of judged code, keyed by verdict_cache.cache_key.
+    """
+    key: str = Field(primary_key=True)
+    status: str
+    score: int
+    details: List[Dict] = Field(sa_type=JSON)
+    # Last hit (or store) time, least recently used entries are evicted
+    last_used: float
     
 
 class SubmissionLog(SQLModel, table=True):
@@ -150,6 +317,9 @@ class SubmissionLog(SQLModel, table=True):
     details: List[Dict] = Field(sa_type=JSON)
     score: int
     counts: int
+    # Hash of code, language and limits judged with: case results are only
+    # reused by an incremental rejudge if it is unchanged.
+    judge_hash: str | None = None
     
     submission: Optional[SubmissionItem] = Relationship(back_populates="submission_log")
     
@@ -161,16 +331,91 @@ class LogVisibility(SQLModel, table=True):
     problem: Optional[ProblemItem] = Relationship(back_populates="log_visibility")
     
 
+class JudgeClaim(SQLModel, table=True):
+    """
+    A submission being judged by a worker, so api process and standalone workers don't judge it twice.
+    """
+    submission_id: str = Field(primary_key=True, foreign_key="submissionitem.id")
+    worker_id: str
+    claimed_at: float
+    
+    
+class JudgePriority(IntEnum):
+    """
+    Judge priority classes, lower is judged first.
+    """
+    SUBMIT = 0   # fresh submissions of users
+    REJUDGE = 1  # rejudged by admin
+    IMPORT = 2   # re-evaluation of imported data
+    
+    
+class JudgeRequest(SQLModel, table=True):
+    """
+    Priority of a pending submission queued by rejudge or import. No row means SUBMIT.
+    Kept in db, so submissions left pending (queue full, restart) keep their class.
+    """
+    submission_id: str = Field(primary_key=True, foreign_key="submissionitem.id")
+    priority: int = JudgePriority.SUBMIT
+    # Bulk rejudge job the submission belongs to
+    job_id: str | None = Field(default=None, index=True)
+    # Same problem, language and code as this submission: not judged itself,
+    # takes its result once that one is judged.
+    duplicate_of: str | None = Field(default=None, index=True)
+    # Rerun every case, instead of only cases changed since the last judge
+    full_rejudge: bool = False
+    
+    
+class RejudgeJob(SQLModel, table=True):
+    """
+    A bulk rejudge, progress is counted from its JudgeRequest rows.
+    """
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    created_at: float
+    filters: Dict = Field(default_factory=dict, sa_type=JSON)
+    total: int = 0
+    # Submissions actually judged, the others are duplicates of them
+    judged: int = 0
+    
+    
+class BulkRejudgeRequest(BaseModel):
+    """
+    Submissions to rejudge: all matching every filter given (at least one).
+    """
+    problem_id: str | None = None
+    user_id: str | None = None
+    status: SubmissionStatus | None = None
+    submission_ids: List[str] | None = None
+    # Rerun every case, instead of only cases changed since the last judge
+    full: bool = False
+    
+    @model_validator(mode="after")
+    def check_filters(self):
+        if self.problem_id is None and self.user_id is None and self.status is None and self.submission_ids is None:
+            raise ValueError("at least one filter is required")
+        return self
+    
+
 # =============== Log Access =============== #
 
 class LogAccessQuery(BaseModel):
+    """
+    schema for access log query, paged like UserListQuery.
+    """
     user_id: str | None = None
     problem_id: str | None = None
     page: int | None = None
     page_size: int | None = None
+    cursor: str | None = None
     
 
 class LogAccess(SQLModel, table=True):
+    __table_args__ = (
+        # Log list filters, see SubmissionItem
+        Index("ix_logaccess_user_problem", "user_id", "problem_id"),
+        Index("ix_logaccess_user", "user_id"),
+        Index("ix_logaccess_problem", "problem_id"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str
     problem_id: str
@@ -192,6 +437,36 @@ class LanguageItem(SQLModel, table=True):
     run_cmd: str
     time_limit: float | None = None
     memory_limit: int | None = None
+    # Multipliers of problem time / memory limit when judging, None for 1
+    time_factor: float | None = None
+    memory_factor: float | None = None
+    
+    
+class LanguageCreate(BaseModel):
+    name: str
+    file_ext: str
+    # Column is named complie_cmd, accept both
+    compile_cmd: str | None = PydanticField(
+        default=None, validation_alias=AliasChoices("compile_cmd", "complie_cmd")
+    )
+    run_cmd: str
+    time_limit: float | None = PydanticField(default=None, gt=0)
+    memory_limit: int | None = PydanticField(default=None, gt=0)
+    time_factor: float | None = PydanticField(default=None, gt=0)
+    memory_factor: float | None = PydanticField(default=None, gt=0)
+    
+    @field_validator("compile_cmd", "run_cmd")
+    @classmethod
+    def check_command(cls, command: str | None) -> str | None:
+        if command is not None:
+            parse_command(command)
+        return command
+
+    @field_validator("file_ext")
+    @classmethod
+    def check_file_ext(cls, file_ext: str) -> str:
+        check_file_ext(file_ext)
+        return file_ext
     
 
 # =============== Import =============== #  
@@ -207,7 +482,7 @@ class ImportUserData(BaseModel):
 
 
 class ImportProblemData(BaseModel):
-    id: str
+    id: str = PydanticField(pattern=PROBLEM_ID_PATTERN)
     title: str
     description: str
     input_description: str
@@ -0,0 +1,127 @@
+from typing import List, Optional
+from collections import Counter
+from sqlmodel import select, delete, update, func
+from sqlalchemy.dialects.sqlite import insert
+from .schemas import SolvedProblem, SubmissionItem, SubmissionStatus, UserItem
+from .database import ASession
+
+
+# Solved problems are kept in SolvedProblem, one row per (user, problem), and
+# counted in UserItem.resolve_count, so reading a resolve count never scans
+# submissions. Whatever changes submission results calls update_solved() in
+# the same transaction, so the two never disagree.
+
+
+def _solves(submission) -> bool:
+    return submission.status == SubmissionStatus.SUCCESS and submission.score == submission.counts
+
+
+def _full_score_submission():
+    return select(SubmissionItem.id).where(
+        (SubmissionItem.status == SubmissionStatus.SUCCESS) &
+        (SubmissionItem.score == SubmissionItem.counts)
+    )
+
+
+async def _add_to_resolve_counts(session: ASession, counts: Counter):
+    for user_id, count in counts.items():
+        if count:
+            await session.execute(
+                update(UserItem)
+                .where(UserItem.id == user_id)
+                .values(resolve_count=UserItem.resolve_count + count)
+            )
+
+
+async def update_solved(session: ASession, submission_ids: List[str]):
+    """
+    Record problems solved by submissions whose results were just written, and
+    take back solves whose full score submission no longer has full score
+    (rejudged). Does not commit.
+    """
+    if not submission_ids:
+        return
+    result = await session.execute(
+        select(
+            SubmissionItem.id, SubmissionItem.user_id, SubmissionItem.problem_id,
+            SubmissionItem.status, SubmissionItem.score, SubmissionItem.counts
+        ).where(SubmissionItem.id.in_(submission_ids))
+    )
+    submissions = result.all()
+    changes = Counter()
+    
+    solving = [submission for submission in submissions if _solves(submission)]
+    if solving:
+        # Only the first solve of a problem counts
+        statement = insert(SolvedProblem).values([
+            {"user_id": submission.user_id, "problem_id": submission.problem_id, "submission_id": submission.id}
+            for submission in solving
+        ]).on_conflict_do_nothing().returning(SolvedProblem.user_id)
+        result = await session.execute(statement)
+        changes.update(result.scalars().all())
+        
+    failing = [submission.id for submission in submissions if not _solves(submission)]
+    if failing:
+        result = await session.execute(
+            select(SolvedProblem).where(SolvedProblem.submission_id.in_(failing))
+        )
+        for solve in result.scalars().all():
+            result = await session.execute(
+                _full_score_submission()
+                .where(SubmissionItem.user_id == solve.user_id)
+                .where(SubmissionItem.problem_id == solve.problem_id)
+                .limit(1)
+            )
+            other_id = result.scalar_one_or_none()
+            if other_id is not None:
+                solve.submission_id = other_id
+                session.add(solve)
+            else:
+                await session.delete(solve)
+                changes[solve.user_id] -= 1
+                
+    await _add_to_resolve_counts(session, changes)
+    
+    
+async def rebuild_solved(session: ASession, user_ids: Optional[List[str]] = None):
+    """
+    Recompute solved problems and resolve counts from submissions, of user_ids
+    or of everyone. For bulk changes (import, deletes), does not commit.
+    """
+    solved = delete(SolvedProblem)
+    users = update(UserItem)
+    full_score = (
+        select(SubmissionItem.user_id, SubmissionItem.problem_id, func.min(SubmissionItem.id))
+        .where(SubmissionItem.status == SubmissionStatus.SUCCESS)
+        .where(SubmissionItem.score == SubmissionItem.counts)
+        .group_by(SubmissionItem.user_id, SubmissionItem.problem_id)
+    )
+    if user_ids is not None:
+        solved = solved.where(SolvedProblem.user_id.in_(user_ids))
+        users = users.where(UserItem.id.in_(user_ids))
+        full_score = full_score.where(SubmissionItem.user_id.in_(user_ids))
+        
+    await session.execute(solved)
+    await session.execute(
+        insert(SolvedProblem).from_select(["user_id", "problem_id", "submission_id"], full_score)
+    )
+    await session.execute(users.values(resolve_count=(
+        select(func.count())
+        .where(SolvedProblem.user_id == UserItem.id)
+        .scalar_subquery()
+    )))
+    
+    
+async def backfill_solved(session: ASession):
+    """
+    Fill SolvedProblem of a db from before it existed.
+    """
+    result = await session.execute(select(SolvedProblem.user_id).limit(1))
+    if result.first() is not None:
+        return
+    result = await session.execute(_full_score_submission().limit(1))
+    if result.first() is None:
+        return
+    await rebuild_solved(session)
+    await session.commit()
+    print("Solved problems rebuilt from submissions.")
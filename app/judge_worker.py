@@ -0,0 +1,79 @@
+"""
+Standalone judge worker.
+
+    python -m app.judge_worker [--workers N] [--processes P]
+
+Claims pending submissions from the db and judges them outside of the API
+process, so uvicorn only serves requests. Set JUDGE_MODE = "external" in
+config/settings.py to stop the API process from judging by itself.
+Several workers (or processes) may run at once, claims keep them from
+judging the same submission twice, and core locks from pinning two cases
+to one core (see core/cpu_pool.py).
+"""
+import argparse
+import asyncio
+import multiprocessing
+from .core.evaluation import JudgeScheduler
+from .db.database import create_db_and_tables, engine
+from config.settings import JUDGE_WORKERS, JUDGE_QUEUE_SIZE, JUDGE_WORKER_POLL_INTERVAL
+
+
+async def run_worker(workers: int):
+    await create_db_and_tables()
+
+    scheduler = JudgeScheduler(
+        workers=workers,
+        queue_size=JUDGE_QUEUE_SIZE,
+        poll_interval=JUDGE_WORKER_POLL_INTERVAL
+    )
+    await scheduler.start()
+    print(f"Judge worker started with {workers} slot(s).")
+    try:
+        # Run until interrupted
+        await asyncio.Event().wait()
+    finally:
+        await scheduler.stop()
+        await engine.dispose()
+
+
+def worker_process(workers: int):
+    try:
+        asyncio.run(run_worker(workers))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run standalone judge workers.")
+    parser.add_argument(
+        "--workers", type=int, default=JUDGE_WORKERS,
+        help="submissions judged concurrently per process"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="number of worker processes"
+    )
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        worker_process(args.workers)
+        return
+
+    # Spawn (not fork) so every process opens its own db engine.
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker_process, args=(args.workers,))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 from fastapi import FastAPI
-from .api import problems, submissions, languages, users, auth, logs, reset, export, import_data
+from .api import problems, submissions, languages, users, auth, logs, reset, export, import_data, judge
 from .core import errors
+from .core.evaluation import judge_scheduler
 from .db.schemas import *
 from fastapi.exceptions import HTTPException, RequestValidationError
 from contextlib import asynccontextmanager
 from .db.database import create_db_and_tables, get_db_async_session, engine
+from .db.solved import backfill_solved
 from sqlmodel import select
 from starlette.middleware.sessions import SessionMiddleware
 from config.settings import *
@@ -33,8 +35,16 @@ async def lifespan(app: FastAPI):
             print(f"Initial admin user created. admin id: '{new_admin.id}'")
         else:
             print(f"Initial admin user already exists. admin id: '{admin_user.id}'")
+        
+        # Databases from before solved problems were recorded
+        await backfill_solved(session)
+    
+    # Start judge workers (also resumes submissions left pending)
+    if JUDGE_MODE == "inline":
+        await judge_scheduler.start()
             
     yield
+    await judge_scheduler.stop()
     await engine.dispose()
 
 
@@ -69,6 +79,7 @@ app.include_router(logs.logs_router)
 app.include_router(reset.reset_router)
 app.include_router(export.export_router)
 app.include_router(import_data.import_router)
+app.include_router(judge.judge_router)
 
 @app.get("/")
 async def welcome():
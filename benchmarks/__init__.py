@@ -0,0 +1,33 @@
+"""
+Offline benchmarks, run from the repository root, e.g.
+
+    python -m benchmarks.judge_throughput --help
+
+Each runs in a temporary directory with its own db and data, never touching ./app.db.
+"""
+import atexit
+import math
+import os
+import shutil
+import tempfile
+from typing import List
+
+
+def use_temp_work_dir() -> str:
+    """
+    Move to a new temporary directory, removed at exit. Call it before importing
+    app: the db path (./app.db) is made absolute when the db engine is created.
+    """
+    work_dir = tempfile.mkdtemp(prefix="oj-bench-")
+    os.chdir(work_dir)
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    return work_dir
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of values (sorted).
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
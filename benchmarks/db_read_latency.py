@@ -0,0 +1,159 @@
+"""
+Database read latency under concurrent judge writes.
+
+    python -m benchmarks.db_read_latency [--submissions N] [--readers R] [--writers W]
+                                         [--duration S] [--json]
+
+Seeds N submissions with logs, then for S seconds W writers commit judge
+results (status updates and log upserts, as the result writer does) while R
+readers page through the submission list with crud.get_submission_list.
+Runs once with SQLite defaults and once with DB_SQLITE_PRAGMAS (WAL etc.),
+each on its own db file, and reports read latency percentiles and write rate.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import List, Dict
+from sqlmodel import SQLModel, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from . import percentile, use_temp_work_dir
+
+use_temp_work_dir()
+
+from app.db import crud, counters
+from app.db.database import make_engine
+from app.db.schemas import (
+    ProblemItem, SubmissionItem, SubmissionLog, SubmissionListQuery, SubmissionStatus, UserItem,
+)
+from config.settings import DB_SQLITE_PRAGMAS
+
+
+PAGE_SIZE = 20
+# Results per write transaction
+WRITE_BATCH = 10
+
+
+async def seed(Session, count: int) -> tuple[str, List[str]]:
+    problem_id = "bench_" + uuid.uuid4().hex[:8]
+    user_id = str(uuid.uuid4())
+    submission_ids = [str(uuid.uuid4()) for _ in range(count)]
+    async with Session() as session:
+        session.add(UserItem(id=user_id, username="bench", hashed_password=""))
+        session.add(ProblemItem(
+            id=problem_id, title="A+B", description="", input_description="",
+            output_description="", samples=[], constraints="", testcases=[]
+        ))
+        for submission_id in submission_ids:
+            session.add(SubmissionItem(
+                id=submission_id, user_id=user_id, problem_id=problem_id,
+                language="python", code="print(0)", status=SubmissionStatus.SUCCESS,
+                score=10, counts=10
+            ))
+            session.add(SubmissionLog(submission_id=submission_id, details=[], score=10, counts=10))
+        await session.commit()
+    return problem_id, submission_ids
+
+
+async def writer(Session, submission_ids: List[str], stop: asyncio.Event, commits: List[int]):
+    while not stop.is_set():
+        batch = random.sample(submission_ids, WRITE_BATCH)
+        details = [{"id": 1, "result": "AC", "time": 0.01, "wall_time": 0.02, "memory": 8}]
+        async with Session() as session:
+            await session.execute(update(SubmissionItem), [
+                {"id": submission_id, "status": SubmissionStatus.SUCCESS, "score": 10}
+                for submission_id in batch
+            ])
+            statement = insert(SubmissionLog).values([
+                {"submission_id": submission_id, "details": details, "score": 10, "counts": 10}
+                for submission_id in batch
+            ])
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=["submission_id"],
+                set_={"details": statement.excluded.details, "score": statement.excluded.score}
+            ))
+            await session.commit()
+        commits[0] += 1
+        # Let the event loop run readers between commits
+        await asyncio.sleep(0)
+
+
+async def reader(Session, problem_id: str, pages: int, stop: asyncio.Event, latencies: List[float]):
+    while not stop.is_set():
+        params = SubmissionListQuery(problem_id=problem_id, page=random.randint(1, pages), page_size=PAGE_SIZE)
+        start = time.perf_counter()
+        async with Session() as session:
+            await crud.get_submission_list(params, session)
+            await crud.get_submission_counts(params, session)
+        latencies.append(time.perf_counter() - start)
+
+
+async def measure(name: str, pragmas: Dict, args) -> Dict:
+    engine = make_engine(f"sqlite+aiosqlite:///./{name}.db", pragmas=pragmas, sql_log_sample_rate=0)
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(counters.install)
+    problem_id, submission_ids = await seed(Session, args.submissions)
+
+    stop = asyncio.Event()
+    latencies: List[float] = []
+    commits = [0]
+    pages = max(1, args.submissions // PAGE_SIZE)
+    tasks = [asyncio.create_task(writer(Session, submission_ids, stop, commits)) for _ in range(args.writers)]
+    tasks += [asyncio.create_task(reader(Session, problem_id, pages, stop, latencies)) for _ in range(args.readers)]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    # Writers may give up on a locked db (busy_timeout), that is part of the result
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    await engine.dispose()
+
+    latencies.sort()
+    return {
+        "pragmas": pragmas,
+        "reads": len(latencies),
+        "read_latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "write_commits_per_second": commits[0] / args.duration,
+        "failed_tasks": sum(isinstance(result, Exception) for result in results),
+    }
+
+
+async def run(args) -> Dict:
+    return {
+        "default": await measure("default", {}, args),
+        "tuned": await measure("tuned", DB_SQLITE_PRAGMAS, args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure db read latency under judge writes.")
+    parser.add_argument("--submissions", type=int, default=5000, help="submissions seeded")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent readers")
+    parser.add_argument("--writers", type=int, default=2, help="concurrent writers")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per configuration")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, result in report.items():
+        latency = result["read_latency_ms"]
+        print(f"{name}: {result['reads']} reads, p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, "
+              f"p99 {latency['p99']:.2f} ms, max {latency['max']:.2f} ms; "
+              f"{result['write_commits_per_second']:.1f} write commits/s"
+              + (f"; {result['failed_tasks']} tasks failed" if result["failed_tasks"] else ""))
+
+
+if __name__ == "__main__":
+    main()
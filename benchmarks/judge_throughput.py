@@ -0,0 +1,215 @@
+"""
+Judge throughput benchmark.
+
+    python -m benchmarks.judge_throughput [--submissions N] [--cases C] [--languages python,C++]
+                                          [--workers W] [--users U] [--identical] [--json]
+
+Seeds a problem with C synthetic a+b test cases, fires N submissions at once
+through crud.submit_test_get_id (spread over U users and the given languages)
+and waits for all verdicts, with an inline judge scheduler of W workers.
+Reports throughput, time-to-verdict percentiles, compile time and per-case
+overhead (wall time of a case minus its CPU time).
+
+Sources are made distinct by default, so neither the compile cache nor the
+verdict cache hides judge cost; --identical submits the same source each time.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Dict
+from sqlmodel import select
+from . import percentile, use_temp_work_dir
+
+# Own db, test case files and compile cache, all relative to the working directory
+use_temp_work_dir()
+
+from app.db import crud
+from app.db.database import create_db_and_tables, get_async_session, engine
+from app.db.schemas import ProblemItem, SubmissionCreate, SubmissionItem, SubmissionLog, SubmissionStatus, UserItem
+from app.core.compile_cache import compile_cache_stats
+from app.core.evaluation import judge_scheduler
+from app.core.verdict_cache import verdict_cache_stats
+
+
+SOURCES = {
+    "python": "a, b = map(int, input().split())\nprint(a + b)\n",
+    "C++": "#include <bits/stdc++.h>\nint main() { long long a, b; std::cin >> a >> b; std::cout << a + b << std::endl; }\n",
+}
+COMMENTS = {"python": "# {}\n", "C++": "// {}\n"}
+
+POLL_INTERVAL = 0.02
+
+
+async def seed(cases: int, users: int) -> tuple[str, List[str]]:
+    """
+    Add the benchmark problem and users, return their ids.
+    """
+    problem_id = "bench_" + uuid.uuid4().hex[:8]
+    testcases = [{"input": f"{i} {i * 7}\n", "output": f"{i * 8}\n"} for i in range(cases)]
+    async with get_async_session() as session:
+        await crud.write_problem(ProblemItem(
+            id=problem_id,
+            title="A+B",
+            description="",
+            input_description="",
+            output_description="",
+            samples=testcases[:1],
+            constraints="",
+            testcases=testcases,
+        ), session)
+        user_ids = []
+        for i in range(users):
+            user = UserItem(id=str(uuid.uuid4()), username=f"bench_{i}", hashed_password="")
+            session.add(user)
+            user_ids.append(user.id)
+        await session.commit()
+    return problem_id, user_ids
+
+
+async def submit_all(problem_id: str, user_ids: List[str], languages: List[str], count: int, identical: bool) -> Dict[str, float]:
+    """
+    Submit count sources concurrently, return submission id -> submit time.
+    """
+    async def submit(i: int) -> tuple[str, float]:
+        language = languages[i % len(languages)]
+        code = SOURCES[language]
+        if not identical:
+            code += COMMENTS[language].format(uuid.uuid4().hex)
+        submitted = time.monotonic()
+        async with get_async_session() as session:
+            submission_id = await crud.submit_test_get_id(
+                SubmissionCreate(problem_id=problem_id, language=language, code=code),
+                user_ids[i % len(user_ids)],
+                session
+            )
+        return submission_id, submitted
+
+    return dict(await asyncio.gather(*(submit(i) for i in range(count))))
+
+
+async def wait_for_verdicts(submitted: Dict[str, float], timeout: float) -> Dict[str, float]:
+    """
+    Poll db until every submission left pending, return submission id -> verdict time.
+    """
+    judged: Dict[str, float] = {}
+    deadline = time.monotonic() + timeout
+    while len(judged) < len(submitted):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{len(submitted) - len(judged)} submissions not judged in {timeout}s")
+        await asyncio.sleep(POLL_INTERVAL)
+        waiting = [submission_id for submission_id in submitted if submission_id not in judged]
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(SubmissionItem.id)
+                .where(SubmissionItem.id.in_(waiting))
+                .where(SubmissionItem.status != SubmissionStatus.PENDING)
+            )
+            now = time.monotonic()
+            for submission_id in result.scalars().all():
+                judged[submission_id] = now
+    return judged
+
+
+async def case_times(submission_ids: List[str]) -> List[Dict]:
+    async with get_async_session() as session:
+        result = await session.execute(
+            select(SubmissionLog.details).where(SubmissionLog.submission_id.in_(submission_ids))
+        )
+        return [
+            case for details in result.scalars().all() for case in details
+            if case.get("wall_time") is not None
+        ]
+
+
+async def run(args) -> Dict:
+    await create_db_and_tables()
+    problem_id, user_ids = await seed(args.cases, args.users)
+    languages = args.languages.split(",")
+
+    judge_scheduler.workers = args.workers
+    await judge_scheduler.start()
+    try:
+        start = time.monotonic()
+        submitted = await submit_all(problem_id, user_ids, languages, args.submissions, args.identical)
+        judged = await wait_for_verdicts(submitted, args.timeout)
+        elapsed = max(judged.values()) - start
+    finally:
+        await judge_scheduler.stop()
+
+    latencies = sorted(judged[submission_id] - submitted[submission_id] for submission_id in submitted)
+    cases = await case_times(list(submitted))
+    overheads = sorted(case["wall_time"] - case["time"] for case in cases)
+    await engine.dispose()
+
+    compiles = compile_cache_stats["misses"]
+    return {
+        "submissions": args.submissions,
+        "cases_per_submission": args.cases,
+        "languages": languages,
+        "workers": args.workers,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": args.submissions / elapsed if elapsed > 0 else 0.0,
+        "time_to_verdict": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "compile": {
+            "compiles": compiles,
+            "cache_hits": compile_cache_stats["hits"],
+            "mean_seconds": compile_cache_stats["compile_seconds"] / compiles if compiles else 0.0,
+        },
+        "verdict_cache_hits": verdict_cache_stats["hits"],
+        "per_case": {
+            "cases": len(cases),
+            "mean_wall_seconds": sum(case["wall_time"] for case in cases) / len(cases) if cases else 0.0,
+            "mean_cpu_seconds": sum(case["time"] for case in cases) / len(cases) if cases else 0.0,
+            "overhead_p50": percentile(overheads, 50),
+            "overhead_p95": percentile(overheads, 95),
+        },
+    }
+
+
+def print_report(report: Dict):
+    print(f"{report['submissions']} submissions x {report['cases_per_submission']} cases "
+          f"({', '.join(report['languages'])}), {report['workers']} workers")
+    print(f"  elapsed          {report['elapsed_seconds']:.2f} s")
+    print(f"  throughput       {report['throughput_per_second']:.2f} submissions/s")
+    latency = report["time_to_verdict"]
+    print(f"  time to verdict  p50 {latency['p50'] * 1000:.0f} ms, p95 {latency['p95'] * 1000:.0f} ms, "
+          f"p99 {latency['p99'] * 1000:.0f} ms, max {latency['max'] * 1000:.0f} ms")
+    compile_report = report["compile"]
+    print(f"  compile          {compile_report['compiles']} compiles, mean {compile_report['mean_seconds'] * 1000:.0f} ms, "
+          f"{compile_report['cache_hits']} cache hits")
+    per_case = report["per_case"]
+    print(f"  per case         wall {per_case['mean_wall_seconds'] * 1000:.1f} ms, cpu {per_case['mean_cpu_seconds'] * 1000:.1f} ms, "
+          f"overhead p50 {per_case['overhead_p50'] * 1000:.1f} ms, p95 {per_case['overhead_p95'] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure judge throughput and latency.")
+    parser.add_argument("--submissions", type=int, default=50, help="submissions fired at once")
+    parser.add_argument("--cases", type=int, default=10, help="test cases of the problem")
+    parser.add_argument("--languages", default="python,C++", help="comma separated, used in turn")
+    parser.add_argument("--workers", type=int, default=judge_scheduler.workers, help="judge workers")
+    parser.add_argument("--users", type=int, default=8, help="users the submissions are spread over")
+    parser.add_argument("--identical", action="store_true", help="submit the same source every time")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for all verdicts")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    for language in args.languages.split(","):
+        if language not in SOURCES:
+            parser.error(f"unknown language '{language}', choose from {', '.join(SOURCES)}")
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import os
+import tempfile
+
+
 # secret_key for session middle ware
 SECRET_KEY = 'test_secret_key'
 
@@ -10,3 +14,103 @@ WINDOW_SECONDS = 60
 MAX_REQUESTS = 10
 
 API_BASE_URL = "http://127.0.0.1:8000/api"
+
+
+# Database
+DATABASE_URL = "sqlite+aiosqlite:///./app.db"
+# Set on every new SQLite connection. WAL lets readers run while the judge writes;
+# synchronous=NORMAL is safe with WAL (a crash loses at most the last commits, never
+# consistency). cache_size < 0 is in KB.
+DB_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+# Connections kept open, and extra ones opened under load. Sized for the judge
+# workers and result writer plus concurrent API requests, all reading at once.
+DB_POOL_SIZE = 20
+DB_MAX_OVERFLOW = 20
+# Fraction of SQL statements printed with their duration, for debugging (0: off).
+DB_SQL_LOG_SAMPLE_RATE = 0.0
+
+
+# Judge scheduler
+# Number of submissions judged concurrently in the API process.
+JUDGE_WORKERS = os.cpu_count() or 1
+# Max submission ids buffered in memory; the rest stay pending in db until a slot frees up.
+JUDGE_QUEUE_SIZE = 1000
+# Seconds between rescans of pending submissions in db.
+JUDGE_POLL_INTERVAL = 5.0
+# "inline": the API process judges submissions itself.
+# "external": the API only queues submissions, judging is done by `python -m app.judge_worker`.
+JUDGE_MODE = "inline"
+# Rescan interval of standalone judge workers, they are not notified of new submissions.
+JUDGE_WORKER_POLL_INTERVAL = 0.5
+# Seconds after which a claim of a crashed worker may be taken over.
+JUDGE_CLAIM_TIMEOUT = 600
+# Test cases of one submission run at once, unless set per problem.
+JUDGE_CASE_PARALLELISM = 1
+# Upper bound of per-problem case parallelism.
+JUDGE_MAX_CASE_PARALLELISM = os.cpu_count() or 1
+# Time limit is on CPU time; a case is also killed after this many times the limit in wall time.
+JUDGE_WALL_TIME_FACTOR = 3.0
+# RLIMIT_AS of a case is this many times its memory limit: address space is larger
+# than resident memory, MLE is decided on peak RSS.
+JUDGE_ADDRESS_SPACE_FACTOR = 2.0
+# Run Python submissions in forks of a warm interpreter instead of starting `python` per case.
+JUDGE_PYTHON_ZYGOTE = True
+# Bytes of stdout a case may write; more is "OLE" (output limit exceeded).
+JUDGE_OUTPUT_LIMIT = 64 * 1024 * 1024
+# User and group ids judged programs run as, so they can't reach the judge's files
+# (checker, expected and saved outputs) or processes. Only applied when the judge
+# runs as root; interpreters and libraries of the languages must be readable by them.
+# None: judged programs run as the judge's own user.
+JUDGE_RUN_UID = 65534
+JUDGE_RUN_GID = 65534
+# Limits of special judge checkers, per case (seconds, MB).
+JUDGE_CHECKER_TIME_LIMIT = 10.0
+JUDGE_CHECKER_MEMORY_LIMIT = 512
+# Pin each running case to a core of its own.
+JUDGE_CPU_AFFINITY = True
+# Cores (the first ones) judged processes never run on, left for the API and compilers.
+# If no core is left, cases are not pinned.
+JUDGE_RESERVED_CORES = 1
+# Seconds a process keeps registered languages before reading them again from db,
+# so judge workers see languages re-registered (or reset) by the API process.
+JUDGE_LANGUAGE_RELOAD_INTERVAL = 5.0
+# Judge results finished within this many seconds are written to db in one transaction
+JUDGE_RESULT_WRITE_WINDOW = 0.05
+# At most this many results per transaction
+JUDGE_RESULT_BATCH_SIZE = 100
+
+
+# Test case data
+# Inputs and outputs of test cases, as files named by sha256 under one directory per problem.
+PROBLEM_DATA_PATH = "data/problems"
+
+
+# Judge workspaces
+# Per-run directories for sources, binaries and outputs; on tmpfs where available.
+JUDGE_WORKSPACE_PATH = "/dev/shm/judge" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "judge")
+
+
+# Compile cache
+# Compiled binaries and compile errors, keyed by hash of source and compile command.
+COMPILE_CACHE_PATH = "data/compile_cache"
+# Least recently used entries are evicted above this size.
+COMPILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Seconds a compile may take; slower ones are killed, the submission gets a CE that is not cached.
+COMPILE_TIMEOUT = 60.0
+# C++ headers precompiled (once per compiler and flags) for sources including one of them first.
+CPP_PCH_HEADERS = ["bits/stdc++.h"]
+# Run C++ compiles through ccache, if it is installed.
+CPP_CCACHE = True
+
+
+# Verdict cache
+# Results of judged code, keyed by source, language, judge settings and test cases.
+# Least recently used entries are evicted above this number.
+VERDICT_CACHE_MAX_ENTRIES = 100000
@@ -0,0 +1,119 @@
+import sqlite3
+import uuid
+from fastapi.testclient import TestClient
+from sqlalchemy import literal_column
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import make_url
+from sqlmodel import select
+from app.main import app
+from app.db.crud import page_statement, encode_cursor
+from app.db.schemas import SubmissionItem, LogAccess
+from config.settings import DATABASE_URL
+from test_helpers import setup_admin_session, create_test_user
+
+
+def test_database_wal(client):
+    """The db runs in WAL mode, so readers are not blocked by judge writes"""
+    response = client.get("/api/problems/")
+    assert response.status_code in (200, 401)
+
+    connection = sqlite3.connect(make_url(DATABASE_URL).database)
+    try:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        connection.close()
+
+
+def test_database_migration():
+    """Columns and indexes missing from an existing db are added on startup"""
+    path = make_url(DATABASE_URL).database
+    with TestClient(app):
+        pass
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("DROP INDEX ix_submission_status")
+        connection.execute("ALTER TABLE judgeconfig DROP COLUMN verdict_cache")
+        connection.commit()
+    finally:
+        connection.close()
+
+    with TestClient(app):
+        pass
+
+    connection = sqlite3.connect(path)
+    try:
+        indexes = [row[1] for row in connection.execute("PRAGMA index_list(submissionitem)")]
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(judgeconfig)")]
+    finally:
+        connection.close()
+    assert "ix_submission_status" in indexes
+    assert "verdict_cache" in columns
+
+
+def test_database_counters():
+    """List totals come from counters, recounted on startup if a trigger was missing"""
+    path = make_url(DATABASE_URL).database
+    with TestClient(app) as client:
+        setup_admin_session(client)
+        total = client.get("/api/users/").json()["data"]["total"]
+        create_test_user(client)
+        assert client.get("/api/users/").json()["data"]["total"] == total + 1
+
+    # A user added while the counter was not kept
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("DROP TRIGGER rowcount_useritem_insert")
+        connection.execute(
+            "INSERT INTO useritem (id, username, hashed_password, role, join_time, submit_count, resolve_count) "
+            "SELECT ?, ?, hashed_password, role, join_time, 0, 0 FROM useritem LIMIT 1",
+            (str(uuid.uuid4()), "counter_" + uuid.uuid4().hex[:8])
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+    with TestClient(app) as client:
+        setup_admin_session(client)
+        assert client.get("/api/users/").json()["data"]["total"] == total + 2
+
+    connection = sqlite3.connect(path)
+    try:
+        triggers = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+        counted = connection.execute("SELECT SUM(count) FROM submissioncount").fetchone()[0] or 0
+        submissions = connection.execute("SELECT COUNT(*) FROM submissionitem").fetchone()[0]
+    finally:
+        connection.close()
+    assert "rowcount_useritem_insert" in triggers
+    assert counted == submissions
+
+
+def test_page_query_plans():
+    """Pages after a cursor, with any list filter, seek an index instead of sorting"""
+    with TestClient(app):
+        pass
+    rowid = literal_column("submissionitem.rowid")
+    filters = {
+        "user_id": SubmissionItem.user_id, "problem_id": SubmissionItem.problem_id,
+        "status": SubmissionItem.status,
+    }
+    statements = []
+    for mask in range(1, 8):
+        statement = select(SubmissionItem.id, rowid)
+        for i, column in enumerate(filters.values()):
+            if mask & (1 << i):
+                statement = statement.where(column == "x")
+        statements.append(page_statement(statement, rowid, None, 20, encode_cursor(5)))
+    for column in (LogAccess.user_id, LogAccess.problem_id):
+        statement = select(LogAccess).where(column == "x")
+        statements.append(page_statement(statement, LogAccess.id, None, 20, encode_cursor(5)))
+
+    connection = sqlite3.connect(make_url(DATABASE_URL).database)
+    try:
+        for statement in statements:
+            sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+            plan = " ".join(row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            assert "TEMP B-TREE" not in plan, sql
+            assert "rowid>" in plan.replace(" ", ""), plan
+    finally:
+        connection.close()
@@ -0,0 +1,893 @@
+import asyncio
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+import time
+import pytest
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import update
+from config.settings import DATABASE_URL, JUDGE_CLAIM_TIMEOUT, JUDGE_WORKSPACE_PATH
+from app.core.workspace import PRIVATE_ROOT
+from app.core.evaluation import FairQueue
+from app.core.cpu_pool import CorePool
+from app.core.result_writer import ResultWriter
+from app.db.database import get_async_session
+from app.db.schemas import JudgeClaim, JudgePriority, SubmissionItem, SubmissionStatus
+from test_helpers import setup_admin_session, setup_user_session, create_test_user, create_test_problem
+from app.core import compile_cache, evaluation, security, testcase_store
+
+
+@pytest.fixture(autouse=True)
+def clear_rate_limit():
+    """Judge tests submit a lot, don't let them hit the submission rate limit"""
+    security.request_timestamps.clear()
+    yield
+    security.request_timestamps.clear()
+
+
+def wait_for_result(client, submission_id, timeout=10):
+    """Poll submission result until it is judged, return its data"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = client.get(f"/api/submissions/{submission_id}")
+        if response.json()["data"]["score"] is not None:
+            return response.json()["data"]
+        time.sleep(0.2)
+    raise AssertionError(f"Submission {submission_id} was not judged in {timeout}s")
+
+
+def test_burst_submissions_all_judged(client):
+    """A burst larger than the worker pool is queued and fully judged"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    submission_ids = []
+    for _ in range(6):
+        response = client.post("/api/submissions/", json={
+            "problem_id": problem_id,
+            "language": "python",
+            "code": "a, b = map(int, input().split())\nprint(a + b)"
+        })
+        assert response.status_code == 200
+        assert response.json()["data"]["status"] == "pending"
+        submission_ids.append(response.json()["data"]["submission_id"])
+
+    for submission_id in submission_ids:
+        result = wait_for_result(client, submission_id)
+        assert result["score"] == 10
+        assert result["counts"] == 10
+
+
+def test_rejudge_requeues_submission(client):
+    """Rejudge puts submission back to pending and judges it again"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, user_id = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "a, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    assert wait_for_result(client, submission_id)["score"] == 10
+
+    setup_admin_session(client)
+    response = client.put(f"/api/submissions/{submission_id}/rejudge")
+    assert response.status_code == 200
+    assert wait_for_result(client, submission_id)["score"] == 10
+
+
+def test_bulk_rejudge(client):
+    """Bulk rejudge judges identical sources once and reports progress"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    codes = ["a, b = map(int, input().split())\nprint(a + b)"] * 3 + ["print(0)"]
+    submission_ids = []
+    for code in codes:
+        response = client.post("/api/submissions/", json={
+            "problem_id": problem_id,
+            "language": "python",
+            "code": code
+        })
+        submission_ids.append(response.json()["data"]["submission_id"])
+    for submission_id in submission_ids:
+        wait_for_result(client, submission_id)
+
+    response = client.post("/api/submissions/rejudge", json={"problem_id": problem_id})
+    assert response.status_code == 403
+
+    setup_admin_session(client)
+    response = client.post("/api/submissions/rejudge", json={})
+    assert response.status_code == 400
+
+    response = client.post("/api/submissions/rejudge", json={"problem_id": problem_id})
+    assert response.status_code == 200
+    job = response.json()["data"]
+    assert job["total"] == 4
+    assert job["duplicates"] == 2
+
+    deadline = time.time() + 15
+    while True:
+        progress = client.get(f"/api/submissions/rejudge/{job['job_id']}").json()["data"]
+        if progress["done"] or time.time() > deadline:
+            break
+        time.sleep(0.2)
+    assert progress["finished"] == 4
+    assert progress["pending"] == 0
+
+    scores = [wait_for_result(client, submission_id)["score"] for submission_id in submission_ids]
+    assert scores == [10, 10, 10, 0]
+    log = client.get(f"/api/submissions/{submission_ids[2]}/log").json()["data"]
+    assert log["details"][0]["result"] == "AC"
+
+    response = client.get("/api/submissions/rejudge/no_such_job")
+    assert response.status_code == 404
+
+
+def test_bulk_rejudge_duplicates_not_resolved(client, monkeypatch):
+    """Duplicates are judged themselves when their result can't be copied to them"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    submission_ids = []
+    for _ in range(3):
+        response = client.post("/api/submissions/", json={
+            "problem_id": problem_id,
+            "language": "python",
+            "code": "a, b = map(int, input().split())\nprint(a + b)"
+        })
+        submission_ids.append(response.json()["data"]["submission_id"])
+    for submission_id in submission_ids:
+        wait_for_result(client, submission_id)
+
+    async def fail_resolve(submission_id, session):
+        raise SQLAlchemyError("database is locked")
+    monkeypatch.setattr(evaluation, "resolve_duplicates", fail_resolve)
+
+    setup_admin_session(client)
+    response = client.post("/api/submissions/rejudge", json={"problem_id": problem_id})
+    job = response.json()["data"]
+    assert job["duplicates"] == 2
+
+    # Picked up by the next scan of pending submissions
+    deadline = time.time() + 20
+    while True:
+        progress = client.get(f"/api/submissions/rejudge/{job['job_id']}").json()["data"]
+        if progress["done"] or time.time() > deadline:
+            break
+        time.sleep(0.2)
+    assert progress["pending"] == 0
+    assert [wait_for_result(client, submission_id)["score"] for submission_id in submission_ids] == [10, 10, 10]
+
+
+def test_unsupported_language_marked_error(client):
+    """Submissions that can't be judged leave the queue as error"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, user_id = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "brainfuck",
+        "code": "+."
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    assert wait_for_result(client, submission_id)["score"] == 0
+
+    response = client.get(f"/api/submissions/?user_id={user_id}&status=error")
+    assert response.status_code == 200
+    ids = [s["submission_id"] for s in response.json()["data"]["submissions"]]
+    assert submission_id in ids
+
+
+CPP_SOLUTION = """#include <iostream>
+int main() { long long a, b; std::cin >> a >> b; std::cout << a + b << std::endl; }
+"""
+
+
+def test_cpp_identical_sources(client):
+    """Identical C++ sources are judged correctly (second one from compile cache)"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    submission_ids = []
+    for _ in range(2):
+        response = client.post("/api/submissions/", json={
+            "problem_id": problem_id,
+            "language": "C++",
+            "code": CPP_SOLUTION
+        })
+        submission_ids.append(response.json()["data"]["submission_id"])
+
+    for submission_id in submission_ids:
+        assert wait_for_result(client, submission_id, timeout=30)["score"] == 10
+
+
+def test_cpp_compile_error(client):
+    """Compile errors give CE and zero score, also when rejudged"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "C++",
+        "code": "int main() { return undefined_name; }"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    assert wait_for_result(client, submission_id, timeout=30)["score"] == 0
+
+    setup_admin_session(client)
+    client.put(f"/api/submissions/{submission_id}/rejudge")
+    assert wait_for_result(client, submission_id, timeout=30)["score"] == 0
+
+    response = client.get(f"/api/submissions/{submission_id}/log")
+    assert response.json()["data"]["details"][0]["result"] == "CE"
+
+
+def create_multi_case_problem(client, cases, time_limit=1.0, memory_limit=128):
+    """Add an a+b problem with given number of test cases, return its id"""
+    problem_id = "test_multi_" + uuid.uuid4().hex[:8]
+    testcases = [{"input": f"{i} {i}\n", "output": f"{2 * i}\n"} for i in range(cases)]
+    response = client.post("/api/problems/", json={
+        "id": problem_id,
+        "title": "多测例",
+        "description": "计算a+b",
+        "input_description": "两个整数",
+        "output_description": "它们的和",
+        "samples": testcases[:1],
+        "constraints": "",
+        "testcases": testcases,
+        "time_limit": time_limit,
+        "memory_limit": memory_limit
+    })
+    assert response.status_code == 200
+    return problem_id
+
+
+def submit_and_get_log(client, problem_id, code, language="python", timeout=20):
+    """Submit as a new user, wait for judging and return the log as admin"""
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": language,
+        "code": code
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    wait_for_result(client, submission_id, timeout=timeout)
+
+    setup_admin_session(client)
+    return client.get(f"/api/submissions/{submission_id}/log").json()["data"]
+
+
+def test_parallel_cases(client):
+    """Cases run concurrently when enabled for the problem, results keep case order"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 8)
+    client.put(f"/api/problems/{problem_id}/judge_config", json={"case_parallelism": 4})
+
+    log = submit_and_get_log(client, problem_id, "a, b = map(int, input().split())\nprint(a + b)")
+    assert log["score"] == 80
+    assert [case["id"] for case in log["details"]] == list(range(1, 9))
+    assert all(case["result"] == "AC" for case in log["details"])
+
+
+def test_incremental_rejudge(client):
+    """Rejudge after adding a test case only runs the new case, unless full"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 2)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "a, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    wait_for_result(client, submission_id)
+
+    setup_admin_session(client)
+    before = client.get(f"/api/submissions/{submission_id}/log").json()["data"]["details"]
+    response = client.put(f"/api/problems/{problem_id}/testcases", json={"testcases": [
+        {"input": "0 0\n", "output": "0\n"},
+        {"input": "1 1\n", "output": "2\n"},
+        {"input": "5 5\n", "output": "11\n"},
+    ]})
+    assert response.status_code == 200
+    assert response.json()["data"]["testcases"] == 3
+
+    client.put(f"/api/submissions/{submission_id}/rejudge")
+    result = wait_for_result(client, submission_id)
+    assert result["score"] == 20
+    assert result["counts"] == 30
+    after = client.get(f"/api/submissions/{submission_id}/log").json()["data"]["details"]
+    # Unchanged cases keep their result, measurements included
+    assert after[:2] == before
+    assert after[2]["result"] == "WA"
+    assert len({case["testcase_hash"] for case in after}) == 3
+
+    client.put(f"/api/submissions/{submission_id}/rejudge", params={"full": True})
+    assert wait_for_result(client, submission_id)["score"] == 20
+
+
+def test_rejudge_while_judging(client):
+    """A rejudge asked for while the submission is judged is not overwritten by that run"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "import time\ntime.sleep(1.5)\na, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    # Judging by now
+    time.sleep(0.5)
+
+    setup_admin_session(client)
+    client.put(f"/api/problems/{problem_id}/testcases", json={"testcases": [
+        {"input": "1 1\n", "output": "3\n"},
+    ]})
+    client.put(f"/api/submissions/{submission_id}/rejudge", params={"full": True})
+    time.sleep(1.5)
+    result = wait_for_result(client, submission_id)
+    assert result["score"] == 0
+    log = client.get(f"/api/submissions/{submission_id}/log").json()["data"]
+    assert log["details"][0]["result"] == "WA"
+
+
+def test_testcase_update_while_judging(client):
+    """Files of old test cases stay until the submission judged on them is done"""
+    setup_admin_session(client)
+    # The second case opens its files after the update
+    problem_id = create_multi_case_problem(client, 2, time_limit=3.0)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "import time\ntime.sleep(1.5)\na, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    # Judging by now
+    time.sleep(0.5)
+
+    setup_admin_session(client)
+    response = client.put(f"/api/problems/{problem_id}/testcases", json={"testcases": [
+        {"input": "2 2\n", "output": "4\n"},
+    ]})
+    assert response.status_code == 200
+    result = wait_for_result(client, submission_id)
+    assert result["score"] == 20
+    log = client.get(f"/api/submissions/{submission_id}/log").json()["data"]
+    assert [case["result"] for case in log["details"]] == ["AC", "AC"]
+
+    # Nothing judged any more, the next update removes unused files
+    client.put(f"/api/problems/{problem_id}/testcases", json={"testcases": [
+        {"input": "3 3\n", "output": "6\n"},
+    ]})
+    assert len(os.listdir(testcase_store.problem_dir(problem_id))) == 2
+
+
+def test_judge_claims(client):
+    """A submission claimed by another worker is skipped until the claim expires"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "a, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    wait_for_result(client, submission_id)
+
+    async def claim_and_judge():
+        async with get_async_session() as session:
+            assert await evaluation.claim_submission(submission_id, session)
+            # Held: a second claim fails
+            assert not await evaluation.claim_submission(submission_id, session)
+            await evaluation.release_submission(submission_id, session)
+
+            # Pending again, claimed by a worker elsewhere
+            await session.execute(
+                update(SubmissionItem).where(SubmissionItem.id == submission_id)
+                .values(status=SubmissionStatus.PENDING, score=None)
+            )
+            session.add(JudgeClaim(submission_id=submission_id, worker_id="elsewhere:1", claimed_at=time.time()))
+            await session.commit()
+        await evaluation.judge_submission(submission_id)
+        async with get_async_session() as session:
+            submission = await session.get(SubmissionItem, submission_id)
+            assert submission.status == SubmissionStatus.PENDING
+
+            # That worker stopped refreshing it: taken over
+            await session.execute(
+                update(JudgeClaim).where(JudgeClaim.submission_id == submission_id)
+                .values(claimed_at=time.time() - JUDGE_CLAIM_TIMEOUT - 1)
+            )
+            await session.commit()
+        await evaluation.judge_submission(submission_id)
+
+    client.portal.call(claim_and_judge)
+    assert wait_for_result(client, submission_id)["score"] == 10
+
+
+def test_claim_refreshed_while_judging(client, monkeypatch):
+    """A long judge run keeps its claim fresh, so no other worker takes it over"""
+    monkeypatch.setattr(evaluation, "CLAIM_HEARTBEAT_INTERVAL", 0.2)
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1, time_limit=3.0)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "import time\ntime.sleep(1.5)\na, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+
+    def claimed_at():
+        connection = sqlite3.connect(make_url(DATABASE_URL).database)
+        try:
+            row = connection.execute(
+                "SELECT claimed_at FROM judgeclaim WHERE submission_id = ?", (submission_id,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+
+    time.sleep(0.5)
+    first = claimed_at()
+    time.sleep(0.6)
+    assert first is not None and claimed_at() > first
+    assert wait_for_result(client, submission_id)["score"] == 10
+    assert claimed_at() is None
+
+
+def test_judge_worker_starts():
+    """The standalone worker starts, and stops on interrupt"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.judge_worker", "--processes", "1", "--workers", "1"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"}
+    )
+    try:
+        output = []
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            line = process.stdout.readline()
+            if not line:
+                break
+            output.append(line)
+            if "Judge worker started" in line:
+                break
+        assert "Judge worker started with 1 slot(s).\n" in output, "".join(output)
+        process.send_signal(signal.SIGINT)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def test_resolve_count(client):
+    """A problem counts once however often it is solved, and no more once a rejudge fails it"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 2)
+    username, password, user_id = create_test_user(client)
+    setup_user_session(client, username, password)
+    submission_ids = []
+    for code in ["print(0)", "a, b = map(int, input().split())\nprint(a + b)", "print(sum(map(int, input().split())))"]:
+        response = client.post("/api/submissions/", json={
+            "problem_id": problem_id,
+            "language": "python",
+            "code": code
+        })
+        submission_ids.append(response.json()["data"]["submission_id"])
+    for submission_id in submission_ids:
+        wait_for_result(client, submission_id)
+
+    setup_admin_session(client)
+    assert client.get(f"/api/users/{user_id}").json()["data"]["resolve_count"] == 1
+    users = client.get("/api/users/").json()["data"]["users"]
+    assert next(user for user in users if user["user_id"] == user_id)["resolve_count"] == 1
+
+    # Neither solution passes the new case
+    client.put(f"/api/problems/{problem_id}/testcases", json={"testcases": [
+        {"input": "1 1\n", "output": "3\n"},
+    ]})
+    for submission_id in submission_ids[1:]:
+        client.put(f"/api/submissions/{submission_id}/rejudge")
+        wait_for_result(client, submission_id)
+    assert client.get(f"/api/users/{user_id}").json()["data"]["resolve_count"] == 0
+
+
+def test_result_writer_skips_deleted(client):
+    """A result of a submission deleted while judged does not fail the rest of its batch"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1)
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/submissions/", json={
+        "problem_id": problem_id,
+        "language": "python",
+        "code": "a, b = map(int, input().split())\nprint(a + b)"
+    })
+    submission_id = response.json()["data"]["submission_id"]
+    assert wait_for_result(client, submission_id)["score"] == 10
+
+    async def write_batch():
+        writer = ResultWriter(window=0.1)
+        await writer.start()
+        try:
+            await asyncio.gather(*[
+                writer.write({
+                    "submission_id": written_id, "status": "success", "score": 0, "counts": 10,
+                    "details": [{"id": 1, "result": "WA", "time": 0.0, "memory": 0}], "judge_hash": None,
+                })
+                for written_id in ["deleted_" + uuid.uuid4().hex, submission_id]
+            ])
+        finally:
+            await writer.stop()
+
+    client.portal.call(write_batch)
+    assert wait_for_result(client, submission_id)["score"] == 0
+
+
+def test_verdict_cache(client):
+    """Resubmitted identical code takes the cached result, unless the problem turns it off"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 2)
+    code = f"# {uuid.uuid4().hex}\na, b = map(int, input().split())\nprint(a + b)\n"
+
+    first = submit_and_get_log(client, problem_id, code)
+    hits = client.get("/api/judge/stats").json()["data"]["verdict_cache"]["hits"]
+
+    # Same code, other line endings
+    second = submit_and_get_log(client, problem_id, code.replace("\n", "\r\n") + "\r\n")
+    assert second == first
+    assert client.get("/api/judge/stats").json()["data"]["verdict_cache"]["hits"] == hits + 1
+
+    client.put(f"/api/problems/{problem_id}/judge_config", json={"verdict_cache": False})
+    third = submit_and_get_log(client, problem_id, code)
+    assert third["score"] == 20
+    assert client.get("/api/judge/stats").json()["data"]["verdict_cache"]["hits"] == hits + 1
+
+
+def test_wall_time(client):
+    """Cases report CPU time and wall time, limits apply to CPU time"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1, time_limit=0.2)
+    code = "import time\ntime.sleep(0.3)\na, b = map(int, input().split())\nprint(a + b)"
+
+    case = submit_and_get_log(client, problem_id, code)["details"][0]
+    assert case["result"] == "AC"
+    assert case["wall_time"] >= 0.3
+    assert case["time"] < 0.2
+
+
+def test_workspace_cleaned(client):
+    """Programs run in a per-submission workspace, which is removed after judging"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 2)
+    code = "open('scratch.txt', 'w').write('x')\na, b = map(int, input().split())\nprint(a + b)"
+
+    log = submit_and_get_log(client, problem_id, code)
+    assert log["score"] == 20
+    assert not os.path.exists("scratch.txt")
+
+    # Removed right after the result is written
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        workspaces = os.listdir(JUDGE_WORKSPACE_PATH) if os.path.isdir(JUDGE_WORKSPACE_PATH) else []
+        if not any(name.startswith(f"{os.getpid()}-") for name in workspaces):
+            break
+        time.sleep(0.1)
+    else:
+        raise AssertionError(f"Workspaces left in {JUDGE_WORKSPACE_PATH}: {workspaces}")
+
+
+def test_leftover_processes_killed(client):
+    """Processes a program started are killed once it exits"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1)
+    marker = os.path.join(tempfile.gettempdir(), f"leftover-{uuid.uuid4().hex}")
+    code = f"""import os, time
+if os.fork() == 0:
+    os.close(1)
+    os.close(2)
+    time.sleep(1)
+    open({marker!r}, "w").close()
+    os._exit(0)
+a, b = map(int, input().split())
+print(a + b)
+"""
+    log = submit_and_get_log(client, problem_id, code)
+    assert log["score"] == 10
+    time.sleep(1.5)
+    assert not os.path.exists(marker)
+
+
+def test_verdicts(client):
+    """TLE on CPU time, MLE on memory, RE on crash, WA on wrong output"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1)
+
+    log = submit_and_get_log(client, problem_id, "while True:\n    pass")
+    assert log["details"][0]["result"] == "TLE"
+    assert log["score"] == 0
+
+    # Above the memory limit, and above the address space limit
+    log = submit_and_get_log(client, problem_id, "a = bytearray(200 * 1024 * 1024)\nprint(len(a))")
+    assert log["details"][0]["result"] == "MLE"
+    log = submit_and_get_log(client, problem_id, "a = bytearray(1024 * 1024 * 1024)")
+    assert log["details"][0]["result"] == "MLE"
+
+    log = submit_and_get_log(client, problem_id, "raise ValueError()")
+    assert log["details"][0]["result"] == "RE"
+
+    log = submit_and_get_log(client, problem_id, "print(-1)")
+    assert log["details"][0]["result"] == "WA"
+
+
+def test_streamed_output_verdicts(client):
+    """Wrong output is WA without waiting for the program, endless output is OLE"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1, time_limit=2.0)
+
+    # Killed on the mismatch instead of running into the time limit
+    log = submit_and_get_log(client, problem_id, "print(-1, flush=True)\nwhile True:\n    pass")
+    assert log["details"][0]["result"] == "WA"
+
+    log = submit_and_get_log(client, problem_id, "import sys\nwhile True:\n    sys.stdout.write(' ' * 65536)")
+    assert log["details"][0]["result"] == "OLE"
+    assert log["score"] == 0
+
+
+def test_stop_on_failure(client):
+    """With stop_on_failure, cases after the first failed one are skipped"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 4)
+    response = client.put(f"/api/problems/{problem_id}/judge_config", json={"stop_on_failure": True})
+    assert response.status_code == 200
+
+    # Case 1 (0 + 0) passes, case 2 fails
+    log = submit_and_get_log(client, problem_id, "a, b = map(int, input().split())\nprint(a * 2 if a == 0 else -1)")
+    assert [case["result"] for case in log["details"]] == ["AC", "WA", "SKIP", "SKIP"]
+    assert log["score"] == 10
+
+    # Same code without stop_on_failure runs every case, not the cached result
+    client.put(f"/api/problems/{problem_id}/judge_config", json={"stop_on_failure": False})
+    log = submit_and_get_log(client, problem_id, "a, b = map(int, input().split())\nprint(a * 2 if a == 0 else -1)")
+    assert [case["result"] for case in log["details"]] == ["AC", "WA", "WA", "WA"]
+
+
+FLOAT_CHECKER = """#include <cstdio>
+#include <cmath>
+int main(int argc, char** argv) {
+    FILE* expected = fopen(argv[2], "r");
+    FILE* actual = fopen(argv[3], "r");
+    double e, a;
+    if (fscanf(expected, "%lf", &e) != 1) return 3;
+    if (fscanf(actual, "%lf", &a) != 1) return 1;
+    return std::fabs(a - e) <= 1e-3 ? 0 : 1;
+}
+"""
+
+
+# Replaces every checker it can find with one accepting anything
+CHECKER_EXPLOIT = """import os
+def plant(path):
+    try:
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\\nexit 0\\n")
+        os.chmod(path, 0o755)
+    except OSError:
+        pass
+plant("checker.exe")
+try:
+    os.chmod("{private_root}", 0o777)
+except OSError:
+    pass
+try:
+    for name in os.listdir("{private_root}"):
+        plant(os.path.join("{private_root}", name, "checker.exe"))
+except OSError:
+    pass
+print("wrong")
+"""
+
+
+def test_special_judge_checker(client):
+    """A problem checker decides on outputs, checkers that don't compile are rejected"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 3)
+
+    response = client.put(f"/api/problems/{problem_id}/judge_config", json={"checker": "int main() {"})
+    assert response.status_code == 400
+
+    response = client.put(f"/api/problems/{problem_id}/judge_config", json={"checker": FLOAT_CHECKER})
+    assert response.status_code == 200
+
+    # Within tolerance but not equal to expected output
+    log = submit_and_get_log(client, problem_id, "a, b = map(int, input().split())\nprint(a + b + 0.0001)", timeout=30)
+    assert [case["result"] for case in log["details"]] == ["AC", "AC", "AC"]
+
+    log = submit_and_get_log(client, problem_id, "a, b = map(int, input().split())\nprint(a + b + 1)", timeout=30)
+    assert [case["result"] for case in log["details"]] == ["WA", "WA", "WA"]
+
+    # The checker is out of the program's reach, whether next to it or in the private directory
+    log = submit_and_get_log(client, problem_id, CHECKER_EXPLOIT.format(private_root=PRIVATE_ROOT), timeout=30)
+    assert [case["result"] for case in log["details"]] == ["WA", "WA", "WA"]
+
+
+def test_registered_languages_judged(client):
+    """Languages registered through the API are built and run from their commands"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 2)
+    suffix = uuid.uuid4().hex[:6]
+
+    response = client.post("/api/languages/", json={
+        "name": f"sh_{suffix}",
+        "file_ext": ".sh",
+        "run_cmd": "sh {src}"
+    })
+    assert response.status_code == 200
+    response = client.post("/api/languages/", json={
+        "name": f"cpp_o2_{suffix}",
+        "file_ext": ".cpp",
+        "compile_cmd": "g++ -O2 main.cpp -o main",
+        "run_cmd": "./main",
+        "time_factor": 2.0
+    })
+    assert response.status_code == 200
+
+    log = submit_and_get_log(client, problem_id, "read a b\necho $((a + b))", language=f"sh_{suffix}")
+    assert log["score"] == 20
+
+    log = submit_and_get_log(client, problem_id, CPP_SOLUTION, language=f"cpp_o2_{suffix}", timeout=30)
+    assert log["score"] == 20
+
+
+def test_compile_failures_not_cached(client, monkeypatch):
+    """Compilers killed or out of time don't leave a cached CE, the next compile runs again"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1)
+    suffix = uuid.uuid4().hex[:6]
+    for name, compile_cmd in (("killed", "sh -c 'kill -9 $$'"), ("slow", "sleep 30")):
+        response = client.post("/api/languages/", json={
+            "name": f"{name}_{suffix}",
+            "file_ext": ".c",
+            "compile_cmd": compile_cmd,
+            "run_cmd": "./main"
+        })
+        assert response.status_code == 200
+    monkeypatch.setattr(compile_cache, "COMPILE_TIMEOUT", 0.5)
+
+    for name in ("killed", "slow"):
+        for _ in range(2):
+            misses = compile_cache.compile_cache_stats["misses"]
+            start = time.time()
+            log = submit_and_get_log(client, problem_id, "int main() {}", language=f"{name}_{suffix}")
+            assert time.time() - start < 10
+            assert compile_cache.compile_cache_stats["misses"] == misses + 1
+        if name == "slow":
+            assert log["details"][0]["result"] == "CE"
+
+
+def test_cpp_precompiled_header(client):
+    """bits/stdc++.h gets precompiled, later compiles use it and it shows in judge stats"""
+    setup_admin_session(client)
+    problem_id = create_multi_case_problem(client, 1)
+    source = "#include <bits/stdc++.h>\nint main() {{ long long a, b; std::cin >> a >> b; std::cout << a + b{} << std::endl; }}\n"
+
+    log = submit_and_get_log(client, problem_id, source.format(""), language="C++", timeout=30)
+    assert log["score"] == 10
+
+    # Header is precompiled in the background
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        stats = client.get("/api/judge/stats").json()["data"]
+        if stats["cpp_accel"]["pch_builds"] >= 1:
+            break
+        time.sleep(0.5)
+    else:
+        raise AssertionError("Header was not precompiled")
+    pch_compiles = stats["cpp_accel"]["pch_compiles"]
+
+    # A different source, so compile cache misses
+    log = submit_and_get_log(client, problem_id, source.format(" + 0"), language="C++", timeout=30)
+    assert log["score"] == 10
+    stats = client.get("/api/judge/stats").json()["data"]
+    assert stats["cpp_accel"]["pch_compiles"] == pch_compiles + 1
+    assert stats["compile_cache"]["misses"] >= 2
+
+    # Admin only
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    assert client.get("/api/judge/stats").status_code == 403
+
+
+def test_fair_queue_order():
+    """Fresh submissions go before rejudges and imports, users take turns inside a class"""
+    async def drain():
+        queue = FairQueue(maxsize=10)
+        for i in range(3):
+            queue.put_nowait(f"a{i}", "alice", JudgePriority.SUBMIT)
+        queue.put_nowait("i0", "dave", JudgePriority.IMPORT)
+        queue.put_nowait("r0", "carol", JudgePriority.REJUDGE)
+        queue.put_nowait("b0", "bob", JudgePriority.SUBMIT)
+        return [await queue.get() for _ in range(6)]
+
+    assert asyncio.run(drain()) == ["a0", "b0", "a1", "a2", "r0", "i0"]
+
+
+def test_fair_queue_full():
+    """A full queue makes room for urgent submissions by dropping the newest less urgent one"""
+    queue = FairQueue(maxsize=2)
+    queue.put_nowait("r0", "carol", JudgePriority.REJUDGE)
+    queue.put_nowait("r1", "carol", JudgePriority.REJUDGE)
+    assert queue.put_nowait("s0", "alice", JudgePriority.SUBMIT) == "r1"
+    assert queue.qsize() == 2
+
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait("i0", "dave", JudgePriority.IMPORT)
+
+
+def test_core_pool():
+    """Each core is held by one case at a time, others wait for it"""
+    pool = CorePool([2, 3])
+    assert pool.acquire() == 2
+    assert pool.acquire() == 3
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.2)
+    assert acquired == []
+    pool.release(3)
+    waiter.join(1)
+    assert acquired == [3]
+
+    # No cores: nothing is pinned
+    assert CorePool([]).acquire() is None
+
+
+def test_core_pool_shared(tmp_path):
+    """Pools of different processes (same lock directory) don't hand out the same core"""
+    lock_dir = str(tmp_path / "cores")
+    pool, other = CorePool([2, 3], lock_dir), CorePool([2, 3], lock_dir)
+    assert pool.acquire() == 2
+    assert other.acquire() == 3
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(other.acquire()))
+    waiter.start()
+    waiter.join(0.2)
+    assert acquired == []
+    pool.release(2)
+    waiter.join(1)
+    assert acquired == [2]
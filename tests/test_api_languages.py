@@ -1,5 +1,7 @@
 import uuid
 import pytest
+from app.core.languages import Executor
+from app.db.schemas import LanguageItem
 from test_helpers import setup_admin_session, setup_user_session, reset_system, create_test_user
 
 
@@ -54,4 +56,59 @@ def test_get_supported_languages(client):
     assert "data" in data
     assert isinstance(data["data"], dict)
     assert "name" in data["data"]
-    assert isinstance(data["data"]["name"], list)
\ No newline at end of file
+    assert isinstance(data["data"]["name"], list)
+
+def test_register_language_invalid_command(client):
+    """Commands that can't be parsed are rejected"""
+    setup_admin_session(client)
+    response = client.post("/api/languages/", json={
+        "name": "broken",
+        "file_ext": ".x",
+        "run_cmd": "run 'unclosed"
+    })
+    assert response.status_code == 400
+
+
+def test_register_language_invalid_template(client):
+    """Placeholders other than {src}, {exe} and {dir}, and file_ext leaving the build directory, are rejected"""
+    setup_admin_session(client)
+    for language in (
+        {"file_ext": ".py", "run_cmd": "python {source}"},
+        {"file_ext": ".sh", "run_cmd": "bash -c 'f() { sh {src}; }; f'"},
+        {"file_ext": ".c", "compile_cmd": "gcc {src} -o {out}", "run_cmd": "{exe}"},
+        {"file_ext": "/../../x.sh", "run_cmd": "sh {src}"},
+        {"file_ext": "..sh", "run_cmd": "sh {src}"},
+    ):
+        response = client.post("/api/languages/", json={"name": "broken", **language})
+        assert response.status_code == 400
+
+    # Literal braces escaped
+    response = client.post("/api/languages/", json={
+        "name": f"bash_{uuid.uuid4().hex[:6]}",
+        "file_ext": ".sh",
+        "run_cmd": "bash -c 'f() {{ sh {src}; }}; f'"
+    })
+    assert response.status_code == 200
+
+
+def test_register_language_admin_only(client):
+    """Only admins register languages, their commands are run by the judge"""
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.post("/api/languages/", json={
+        "name": "python",
+        "file_ext": ".py",
+        "run_cmd": "echo 3"
+    })
+    assert response.status_code == 403
+
+
+def test_language_limit_factors():
+    """time_factor / memory_factor scale problem limits, fractions included"""
+    executor = Executor(LanguageItem(
+        name="pypy", file_ext=".py", run_cmd="pypy {src}", time_factor=2.5, memory_factor=1.5
+    ))
+    assert executor.limits(1.0, 128) == (2.5, 192)
+    # Absolute time_limit / memory_limit of a language are not factors
+    executor = Executor(LanguageItem(name="pypy", file_ext=".py", run_cmd="pypy {src}", memory_limit=256))
+    assert executor.limits(1.0, 128) == (1.0, 128)
@@ -190,4 +190,12 @@ def test_access_audit_logs(client):
     response = client.get(f"/api/logs/access/?problem_id={problem_id}")
     assert response.status_code == 200
     data = response.json()
-    assert data["code"] == 200
\ No newline at end of file
+    assert data["code"] == 200
+    # Test with a cursor
+    response = client.get("/api/logs/access/", params={"problem_id": problem_id, "page_size": 1, "cursor": ""})
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data["logs"]) == 1
+    response = client.get("/api/logs/access/", params={"problem_id": problem_id, "page_size": 1, "cursor": data["next_cursor"]})
+    assert response.status_code == 200
+    assert response.json()["data"]["logs"] == []
@@ -1,6 +1,8 @@
+import os
 import uuid
 
-from test_helpers import setup_user_session, reset_system, create_test_user, setup_admin_session
+from config.settings import PROBLEM_DATA_PATH
+from test_helpers import setup_user_session, reset_system, create_test_user, setup_admin_session, create_test_problem
 
 
 def test_get_problems_list(client):
@@ -156,3 +158,75 @@ def test_delete_problem(client):
     # Test non-existent problem
     response = client.delete("/api/problems/nonexistent")
     assert response.status_code == 404
+
+
+def test_testcases_stored_on_disk(client):
+    """Test cases are kept in files under PROBLEM_DATA_PATH, removed with the problem"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+    problem_dir = os.path.join(PROBLEM_DATA_PATH, problem_id)
+    # Input and output of the single test case
+    assert len(os.listdir(problem_dir)) == 2
+
+    response = client.get(f"/api/problems/{problem_id}")
+    assert response.json()["data"]["testcases"] == [{"input": "1 2\n", "output": "3\n"}]
+
+    client.delete(f"/api/problems/{problem_id}")
+    assert not os.path.exists(problem_dir)
+
+
+def test_problem_id_stays_in_data_dir(client):
+    """Problem ids that would put test cases outside PROBLEM_DATA_PATH are refused"""
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    for problem_id in ["../../victim", "/tmp/victim", ".."]:
+        response = client.post("/api/problems/", json={
+            "id": problem_id,
+            "title": "路径",
+            "description": "计算a+b",
+            "input_description": "两个整数",
+            "output_description": "它们的和",
+            "samples": [],
+            "constraints": "",
+            "testcases": [{"input": "1 2\n", "output": "3\n"}]
+        })
+        assert response.status_code == 400
+
+
+def test_judge_config(client):
+    """Test GET/PUT /api/problems/{problem_id}/judge_config"""
+    setup_admin_session(client)
+    problem_id, _ = create_test_problem(client)
+
+    # Defaults before anything is set
+    response = client.get(f"/api/problems/{problem_id}/judge_config")
+    assert response.status_code == 200
+    assert response.json()["data"]["case_parallelism"] is None
+    assert response.json()["data"]["stop_on_failure"] is False
+
+    response = client.put(f"/api/problems/{problem_id}/judge_config", json={"case_parallelism": 4})
+    assert response.status_code == 200
+    assert response.json()["msg"] == "judge config updated"
+    assert response.json()["data"]["case_parallelism"] == 4
+
+    response = client.get(f"/api/problems/{problem_id}/judge_config")
+    assert response.json()["data"]["case_parallelism"] == 4
+
+    # Partial update keeps other fields
+    response = client.put(f"/api/problems/{problem_id}/judge_config", json={"stop_on_failure": True})
+    assert response.json()["data"]["stop_on_failure"] is True
+    assert response.json()["data"]["case_parallelism"] == 4
+
+    # Invalid value
+    response = client.put(f"/api/problems/{problem_id}/judge_config", json={"case_parallelism": 0})
+    assert response.status_code == 400
+
+    # Non-existent problem
+    response = client.put("/api/problems/nonexistent/judge_config", json={"case_parallelism": 2})
+    assert response.status_code == 404
+
+    # Admin only
+    username, password, _ = create_test_user(client)
+    setup_user_session(client, username, password)
+    response = client.get(f"/api/problems/{problem_id}/judge_config")
+    assert response.status_code == 403
@@ -2,6 +2,7 @@ import uuid
 import time
 import pytest
 from test_helpers import setup_admin_session, setup_user_session
+from app.core import security
 
 
 def test_submit_solution(client):
@@ -160,6 +161,58 @@ def test_get_submissions_list(client):
     assert response.status_code == 400  # Should require user_id or problem_id
 
 
+def test_submissions_list_cursor(client):
+    """Test GET /api/submissions/ paged with cursors"""
+    setup_admin_session(client)
+    problem_id = "test_cursor_" + uuid.uuid4().hex[:4]
+    client.post("/api/problems/", json={
+        "id": problem_id,
+        "title": "游标分页",
+        "description": "计算a+b",
+        "input_description": "两个整数",
+        "output_description": "它们的和",
+        "samples": [{"input": "1 2\n", "output": "3\n"}],
+        "testcases": [{"input": "1 2\n", "output": "3\n"}],
+        "constraints": "|a|,|b| <= 10^9",
+        "time_limit": 1.0,
+        "memory_limit": 128
+    })
+    # More submissions than the rate limit allows
+    security.request_timestamps.clear()
+    submission_ids = []
+    for i in range(5):
+        response = client.post("/api/submissions/", json={
+            "problem_id": problem_id,
+            "language": "python",
+            "code": f"print({i})"
+        })
+        submission_ids.append(response.json()["data"]["submission_id"])
+    security.request_timestamps.clear()
+
+    # Pages follow each other in submission order
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get("/api/submissions/", params={
+            "problem_id": problem_id, "page_size": 2, "cursor": cursor
+        })
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["total"] == 5
+        seen += [submission["submission_id"] for submission in data["submissions"]]
+        cursor = data["next_cursor"]
+    assert seen == submission_ids
+
+    # Same order by page
+    response = client.get("/api/submissions/", params={"problem_id": problem_id, "page": 2, "page_size": 2})
+    assert [submission["submission_id"] for submission in response.json()["data"]["submissions"]] == submission_ids[2:4]
+
+    response = client.get("/api/submissions/", params={"problem_id": problem_id, "page_size": 2, "cursor": "x!"})
+    assert response.status_code == 400
+    response = client.get("/api/submissions/", params={"problem_id": problem_id, "page": 1, "page_size": 2, "cursor": ""})
+    assert response.status_code == 400
+
+
 def test_rejudge_submission(client):
     """Test PUT /api/submissions/{submission_id}/rejudge"""
     # Set up admin session
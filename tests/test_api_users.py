@@ -98,4 +98,23 @@ def test_get_users_list(client):
     assert "total" in data["data"]
     assert "users" in data["data"]
     assert isinstance(data["data"]["users"], list)
-    assert data["data"]["total"] >= 3
\ No newline at end of file
+    assert data["data"]["total"] >= 3
+
+
+def test_get_users_list_cursor(client):
+    """Test GET /api/users/ paged with cursors"""
+    reset_system(client)
+    setup_admin_session(client)
+    for i in range(4):
+        create_test_user(client)
+
+    usernames = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get("/api/users/", params={"page_size": 2, "cursor": cursor})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        usernames += [user["username"] for user in data["users"]]
+        cursor = data["next_cursor"]
+    assert len(usernames) == data["total"] >= 5
+    assert len(set(usernames)) == len(usernames)